@@ -16,6 +16,10 @@ Config = {
     "batch_size": 32,
     "epoch_data_size": 200,     #每轮训练中采样数量
     "positive_sample_rate":0.5,  #正样本比例
+    "negative_mining": "random",  #负样本选择方式："random"随机，"hard"batch内最难，"semi-hard"batch内半难
     "optimizer": "adam",
     "learning_rate": 1e-3,
+    "index_type": "brute",      #知识库检索方式："brute"暴力检索，"ivf"近似检索
+    "ivf_n_lists": 256,         #ivf的桶数量
+    "ivf_n_probe": 8,           #ivf每次查询探测的桶数量，越大召回越高、速度越慢
 }
\ No newline at end of file
@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 import torch
 from loader_triplet_loss import load_data
+from knwb_index import build_index
 
 """
 模型效果测试
@@ -23,32 +24,25 @@ class Evaluator:
     def knwb_to_vector(self):
         self.question_index_to_standard_question_index = {}
         self.question_ids = []
-        # 为了生成三元组，我们需要确保加载的每个问题对包含 anchor, positive 和 negative
         for standard_question_index, question_ids in self.train_data.dataset.knwb.items():
             for question_id in question_ids:
                 # 记录问题编号到标准问题标号的映射，用来确认答案是否正确
                 self.question_index_to_standard_question_index[len(self.question_ids)] = standard_question_index
                 self.question_ids.append(question_id)
+        # 索引返回的是问题编号，用张量保存映射关系，批量转换成标准问编号
+        self.standard_question_index = torch.LongTensor(
+            [self.question_index_to_standard_question_index[i] for i in range(len(self.question_ids))])
 
         with torch.no_grad():
-            # 为了生成三元组，问题集需要每三个句子一起形成三元组（anchor, positive, negative）
-            triplets = []  # 这个会存放每个三元组：三个句子构成一个三元组
-            for i in range(0, len(self.question_ids), 3):
-                if i + 2 < len(self.question_ids):  # 确保有三个问题
-                    triplet = [self.question_ids[i], self.question_ids[i + 1], self.question_ids[i + 2]]
-                    triplets.append(triplet)
-
-            # 将三元组转换为张量（假设每个三元组的句子 ID 已经是准备好的输入）
-            triplet_tensor = torch.stack([torch.stack(triplet) for triplet in triplets], dim=0)
-
-            # 如果使用 GPU，迁移数据到 GPU
+            question_matrixs = torch.stack(self.question_ids, dim=0)
             if torch.cuda.is_available():
-                triplet_tensor = triplet_tensor.cuda()
-
-            # 通过模型计算所有三元组的向量
-            self.knwb_vectors = self.model(triplet_tensor[:, 0], triplet_tensor[:, 1], triplet_tensor[:, 2])
+                question_matrixs = question_matrixs.cuda()
+                self.standard_question_index = self.standard_question_index.cuda()
+            # 只需要句子编码器把问题向量化，不需要计算三元组损失
+            self.knwb_vectors = self.model.sentence_encoder(question_matrixs)
             # 将所有向量进行归一化
             self.knwb_vectors = torch.nn.functional.normalize(self.knwb_vectors, dim=-1)
+            self.index = build_index(self.config, self.knwb_vectors)
         return
 
     def eval(self, epoch):
@@ -57,25 +51,12 @@ class Evaluator:
         self.model.eval()
         self.knwb_to_vector()
 
-        # 假设 valid_data 返回的数据是 (sentence1, sentence2, sentence3, labels)
         for index, batch_data in enumerate(self.valid_data):
             if torch.cuda.is_available():
                 batch_data = [d.cuda() for d in batch_data]
-
             input_id, labels = batch_data  # 输入变化时这里需要修改，比如多输入，多输出的情况
-
-            # 需要确保 input_id 是一个包含三个句子的三元组： (sentence1, sentence2, sentence3)
-            if len(input_id) != 3:
-                print(f"错误：batch_data 中的 input_id 不是三元组，而是： {input_id}")
-                continue  # 跳过当前 batch
-
-            # 解包三元组
-            sentence1, sentence2, sentence3 = input_id
-
-            # 使用模型进行预测（计算嵌入向量）
             with torch.no_grad():
-                test_question_vectors = self.model(sentence1, sentence2, sentence3)
-
+                test_question_vectors = self.model.sentence_encoder(input_id)
             # 计算预测结果并写入统计
             self.write_stats(test_question_vectors, labels)
 
@@ -94,17 +75,15 @@ class Evaluator:
         return
 
     def write_stats(self, test_question_vectors, labels):
+        test_question_vectors = test_question_vectors.view(len(labels), -1)
         assert len(labels) == len(test_question_vectors)
-        for test_question_vector, label in zip(test_question_vectors, labels):
-            # 通过一次矩阵乘法，计算输入问题和知识库中所有问题的相似度
-            # test_question_vector shape [vec_size]   knwb_vectors shape = [n, vec_size]
-            res = torch.mm(test_question_vector.unsqueeze(0), self.knwb_vectors.T)
-            hit_index = int(torch.argmax(res.squeeze()))  # 命中问题标号
-            hit_index = self.question_index_to_standard_question_index[hit_index]  # 转化成标准问编号
-            if int(hit_index) == int(label):
-                self.stats_dict["correct"] += 1
-            else:
-                self.stats_dict["wrong"] += 1
+        # 整个batch一次检索知识库，得到每个输入最相似的问题编号
+        test_question_vectors = torch.nn.functional.normalize(test_question_vectors, dim=-1)
+        _, hit_index = self.index.search(test_question_vectors, top_k=1)
+        hit_index = self.standard_question_index[hit_index[:, 0]]  # 转化成标准问编号
+        correct = int((hit_index == labels.view(-1)).sum())
+        self.stats_dict["correct"] += correct
+        self.stats_dict["wrong"] += len(labels) - correct
         return
 
     def show_stats(self):
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+
+import time
+import torch
+
+"""
+知识库向量检索索引
+BruteForceIndex：与所有向量做点积，结果精确
+IVFIndex：先用kmeans把向量分到若干个桶，查询时只计算最近的n_probe个桶，用少量召回损失换取速度
+"""
+
+
+# 把新一段的topk结果合并到已有的topk结果中
+def merge_topk(best_scores, best_ids, scores, ids, top_k):
+    scores = torch.cat([best_scores, scores], dim=-1)
+    ids = torch.cat([best_ids, ids], dim=-1)
+    scores, order = torch.topk(scores, min(top_k, scores.shape[-1]), dim=-1)
+    return scores, torch.gather(ids, -1, order)
+
+
+class BruteForceIndex:
+    def __init__(self):
+        self.vectors = None
+
+    # 传入的向量需要已经归一化，点积即为余弦相似度
+    def add(self, vectors):
+        self.vectors = vectors if self.vectors is None else torch.cat([self.vectors, vectors], dim=0)
+
+    def search(self, queries, top_k=1):
+        scores = torch.mm(queries, self.vectors.T)
+        return torch.topk(scores, min(top_k, self.vectors.shape[0]), dim=-1)
+
+
+class IVFIndex:
+    def __init__(self, n_lists=256, n_probe=8, n_iter=20):
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.n_iter = n_iter
+        self.centroids = None
+        # 向量按所属的桶连续存放，offsets[i]:offsets[i+1]为第i个桶的范围，ids记录原始编号
+        self.vectors = None
+        self.ids = None
+        self.offsets = None
+
+    # 在归一化向量上做球面kmeans，得到粗量化的质心
+    def train(self, vectors):
+        n_lists = min(self.n_lists, vectors.shape[0])
+        generator = torch.Generator().manual_seed(0)
+        init = torch.randperm(vectors.shape[0], generator=generator)[:n_lists].to(vectors.device)
+        centroids = vectors[init].clone()
+        for _ in range(self.n_iter):
+            assign = torch.argmax(torch.mm(vectors, centroids.T), dim=-1)
+            sums = torch.zeros_like(centroids).index_add_(0, assign, vectors)
+            counts = torch.bincount(assign, minlength=n_lists)
+            # 空桶保持原来的质心
+            non_empty = counts > 0
+            centroids[non_empty] = torch.nn.functional.normalize(sums[non_empty], dim=-1)
+        self.centroids = centroids
+
+    def add(self, vectors):
+        if self.centroids is None:
+            self.train(vectors)
+        all_vectors = vectors if self.vectors is None else torch.cat([self.vectors, vectors], dim=0)
+        all_ids = torch.arange(vectors.shape[0], device=vectors.device)
+        if self.ids is not None:
+            all_ids = torch.cat([self.ids, all_ids + self.ids.numel()], dim=0)
+        assign = torch.argmax(torch.mm(all_vectors, self.centroids.T), dim=-1)
+        order = torch.argsort(assign)
+        self.vectors = all_vectors[order]
+        self.ids = all_ids[order]
+        counts = torch.bincount(assign, minlength=self.centroids.shape[0])
+        self.offsets = torch.cat([counts.new_zeros(1), torch.cumsum(counts, dim=0)]).tolist()
+
+    def search(self, queries, top_k=1):
+        n_probe = min(self.n_probe, self.centroids.shape[0])
+        probe = torch.topk(torch.mm(queries, self.centroids.T), n_probe, dim=-1).indices
+        # 与BruteForceIndex一致，最多返回与知识库大小相同的结果数
+        top_k = min(top_k, self.vectors.shape[0])
+        best_scores = queries.new_full((queries.shape[0], top_k), float("-inf"))
+        best_ids = torch.full((queries.shape[0], top_k), -1, dtype=torch.long, device=queries.device)
+        # 按桶遍历，每个桶只和探测到它的那些查询做一次矩阵乘法
+        for list_id in torch.unique(probe).tolist():
+            start, end = self.offsets[list_id], self.offsets[list_id + 1]
+            if start == end:
+                continue
+            rows = (probe == list_id).any(dim=-1).nonzero(as_tuple=True)[0]
+            scores = torch.mm(queries[rows], self.vectors[start:end].T)
+            scores, local = torch.topk(scores, min(top_k, end - start), dim=-1)
+            ids = self.ids[start:end][local]
+            best_scores[rows], best_ids[rows] = merge_topk(best_scores[rows], best_ids[rows], scores, ids, top_k)
+        # 探测到的桶中候选不足top_k（桶为空或太小）的查询，退回到与所有向量比较，保证不返回-1
+        rows = (best_ids < 0).any(dim=-1).nonzero(as_tuple=True)[0]
+        if rows.numel() > 0:
+            scores, local = torch.topk(torch.mm(queries[rows], self.vectors.T), top_k, dim=-1)
+            best_scores[rows], best_ids[rows] = scores, self.ids[local]
+        return best_scores, best_ids
+
+
+# 根据配置创建索引并加入知识库向量
+def build_index(config, vectors):
+    if config.get("index_type", "brute") == "ivf":
+        index = IVFIndex(config.get("ivf_n_lists", 256), config.get("ivf_n_probe", 8))
+    else:
+        index = BruteForceIndex()
+    index.add(vectors)
+    return index
+
+
+# 对比索引与暴力检索：recall@k为索引返回结果中真实topk的比例，qps为每秒查询数
+def benchmark(index, vectors, queries, top_k=10, batch_size=256):
+    exact = BruteForceIndex()
+    exact.add(vectors)
+    result = {}
+    for name, idx in [("brute", exact), ("index", index)]:
+        ids = []
+        start = time.time()
+        for i in range(0, queries.shape[0], batch_size):
+            ids.append(idx.search(queries[i:i + batch_size], top_k)[1])
+        result[name + "_qps"] = queries.shape[0] / (time.time() - start)
+        result[name + "_ids"] = torch.cat(ids, dim=0)
+    truth, found = result.pop("brute_ids"), result.pop("index_ids")
+    hits = (found.unsqueeze(-1) == truth.unsqueeze(1)).any(dim=1).sum()
+    result["recall@%d" % top_k] = float(hits) / truth.numel()
+    return result
+
+
+if __name__ == "__main__":
+    # 随机生成带簇结构的向量测试召回率和速度
+    torch.manual_seed(0)
+    n, dim, n_query = 200000, 128, 2000
+    centers = torch.randn(1000, dim)
+    vectors = centers[torch.randint(0, 1000, (n,))] + 0.3 * torch.randn(n, dim)
+    vectors = torch.nn.functional.normalize(vectors, dim=-1)
+    queries = torch.nn.functional.normalize(vectors[:n_query] + 0.1 * torch.randn(n_query, dim), dim=-1)
+    for n_probe in [1, 4, 16]:
+        index = IVFIndex(n_lists=512, n_probe=n_probe)
+        index.add(vectors)
+        print("n_probe=%d" % n_probe, benchmark(index, vectors, queries, top_k=10))
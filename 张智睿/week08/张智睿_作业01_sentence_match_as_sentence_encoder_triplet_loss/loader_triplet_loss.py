@@ -68,10 +68,12 @@ class DataGenerator:
 
     def __getitem__(self, index):
         if self.data_type == "train":
+            if self.config["negative_mining"] != "random":
+                return self.random_pair_sample()  # 只返回正样本对，负样本在batch内挖掘
             return self.random_train_sample()  # 返回三元组样本
         else:
-            # 生成验证集三元组
-            return self.random_train_sample()  # 生成与训练数据一样的三元组格式
+            # 验证集返回问题和标准问编号，用于在知识库中检索
+            return self.data[index]
 
     def random_train_sample(self):
         standard_question_index = list(self.knwb.keys())
@@ -91,6 +93,14 @@ class DataGenerator:
             s3 = random.choice(self.knwb[n])
             return [s1, s2, s3, torch.LongTensor([-1])]  # 返回三元组和标签（-1：不相似）
 
+    # 难负样本挖掘时使用：随机取同一标准问下的两个问题作为锚点和正样本，并返回标准问编号
+    def random_pair_sample(self):
+        p = random.choice(list(self.knwb.keys()))
+        if len(self.knwb[p]) < 2:
+            return self.random_pair_sample()
+        s1, s2 = random.sample(self.knwb[p], 2)
+        return [s1, s2, torch.LongTensor([p])]
+
 def load_vocab(vocab_path):
     token_dict = {}
     with open(vocab_path, encoding="utf8") as f:
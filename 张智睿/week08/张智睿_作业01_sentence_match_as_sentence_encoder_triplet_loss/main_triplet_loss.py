@@ -54,12 +54,16 @@ def main(config):
 
             # 将数据迁移到 GPU
             if cuda_flag:
-                sentence1, sentence2, sentence3, labels = [d.cuda() for d in batch_data]
+                batch_data = [d.cuda() for d in batch_data]
+
+            if config["negative_mining"] != "random":
+                # 负样本在batch内实时挖掘
+                sentence1, sentence2, labels = batch_data
+                loss = model.mined_triplet_loss(sentence1, sentence2, labels, mode=config["negative_mining"])
             else:
                 sentence1, sentence2, sentence3, labels = batch_data
-
-            # 计算三元组损失
-            loss = model(sentence1, sentence2, sentence3)  # 使用三元组损失进行训练
+                # 计算三元组损失
+                loss = model(sentence1, sentence2, sentence3)  # 使用三元组损失进行训练
 
             train_loss.append(loss.item())
 
@@ -59,6 +59,31 @@ class SiameseNetwork(nn.Module):
         # 返回diff中大于0的部分的平均值
         return torch.mean(diff[diff.gt(0)])  # greater than
 
+    # 在batch内挖掘负样本的三元组损失：sentence1为锚点，sentence2为正样本，labels为标准问编号
+    # mode="hard"选距离锚点最近的负样本，mode="semi-hard"选比正样本远的负样本中最近的一个（没有时退回最难负样本）
+    def mined_triplet_loss(self, sentence1, sentence2, labels, mode="hard", margin=0.1):
+        a = self.sentence_encoder(sentence1)
+        p = self.sentence_encoder(sentence2)
+        labels = labels.view(-1)
+        ap = self.cosine_distance(a, p)
+        # 锚点和正样本都可以作为其他锚点的负样本
+        candidates = torch.nn.functional.normalize(torch.cat([a, p], dim=0), dim=-1)
+        candidate_labels = torch.cat([labels, labels], dim=0)
+        an = 1 - torch.mm(torch.nn.functional.normalize(a, dim=-1), candidates.T)
+        an = an.masked_fill(labels.unsqueeze(1) == candidate_labels.unsqueeze(0), float("inf"))
+        hardest = an.min(dim=-1).values
+        if mode == "semi-hard":
+            semi_hard = an.masked_fill(an <= ap.unsqueeze(1), float("inf")).min(dim=-1).values
+            an = torch.where(torch.isinf(semi_hard), hardest, semi_hard)
+        else:
+            an = hardest
+        # batch内没有其他标准问的锚点不参与计算
+        valid = ~torch.isinf(an)
+        diff = ap[valid] - an[valid] + margin
+        if not diff.gt(0).any():
+            return (ap * 0).sum()
+        return torch.mean(diff[diff.gt(0)])  # 与cosine_triplet_loss一致，只对大于0的部分求平均
+
     # 修改后的 forward 方法同时传入 3 个句子
     # sentence1 是 anchor，sentence2 是 positive，sentence3 是 negative
     def forward(self, sentence1, sentence2, sentence3):
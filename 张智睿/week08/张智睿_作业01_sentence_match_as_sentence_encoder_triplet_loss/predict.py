@@ -1,8 +1,10 @@
 # -*- coding: utf-8 -*-
 import torch
-from loader import load_data
+import jieba
+from loader_triplet_loss import load_data
 from config import Config
-from model import SiameseNetwork, choose_optimizer
+from model_triplet_loss import SiameseNetwork
+from knwb_index import build_index
 
 """
 模型效果测试
@@ -37,9 +39,11 @@ class Predictor:
             question_matrixs = torch.stack(self.question_ids, dim=0)
             if torch.cuda.is_available():
                 question_matrixs = question_matrixs.cuda()
-            self.knwb_vectors = self.model(question_matrixs)
+            self.knwb_vectors = self.model.sentence_encoder(question_matrixs)
             #将所有向量都作归一化 v / |v|
             self.knwb_vectors = torch.nn.functional.normalize(self.knwb_vectors, dim=-1)
+            #知识库很大时可在config中设置index_type为"ivf"，使用近似检索
+            self.index = build_index(self.config, self.knwb_vectors)
         return
 
     def encode_sentence(self, text):
@@ -53,16 +57,23 @@ class Predictor:
         return input_id
 
     def predict(self, sentence):
-        input_id = self.encode_sentence(sentence)
-        input_id = torch.LongTensor([input_id])
+        return self.predict_batch([sentence])[0]
+
+    #批量预测，所有输入一次检索知识库
+    def predict_batch(self, sentences):
+        input_ids = [self.train_data.dataset.padding(self.encode_sentence(sentence)) for sentence in sentences]
+        input_ids = torch.LongTensor(input_ids)
         if torch.cuda.is_available():
-            input_id = input_id.cuda()
+            input_ids = input_ids.cuda()
         with torch.no_grad():
-            test_question_vector = self.model(input_id) #不输入labels，使用模型当前参数进行预测
-            res = torch.mm(test_question_vector.unsqueeze(0), self.knwb_vectors.T)
-            hit_index = int(torch.argmax(res.squeeze())) #命中问题标号
-            hit_index = self.question_index_to_standard_question_index[hit_index] #转化成标准问编号 
-        return  self.index_to_standard_question[hit_index]
+            test_question_vectors = self.model.sentence_encoder(input_ids).view(len(sentences), -1) #不输入labels，使用模型当前参数进行预测
+            test_question_vectors = torch.nn.functional.normalize(test_question_vectors, dim=-1)
+            _, hit_indexs = self.index.search(test_question_vectors, top_k=1) #命中问题标号
+        results = []
+        for hit_index in hit_indexs[:, 0].tolist():
+            hit_index = self.question_index_to_standard_question_index[hit_index] #转化成标准问编号
+            results.append(self.index_to_standard_question[hit_index])
+        return results
 
 if __name__ == "__main__":
     knwb_data = load_data(Config["train_data_path"], Config)
@@ -1,17 +1,24 @@
 # -*- coding: utf-8 -*-
 """
 仅使用 Python 标准库实现一个简化版的 BPE（Byte Pair Encoding）训练器。
- 
+大语料可用 train_from_file：先用正则把文本预切分成 chunk，多进程统计 chunk 频次，只对去重后的 chunk 做合并。
 """
 
 from __future__ import annotations
 
+import heapq
 import json
+import os
 import re
 from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
 from typing import Dict, List, Tuple, Iterable, Optional
 
+# 预切分规则：连续汉字、连续字母、连续数字、连续空白各为一个 chunk，其余字符（标点等）单独成为一个 chunk
+# 合并不会跨越 chunk 边界，tokenizer 编码时按同样的规则切分
+PRETOKENIZE_PATTERN = r"[\u4e00-\u9fff]+|[A-Za-z]+|[0-9]+|\s+|[^\s\u4e00-\u9fffA-Za-z0-9]"
+
 
 def clean_corpus_text(text: str) -> str:
     """
@@ -65,31 +72,138 @@ def iter_training_units(text: str, max_units: Optional[int] = None) -> Iterable[
             break
 
 
-def _get_pair_counts(token_seqs: Dict[Tuple[str, ...], int]) -> Dict[Tuple[str, str], int]:
-    pair_counts: Dict[Tuple[str, str], int] = defaultdict(int)
-    for tokens, freq in token_seqs.items():
-        if len(tokens) < 2:
-            continue
-        prev = tokens[0]
-        for cur in tokens[1:]:
-            pair_counts[(prev, cur)] += freq
-            prev = cur
-    return pair_counts
-
-
-def _merge_pair_in_tokens(tokens: Tuple[str, ...], pair: Tuple[str, str]) -> Tuple[str, ...]:
+def count_chunks(text: str, pattern: str = PRETOKENIZE_PATTERN) -> Counter:
+    """清洗文本后按 pattern 预切分，统计每个 chunk 的出现次数（换行不计入 chunk）"""
+    counter: Counter = Counter()
+    regex = re.compile(pattern)
+    for unit in iter_training_units(clean_corpus_text(text)):
+        counter.update(regex.findall(unit))
+    return counter
+
+
+def split_file_shards(path: str, num_shards: int) -> List[Tuple[int, int]]:
+    """把文件按字节切成 num_shards 段，每段的边界都对齐到行首（utf-8 / gb18030 中换行字节不会出现在多字节字符内部）"""
+    size = os.path.getsize(path)
+    bounds = [0]
+    with open(path, "rb") as f:
+        for k in range(1, num_shards):
+            f.seek(max(size * k // num_shards, bounds[-1]))
+            f.readline()
+            bounds.append(min(f.tell(), size))
+    bounds.append(size)
+    return [(start, end) for start, end in zip(bounds, bounds[1:]) if end > start]
+
+
+def _count_file_shard(path: str, start: int, end: int, encoding: str, pattern: str) -> Counter:
+    with open(path, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start)
+    return count_chunks(data.decode(encoding, errors="ignore"), pattern)
+
+
+def count_chunks_in_file(
+    path: str,
+    num_workers: int = 0,
+    encoding: str = "utf-8",
+    pattern: str = PRETOKENIZE_PATTERN,
+    shard_bytes: int = 16 << 20,
+) -> Counter:
+    """
+    map-reduce 统计整个文件的 chunk 频次：文件按 shard_bytes 切分成若干段，
+    每段在进程池中独立统计（map），最后把各段的 Counter 相加（reduce）。
+    """
+    num_shards = max(1, os.path.getsize(path) // shard_bytes + 1, num_workers)
+    shards = split_file_shards(path, num_shards)
+    counter: Counter = Counter()
+    if num_workers <= 1:
+        for start, end in shards:
+            counter.update(_count_file_shard(path, start, end, encoding, pattern))
+        return counter
+
+    with ProcessPoolExecutor(num_workers) as pool:
+        futures = [pool.submit(_count_file_shard, path, start, end, encoding, pattern) for start, end in shards]
+        for future in futures:
+            counter.update(future.result())
+    return counter
+
+
+def _merge_word_with_changes(
+    tokens: List[str], pair: Tuple[str, str], new_token: str
+) -> Tuple[List[str], List[Tuple[Tuple[str, str], int]]]:
+    """
+    对一个 token 序列做从左到右的不重叠合并，同时返回受影响的相邻 pair 的计数变化。
+    只有被合并位置左右两侧的 pair 会变化，被合并的 pair 本身由调用方整体移除。
+    """
     a, b = pair
     out: List[str] = []
+    changes: List[Tuple[Tuple[str, str], int]] = []
     i = 0
     n = len(tokens)
     while i < n:
         if i < n - 1 and tokens[i] == a and tokens[i + 1] == b:
-            out.append(a + b)
+            if out:
+                changes.append(((out[-1], a), -1))
+                changes.append(((out[-1], new_token), 1))
+            if i + 2 < n:
+                changes.append(((b, tokens[i + 2]), -1))
+                changes.append(((new_token, tokens[i + 2]), 1))
+            out.append(new_token)
             i += 2
         else:
             out.append(tokens[i])
             i += 1
-    return tuple(out)
+    return out, changes
+
+
+def _iter_merges(token_seqs: Dict[Tuple[str, ...], int], min_count: int = 2) -> Iterable[Tuple[str, str]]:
+    """
+    增量式 BPE 合并：依次产出每一步频次最高的 pair。
+    - pair_counts / pair_index 只统计一次，之后每次合并只更新包含该 pair 的序列中相邻位置的计数
+    - 最高频 pair 用最大堆选取，计数变化时压入新条目，弹出时与当前计数不一致的旧条目直接丢弃
+    - 频次相同时取字典序最小的 pair，结果可复现
+    """
+    words: List[List[str]] = [list(tokens) for tokens in token_seqs]
+    freqs: List[int] = list(token_seqs.values())
+
+    pair_counts: Dict[Tuple[str, str], int] = defaultdict(int)
+    pair_index: Dict[Tuple[str, str], set] = defaultdict(set)
+    for wi, tokens in enumerate(words):
+        for pair in zip(tokens, tokens[1:]):
+            pair_counts[pair] += freqs[wi]
+            pair_index[pair].add(wi)
+
+    heap = [(-count, pair) for pair, count in pair_counts.items()]
+    heapq.heapify(heap)
+
+    while heap:
+        neg_count, pair = heapq.heappop(heap)
+        if pair_counts.get(pair, 0) != -neg_count:
+            continue
+        if -neg_count < min_count:
+            break
+
+        new_token = pair[0] + pair[1]
+        changed: Dict[Tuple[str, str], int] = defaultdict(int)
+        for wi in pair_index.pop(pair):
+            # pair_index 中可能残留已不再包含该 pair 的序列，合并时不会产生任何变化
+            words[wi], changes = _merge_word_with_changes(words[wi], pair, new_token)
+            for p, delta in changes:
+                changed[p] += delta * freqs[wi]
+                if delta > 0:
+                    pair_index[p].add(wi)
+        del pair_counts[pair]
+
+        for p, delta in changed.items():
+            if delta == 0:
+                continue
+            pair_counts[p] += delta
+            if pair_counts[p] > 0:
+                heapq.heappush(heap, (-pair_counts[p], p))
+            else:
+                del pair_counts[p]
+                pair_index.pop(p, None)
+
+        yield pair
 
 
 @dataclass
@@ -105,6 +219,8 @@ class BPEModel:
     vocab: Dict[str, int]
     id_to_token: List[str]
     merges: List[Tuple[str, str]]
+    # 训练时使用的预切分规则；为 None 表示按整行训练
+    pretokenize: Optional[str] = None
 
 
 class BPETrainer:
@@ -114,14 +230,31 @@ class BPETrainer:
         self.config = config
 
     def train_from_text(self, text: str) -> BPEModel:
+        """按整行作为训练单位训练"""
         cleaned = clean_corpus_text(text)
-
+        unit_counts: Counter[str] = Counter(iter_training_units(cleaned, max_units=self.config.max_training_units))
+        return self.train_from_unit_counts(unit_counts)
+
+    def train_from_file(
+        self, path: str, num_workers: int = 0, encoding: str = "utf-8", pattern: str = PRETOKENIZE_PATTERN
+    ) -> BPEModel:
+        """
+        流式 + 多进程训练：按 pattern 预切分并统计 chunk 频次，只把去重后的频次表交给合并过程。
+        """
+        chunk_counts = count_chunks_in_file(path, num_workers, encoding, pattern)
+        model = self.train_from_unit_counts(chunk_counts)
+        model.pretokenize = pattern
+        return model
+
+    def train_from_unit_counts(self, unit_counts: Dict[str, int]) -> BPEModel:
+        """
+        在 {训练单位: 出现次数} 上训练，每个训练单位末尾加 </w>，合并不跨越训练单位。
+        """
         # 1) 统计字符频次，用于构建“受限初始字母表”
         char_counter: Counter[str] = Counter()
-        units: List[str] = []
-        for unit in iter_training_units(cleaned, max_units=self.config.max_training_units):
-            units.append(unit)
-            char_counter.update(list(unit))
+        for unit, freq in unit_counts.items():
+            for ch in unit:
+                char_counter[ch] += freq
 
         # 2) 计算初始字母表大小：大致取“目标词表的一半”留给 merges
         specials_n = len(self.config.special_tokens) if self.config.add_special_tokens else 0
@@ -137,12 +270,12 @@ class BPETrainer:
         # 3) 构建 token 序列频次：不在 alphabet 的字符统一映射成 <unk>
         unk = "<unk>"
         token_seqs: Dict[Tuple[str, ...], int] = Counter()
-        for unit in units:
+        for unit, freq in unit_counts.items():
             tokens: List[str] = []
             for ch in unit:
                 tokens.append(ch if ch in alphabet else unk)
             tokens.append(self.END_SYMBOL)
-            token_seqs[tuple(tokens)] += 1
+            token_seqs[tuple(tokens)] += freq
 
         # 4) 初始化 vocab：special tokens + alphabet
         vocab: Dict[str, int] = {}
@@ -161,31 +294,18 @@ class BPETrainer:
 
         merges: List[Tuple[str, str]] = []
 
-        # 5) BPE 迭代合并，直到达到指定 vocab_size
-        while len(vocab) < self.config.vocab_size:
-            pair_counts = _get_pair_counts(token_seqs)
-            if not pair_counts:
-                break
-
-            best_pair, best_count = max(pair_counts.items(), key=lambda x: x[1])
-            if best_count < 2:
-                break
-
-            merges.append(best_pair)
-
-            new_token_seqs: Dict[Tuple[str, ...], int] = Counter()
-            for tokens, freq in token_seqs.items():
-                merged = _merge_pair_in_tokens(tokens, best_pair)
-                new_token_seqs[merged] += freq
-            token_seqs = new_token_seqs
+        # 5) BPE 迭代合并，直到达到指定 vocab_size（增量更新 pair 计数，不再每轮全量重算）
+        if len(vocab) < self.config.vocab_size:
+            for best_pair in _iter_merges(token_seqs, min_count=2):
+                merges.append(best_pair)
 
-            new_token = best_pair[0] + best_pair[1]
-            if new_token not in vocab:
-                vocab[new_token] = len(id_to_token)
-                id_to_token.append(new_token)
+                new_token = best_pair[0] + best_pair[1]
+                if new_token not in vocab:
+                    vocab[new_token] = len(id_to_token)
+                    id_to_token.append(new_token)
 
-            if len(vocab) >= self.config.vocab_size:
-                break
+                if len(vocab) >= self.config.vocab_size:
+                    break
 
         # 6) 如果因为语料太短/可合并对太少导致未达标，则用占位 token 补齐到严格 vocab_size
         extra_i = 0
@@ -206,5 +326,7 @@ class BPETrainer:
             "end_symbol": self.END_SYMBOL,
             "special_tokens": list(self.config.special_tokens) if self.config.add_special_tokens else [],
         }
+        if model.pretokenize is not None:
+            obj["pretokenize"] = model.pretokenize
         with open(path, "w", encoding="utf-8") as f:
             json.dump(obj, f, ensure_ascii=False, indent=2)
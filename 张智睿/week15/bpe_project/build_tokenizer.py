@@ -2,8 +2,9 @@
 """
 build_tokenizer.py
 - 读取 data/语料
-- 训练 BPE 词表到 50 个 token
+- 预切分语料并多进程统计 chunk 频次，训练 BPE 词表到 50 个 token
 - 输出 tokenizer.json（包含词表与 token-id 对应关系、merges）
+- 用训练好的 tokenizer 多进程编码整个语料，输出 corpus_tokens.bin（uint16/uint32，可 memmap 读取）
 """
 
 from __future__ import annotations
@@ -11,6 +12,22 @@ from __future__ import annotations
 import os
 
 from bpe_trainer import BPETrainer, BPETrainConfig
+from tokenizer import BPETokenizer
+
+
+def detect_encoding(path: str, encodings=("utf-8", "gb18030"), block_size: int = 1 << 20) -> str:
+    """
+    按块流式尝试解码整个文件，返回第一个能完整解码的编码；都失败时返回 utf-8（读取时忽略错误）。
+    """
+    for enc in encodings:
+        try:
+            with open(path, "r", encoding=enc) as f:
+                while f.read(block_size):
+                    pass
+            return enc
+        except UnicodeDecodeError:
+            continue
+    return "utf-8"
 
 
 def main():
@@ -18,26 +35,17 @@ def main():
     corpus_path = os.path.join(os.path.dirname(__file__), "..", "data", "长安乱.txt")
     corpus_path = os.path.abspath(corpus_path)
 
-    text = None
-    for enc in ("utf-8", "gb18030"):
-        try:
-            with open(corpus_path, "r", encoding=enc) as f:
-                text = f.read()
-            break
-        except UnicodeDecodeError:
-            continue
-    if text is None:
-        # 最后兜底：忽略错误读取
-        with open(corpus_path, "r", encoding="utf-8", errors="ignore") as f:
-            text = f.read()
+    # 最后兜底：忽略错误读取
+    encoding = detect_encoding(corpus_path)
+    num_workers = os.cpu_count() or 1
 
     config = BPETrainConfig(
         vocab_size=50,                 # 按你的要求：50 词规模词表
         add_special_tokens=True,       # 词表里包含 <pad> <unk>
-        max_training_units=20000       # 小说很长，这个值够学到高频模式
     )
     trainer = BPETrainer(config)
-    model = trainer.train_from_text(text)
+    # 文件分段交给多个进程统计 chunk 频次，只在去重后的 chunk 上合并
+    model = trainer.train_from_file(corpus_path, num_workers=num_workers, encoding=encoding)
 
     out_path = os.path.join(os.path.dirname(__file__), "tokenizer.json")
     out_path = os.path.abspath(out_path)
@@ -52,6 +60,12 @@ def main():
     for tok, idx in vocab_items[:20]:
         print(f"{idx:>3}  {tok}")
 
+    # 流式 + 多进程编码整个语料，直接写出二进制 token 文件
+    tokenizer = BPETokenizer.load(out_path)
+    bin_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "corpus_tokens.bin"))
+    num_tokens = tokenizer.encode_file(corpus_path, bin_path, num_workers=num_workers, encoding=encoding)
+    print(f"\n语料编码完成：{num_tokens} 个 token，已写入：", bin_path)
+
 
 if __name__ == "__main__":
     main()
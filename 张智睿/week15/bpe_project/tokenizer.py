@@ -1,13 +1,68 @@
 # -*- coding: utf-8 -*-
 """
 BPE 分词器：支持 encode/decode，以及从 tokenizer.json 加载。
+大语料使用 encode_batch / encode_file 多进程编码，encode_file 直接写出 uint16/uint32 的二进制 token 文件。
 """
 
 from __future__ import annotations
 
+import heapq
 import json
-from dataclasses import dataclass
-from typing import Dict, List, Tuple, Optional
+import os
+import re
+from array import array
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Tuple, Optional
+
+# 训练单位为去掉换行的单行文本，merges 不会跨越换行，按换行预先切块不影响编码结果
+CHUNK_PATTERN = re.compile(r"(\n)")
+
+
+# 每个工作进程持有一份 tokenizer，只在进程启动时传入一次
+_WORKER_TOKENIZER: Optional["BPETokenizer"] = None
+
+
+def _init_worker(tokenizer: "BPETokenizer") -> None:
+    global _WORKER_TOKENIZER
+    _WORKER_TOKENIZER = tokenizer
+
+
+def _encode_lines_worker(lines: List[str], add_end_symbol: bool) -> List[List[int]]:
+    return [_WORKER_TOKENIZER.encode(line, add_end_symbol) for line in lines]
+
+
+def _encode_block_worker(lines: List[str], typecode: str) -> array:
+    ids = array(typecode)
+    for line in lines:
+        ids.extend(_WORKER_TOKENIZER.encode(line))
+    return ids
+
+
+def iter_line_blocks(path: str, block_chars: int = 1 << 20, encoding: str = "utf-8") -> Iterable[List[str]]:
+    """
+    流式读取大文件：按行累积，约 block_chars 个字符产出一块，跳过空行。
+    """
+    block: List[str] = []
+    size = 0
+    with open(path, "r", encoding=encoding, errors="ignore") as f:
+        for line in f:
+            line = line.rstrip("\r\n")
+            if not line.strip():
+                continue
+            block.append(line)
+            size += len(line)
+            if size >= block_chars:
+                yield block
+                block, size = [], 0
+    if block:
+        yield block
+
+
+def _batched(items: List[str], batch_size: int) -> Iterable[List[str]]:
+    for i in range(0, len(items), batch_size):
+        yield items[i:i + batch_size]
 
 
 @dataclass
@@ -17,6 +72,17 @@ class BPETokenizer:
     merges: List[Tuple[str, str]]
     end_symbol: str = "</w>"
     unk_token: str = "<unk>"
+    cache_size: int = 10000
+    # 训练时的预切分规则（见 bpe_trainer.PRETOKENIZE_PATTERN）；为 None 时按整行训练
+    pretokenize: Optional[str] = None
+
+    # merge -> rank（学到的顺序），以及 chunk -> ids 的 LRU 缓存
+    merge_ranks: Dict[Tuple[str, str], int] = field(init=False, repr=False)
+    _cache: "OrderedDict[Tuple[str, bool], List[int]]" = field(init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        self.merge_ranks = {tuple(pair): rank for rank, pair in enumerate(self.merges)}
+        self._cache = OrderedDict()
 
     @classmethod
     def load(cls, path: str) -> "BPETokenizer":
@@ -38,7 +104,8 @@ class BPETokenizer:
             id_to_token=id_to_token,
             merges=merges,
             end_symbol=end_symbol,
-            unk_token=unk_token
+            unk_token=unk_token,
+            pretokenize=obj.get("pretokenize")
         )
 
     def save(self, path: str) -> None:
@@ -48,49 +115,165 @@ class BPETokenizer:
             "merges": [list(p) for p in self.merges],
             "end_symbol": self.end_symbol,
         }
+        if self.pretokenize is not None:
+            obj["pretokenize"] = self.pretokenize
         with open(path, "w", encoding="utf-8") as f:
             json.dump(obj, f, ensure_ascii=False, indent=2)
 
     def _apply_bpe(self, symbols: List[str]) -> List[str]:
         """
-        对单个 symbol 序列应用 merges。
-        因为本项目词表很小（50），merges 数量也很少，直接按顺序做替换即可。
+        对单个 symbol 序列应用 merges：每次合并 rank 最小（最早学到）的相邻 pair，
+        与按 merges 顺序逐条替换的结果一致。
+        symbol 用双向链表保存，候选 pair 以 (rank, 位置) 放入堆中，复杂度 O(n log n)。
         """
-        for a, b in self.merges:
-            merged = a + b
-            out: List[str] = []
-            i = 0
-            n = len(symbols)
-            while i < n:
-                if i < n - 1 and symbols[i] == a and symbols[i + 1] == b:
-                    out.append(merged)
-                    i += 2
-                else:
-                    out.append(symbols[i])
-                    i += 1
-            symbols = out
-        return symbols
+        ranks = self.merge_ranks
+        symbols = list(symbols)
+        n = len(symbols)
+        if n < 2:
+            return symbols
+
+        prev = list(range(-1, n - 1))
+        nxt = list(range(1, n)) + [-1]
+        heap: List[Tuple[int, int]] = []
+        for i in range(n - 1):
+            rank = ranks.get((symbols[i], symbols[i + 1]))
+            if rank is not None:
+                heap.append((rank, i))
+        heapq.heapify(heap)
+
+        while heap:
+            rank, i = heapq.heappop(heap)
+            j = nxt[i]
+            # 该位置已被合并掉，或位置上的 pair 已经变化：过期条目直接跳过
+            if symbols[i] is None or j == -1 or ranks.get((symbols[i], symbols[j])) != rank:
+                continue
+            symbols[i] = symbols[i] + symbols[j]
+            symbols[j] = None
+            nxt[i] = nxt[j]
+            if nxt[i] != -1:
+                prev[nxt[i]] = i
+
+            # 新 symbol 与左右相邻 symbol 组成的 pair 入堆
+            if prev[i] != -1:
+                rank = ranks.get((symbols[prev[i]], symbols[i]))
+                if rank is not None:
+                    heapq.heappush(heap, (rank, prev[i]))
+            if nxt[i] != -1:
+                rank = ranks.get((symbols[i], symbols[nxt[i]]))
+                if rank is not None:
+                    heapq.heappush(heap, (rank, i))
+
+        return [t for t in symbols if t is not None]
+
+    def _encode_chunk(self, chunk: str, add_end_symbol: bool) -> List[int]:
+        """编码单个 chunk，结果放入有界 LRU 缓存，重复出现的 chunk 不再重新合并"""
+        key = (chunk, add_end_symbol)
+        ids = self._cache.get(key)
+        if ids is not None:
+            self._cache.move_to_end(key)
+            return ids
+
+        # 初始符号：逐字符
+        symbols = list(chunk)
+        if add_end_symbol:
+            symbols.append(self.end_symbol)
+
+        unk_id = self.vocab.get(self.unk_token, 0)
+        ids = [self.vocab.get(t, unk_id) for t in self._apply_bpe(symbols)]
+
+        self._cache[key] = ids
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return ids
 
     def encode(self, text: str, add_end_symbol: bool = True) -> List[int]:
         """
         输入一句中文，输出 token id 序列。
         - 默认会在末尾加入 </w>（与训练一致），让 decode 更稳定
+        - 文本先按换行切成 chunk，逐个 chunk 编码（带缓存）后拼接
+        - 若训练时使用了预切分，则按同样的规则切分，每个 chunk 末尾都加 </w>
         """
-        # 初始符号：逐字符
-        symbols = list(text)
-        if add_end_symbol:
-            symbols.append(self.end_symbol)
-
-        bpe_tokens = self._apply_bpe(symbols)
+        if self.pretokenize is not None:
+            ids = []
+            for chunk in re.findall(self.pretokenize, text):
+                ids.extend(self._encode_chunk(chunk, add_end_symbol))
+            return ids
 
+        chunks = CHUNK_PATTERN.split(text)
         ids: List[int] = []
-        for t in bpe_tokens:
-            if t in self.vocab:
-                ids.append(self.vocab[t])
-            else:
-                ids.append(self.vocab.get(self.unk_token, 0))
+        for k, chunk in enumerate(chunks):
+            is_last = k == len(chunks) - 1
+            if chunk or is_last:
+                ids.extend(self._encode_chunk(chunk, add_end_symbol and is_last))
         return ids
 
+    def encode_batch(
+        self, texts: List[str], add_end_symbol: bool = True, num_workers: int = 0, batch_size: int = 1000
+    ) -> List[List[int]]:
+        """
+        批量编码，结果与逐条 encode 一致、顺序不变。
+        - num_workers <= 1 时在当前进程编码；否则按 batch_size 分片交给进程池
+        """
+        if num_workers <= 1 or len(texts) <= batch_size:
+            return [self.encode(text, add_end_symbol) for text in texts]
+
+        results: List[List[int]] = []
+        with ProcessPoolExecutor(num_workers, initializer=_init_worker, initargs=(self,)) as pool:
+            for ids in pool.map(_encode_lines_worker, _batched(texts, batch_size),
+                                [add_end_symbol] * ((len(texts) + batch_size - 1) // batch_size)):
+                results.extend(ids)
+        return results
+
+    def token_typecode(self) -> Tuple[str, str]:
+        """词表不超过 65536 时用 uint16 存储 token id，否则用 uint32"""
+        return ("H", "uint16") if len(self.vocab) <= 1 << 16 else ("I", "uint32")
+
+    def encode_file(
+        self,
+        input_path: str,
+        output_path: str,
+        num_workers: int = 0,
+        block_chars: int = 1 << 20,
+        encoding: str = "utf-8",
+    ) -> int:
+        """
+        流式编码整个文本文件，token id 直接追加写入二进制文件（可用 numpy.memmap 读取），返回 token 总数。
+        - 每个非空行作为一个编码单位（与训练一致），行末带 </w>
+        - 文件按 block_chars 分块交给进程池，同时在途的块数有上限，内存占用与文件大小无关
+        - 另写一份 output_path + ".json" 记录 dtype 和 token 数
+        """
+        typecode, dtype = self.token_typecode()
+        blocks = iter_line_blocks(input_path, block_chars, encoding)
+        num_tokens = 0
+        tmp_path = output_path + ".tmp"
+        with open(tmp_path, "wb") as out:
+            if num_workers <= 1:
+                for block in blocks:
+                    ids = array(typecode)
+                    for line in block:
+                        ids.extend(self.encode(line))
+                    ids.tofile(out)
+                    num_tokens += len(ids)
+            else:
+                with ProcessPoolExecutor(num_workers, initializer=_init_worker, initargs=(self,)) as pool:
+                    pending: deque = deque()
+                    for block in blocks:
+                        pending.append(pool.submit(_encode_block_worker, block, typecode))
+                        # 按提交顺序写出，保证 token 顺序与文件一致
+                        while len(pending) >= 2 * num_workers:
+                            ids = pending.popleft().result()
+                            ids.tofile(out)
+                            num_tokens += len(ids)
+                    while pending:
+                        ids = pending.popleft().result()
+                        ids.tofile(out)
+                        num_tokens += len(ids)
+        os.replace(tmp_path, output_path)
+
+        with open(output_path + ".json", "w", encoding="utf-8") as f:
+            json.dump({"dtype": dtype, "num_tokens": num_tokens, "vocab_size": len(self.vocab)}, f)
+        return num_tokens
+
     def decode(self, ids: List[int]) -> str:
         """
         输入 token id 序列，输出对应中文。
@@ -1,18 +1,104 @@
 import re
 import json
+import time
 import pandas
 import itertools
+import threading
 from py2neo import Graph
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from memory_graph import MemoryGraph
 
 '''
 使用文本匹配的方式进行知识图谱的使用
 '''
 
 
-class GraphQA:
+# 多模式串匹配自动机：加载图谱时对实体、关系、属性、标签构建一次，每个问题只扫描一遍
+class AhoCorasick:
     def __init__(self):
-        self.graph = Graph("http://localhost:7474", auth=("neo4j", "neo4j123"))
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]  # 每个状态结束的词：(词长, 类别)
+
+    def add(self, word, kind):
+        state = 0
+        for char in word:
+            if char not in self.goto[state]:
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append([])
+                self.goto[state][char] = len(self.goto) - 1
+            state = self.goto[state][char]
+        self.output[state].append((len(word), kind))
+
+    def build(self):
+        queue = list(self.goto[0].values())
+        for state in queue:
+            for char, next_state in self.goto[state].items():
+                fail = self.fail[state]
+                while fail and char not in self.goto[fail]:
+                    fail = self.fail[fail]
+                self.fail[next_state] = self.goto[fail].get(char, 0)
+                self.output[next_state] = self.output[next_state] + self.output[self.fail[next_state]]
+                queue.append(next_state)
+
+    # 返回所有命中：(起始位置, 结束位置, 类别)
+    def search(self, text):
+        state = 0
+        for end, char in enumerate(text):
+            while state and char not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(char, 0)
+            for length, kind in self.output[state]:
+                yield end + 1 - length, end + 1, kind
+
+
+# cypher查询结果缓存：超过容量淘汰最久未使用的，超过ttl秒的结果过期；多个线程同时查询时加锁
+class QueryCache:
+    def __init__(self, max_size=10000, ttl=600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.cache = OrderedDict()  # 规范化的cypher -> (写入时间, 查询结果)
+        self.lock = threading.Lock()
+
+    # 去掉多余的空白，写法不同但内容相同的cypher共用一条缓存
+    @staticmethod
+    def normalize(cypher):
+        return " ".join(cypher.split())
+
+    def get(self, cypher):
+        key = self.normalize(cypher)
+        with self.lock:
+            if key not in self.cache:
+                return None
+            save_time, result = self.cache[key]
+            if time.monotonic() - save_time > self.ttl:
+                del self.cache[key]
+                return None
+            self.cache.move_to_end(key)
+            return result
+
+    def set(self, cypher, result):
+        key = self.normalize(cypher)
+        with self.lock:
+            self.cache[key] = (time.monotonic(), result)
+            self.cache.move_to_end(key)
+            while len(self.cache) > self.max_size:
+                self.cache.popitem(last=False)
+
+
+class GraphQA:
+    # backend为"neo4j"时连接图数据库，为"memory"时使用内存中的三元组图谱
+    # top_n大于1时，每次同时提交得分最高的top_n条cypher查询
+    def __init__(self, backend="neo4j", cache_size=10000, cache_ttl=600, top_n=1):
+        if backend == "memory":
+            self.graph = MemoryGraph()
+        else:
+            self.graph = Graph("http://localhost:7474", auth=("neo4j", "neo4j123"))
+        self.cache = QueryCache(cache_size, cache_ttl)
+        self.top_n = top_n
+        self.executor = ThreadPoolExecutor(top_n) if top_n > 1 else None
         schema_path = "kg_schema.json"
         templet_path = "question_templet.xlsx"
         self.load(schema_path, templet_path)
@@ -35,8 +121,19 @@ class GraphQA:
         self.entity_set = set(schema.get("entitys", []))
         self.label_set = set(schema.get("labels", []))  # 添加默认值防止KeyError
         self.attribute_set = set(schema.get("attributes", []))
+        self.build_mention_matcher()
         return
 
+    # 所有实体、关系、标签、属性放进同一个自动机，用类别区分
+    def build_mention_matcher(self):
+        self.mention_matcher = AhoCorasick()
+        for kind, words in (("%ENT%", self.entity_set), ("%REL%", self.relation_set),
+                            ("%LAB%", self.label_set), ("%ATT%", self.attribute_set)):
+            for word in words:
+                if word:
+                    self.mention_matcher.add(word, kind)
+        self.mention_matcher.build()
+
     # 加载模板信息
     def load_question_templet(self, templet_path):
         dataframe = pandas.read_excel(templet_path)
@@ -47,34 +144,47 @@ class GraphQA:
             cypher_check = dataframe["check"][index]
             answer = dataframe["answer"][index]
             self.question_templet.append([question, cypher, json.loads(cypher_check), answer])
+        # 按模板需要的槽位数量（如{"%ENT%": 1, "%ATT%": 1}）建立索引，同一签名的模板只需检查一次
+        self.templet_index = defaultdict(list)
+        for position, templet in enumerate(self.question_templet):
+            self.templet_index[tuple(sorted(templet[2].items()))].append(position)
         return
 
+    # 扫描一遍问题，得到每个类别谈到的词：同一类别内取最左、最长且互不重叠的命中
+    def find_mentions(self, sentence):
+        hits = defaultdict(list)
+        for start, end, kind in self.mention_matcher.search(sentence):
+            hits[kind].append((start, end))
+        mentions = {}
+        for kind in ("%ENT%", "%REL%", "%LAB%", "%ATT%"):
+            words, last_end = [], 0
+            # 起始位置相同时，较长的词排在前面
+            for start, end in sorted(hits[kind], key=lambda hit: (hit[0], -hit[1])):
+                if start >= last_end:
+                    words.append(sentence[start:end])
+                    last_end = end
+            mentions[kind] = words
+        return mentions
+
     # 获取问题中谈到的实体，可以使用基于词表的方式，也可以使用NER模型
     def get_mention_entitys(self, sentence):
-        return re.findall("|".join(self.entity_set), sentence)
+        return self.find_mentions(sentence)["%ENT%"]
 
     # 获取问题中谈到的关系，也可以使用各种文本分类模型
     def get_mention_relations(self, sentence):
-        return re.findall("|".join(self.relation_set), sentence)
+        return self.find_mentions(sentence)["%REL%"]
 
     # 获取问题中谈到的属性
     def get_mention_attributes(self, sentence):
-        return re.findall("|".join(self.attribute_set), sentence)
+        return self.find_mentions(sentence)["%ATT%"]
 
     # 获取问题中谈到的标签
     def get_mention_labels(self, sentence):
-        return re.findall("|".join(self.label_set), sentence)
+        return self.find_mentions(sentence)["%LAB%"]
 
-    # 对问题进行预处理，提取需要的信息
+    # 对问题进行预处理，提取需要的信息，所有类别一次扫描得到
     def parse_sentence(self, sentence):
-        entitys = self.get_mention_entitys(sentence)
-        relations = self.get_mention_relations(sentence)
-        labels = self.get_mention_labels(sentence)
-        attributes = self.get_mention_attributes(sentence)
-        return {"%ENT%": entitys,
-                "%REL%": relations,
-                "%LAB%": labels,
-                "%ATT%": attributes}
+        return self.find_mentions(sentence)
 
     # 将提取到的值分配到键上
     def decode_value_combination(self, value_combination, cypher_check):
@@ -131,9 +241,14 @@ class GraphQA:
     # 根据提取到的实体，关系等信息，将模板展开成待匹配的问题文本
     def expand_question_and_cypher(self, info):
         templet_cypher_pair = []
-        for templet, cypher, cypher_check, answer in self.question_templet:
-            if self.check_cypher_info_valid(info, cypher_check):
-                templet_cypher_pair += self.expand_templet(templet, cypher, cypher_check, info, answer)
+        # 先按槽位签名过滤，只展开信息足够填充的模板，展开顺序与模板文件中的顺序一致
+        positions = []
+        for signature, templet_positions in self.templet_index.items():
+            if self.check_cypher_info_valid(info, dict(signature)):
+                positions += templet_positions
+        for position in sorted(positions):
+            templet, cypher, cypher_check, answer = self.question_templet[position]
+            templet_cypher_pair += self.expand_templet(templet, cypher, cypher_check, info, answer)
         return templet_cypher_pair
 
     # 距离函数，文本匹配的所有方法都可以使用
@@ -156,7 +271,8 @@ class GraphQA:
 
     # 解析结果
     def parse_result(self, graph_search_result, answer, info):
-        graph_search_result = graph_search_result[0]
+        # 查询结果可能来自缓存，复制一份再修改
+        graph_search_result = dict(graph_search_result[0])
         # 关系查找返回的结果形式较为特殊，单独处理
         if "REL" in graph_search_result:
             graph_search_result["REL"] = list(graph_search_result["REL"].types())[0]
@@ -170,16 +286,43 @@ class GraphQA:
         info = self.parse_sentence(sentence)  # 信息抽取
         print("info:", info)
         templet_cypher_score = self.cypher_match(sentence, info)  # cypher匹配
-        for templet, cypher, score, answer in templet_cypher_score:
-            graph_search_result = self.graph.run(cypher).data()
-            # 最高分命中的模板不一定在图上能找到答案, 当不能找到答案时，运行下一个搜索语句, 找到答案时停止查找后面的模板
-            if graph_search_result:
-                answer = self.parse_result(graph_search_result, answer, info)
-                return answer
+        # 每次取top_n条cypher（同时）查询，按得分顺序检查结果
+        for start in range(0, len(templet_cypher_score), self.top_n):
+            batch = templet_cypher_score[start:start + self.top_n]
+            results = self.run_cyphers([cypher for templet, cypher, score, answer in batch])
+            for (templet, cypher, score, answer), graph_search_result in zip(batch, results):
+                # 最高分命中的模板不一定在图上能找到答案, 当不能找到答案时，运行下一个搜索语句, 找到答案时停止查找后面的模板
+                if graph_search_result:
+                    answer = self.parse_result(graph_search_result, answer, info)
+                    return answer
         return None
 
+    # 执行cypher查询，结果（包括空结果）写入缓存
+    def run_cypher(self, cypher):
+        result = self.cache.get(cypher)
+        if result is None:
+            result = self.graph.run(cypher).data()
+            self.cache.set(cypher, result)
+        return result
+
+    def run_cyphers(self, cyphers):
+        if self.executor is None or len(cyphers) == 1:
+            return [self.run_cypher(cypher) for cypher in cyphers]
+        return list(self.executor.map(self.run_cypher, cyphers))
+
+
+# 压测：重复提问rounds轮，统计每秒回答的问题数
+def benchmark(graph_qa, questions, rounds=100):
+    start = time.time()
+    for _ in range(rounds):
+        for question in questions:
+            graph_qa.query(question)
+    cost = time.time() - start
+    print("问题数：%d，耗时：%.2fs，每秒%.1f个问题" % (rounds * len(questions), cost, rounds * len(questions) / cost))
+
 
 if __name__ == "__main__":
+    # 没有neo4j时可以使用GraphQA(backend="memory")
     graph = GraphQA()
     res = graph.query("刘备的籍贯是什么")
     print(res)
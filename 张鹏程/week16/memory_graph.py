@@ -0,0 +1,83 @@
+import re
+from collections import defaultdict
+
+'''
+内存中的三元组图谱，代替neo4j用于问答和压测
+读取与build_graph.py相同的三元组文件，建立邻接索引，支持问题模板中用到的三种cypher查询：
+1.MATCH (n {NAME:'实体'}) RETURN n.属性 as ATT
+2.MATCH (n1 {NAME:'实体1'})-[r]-(n2 {NAME:'实体2'}) RETURN r as REL
+3.MATCH (n1 {NAME:'实体'})-[:关系]->(n2) RETURN n2.NAME as ENT
+返回结果与py2neo的graph.run(cypher).data()格式一致
+'''
+
+ATTRIBUTE_QUERY = re.compile(r"MATCH \(n \{NAME:'(.+?)'\}\) RETURN n\.(.+?) as (\w+)$")
+RELATION_QUERY = re.compile(r"MATCH \(n1 \{NAME:'(.+?)'\}\)-\[r\]-\(n2 \{NAME:'(.+?)'\}\) RETURN r as (\w+)$")
+TAIL_QUERY = re.compile(r"MATCH \(n1 \{NAME:'(.+?)'\}\)-\[:(.+?)\]->\(n2\) RETURN n2\.NAME as (\w+)$")
+
+
+# 代替py2neo的Relationship，parse_result通过types()取关系名
+class Relation:
+    def __init__(self, relation_type):
+        self.relation_type = relation_type
+
+    def types(self):
+        return {self.relation_type}
+
+
+class QueryResult:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def data(self):
+        return self.rows
+
+
+# 读取"头 中间部分 尾"格式的三元组，与build_graph.py一致：同一个头的同一个关系/属性只保留最后一条
+def read_triplets(path):
+    triplets = defaultdict(dict)
+    with open(path, encoding="utf8") as f:
+        for line in f:
+            parts = line.strip().split(" ")
+            if len(parts) >= 3:
+                triplets[parts[0]][" ".join(parts[1:-1])] = parts[-1]
+    return triplets
+
+
+class MemoryGraph:
+    def __init__(self, relation_path="triplets_head_rel_tail.txt", attribute_path="triplets_enti_attr_value.txt"):
+        self.attributes = read_triplets(attribute_path)     # 实体 -> {属性: 值}
+        self.out_edges = read_triplets(relation_path)       # 头实体 -> {关系: 尾实体}
+        # 多个头实体可以通过同一个关系指向同一个尾实体（如多家公司总部位于北京），所以保存列表
+        self.in_edges = defaultdict(list)                   # 尾实体 -> [(关系, 头实体)]
+        for head, relations in self.out_edges.items():
+            for relation, tail in relations.items():
+                self.in_edges[tail].append((relation, head))
+        # 与build_graph.py一致，每个实体都有NAME属性
+        for entity in set(self.attributes) | set(self.out_edges) | set(self.in_edges):
+            self.attributes[entity]["NAME"] = entity
+
+    def run(self, cypher):
+        cypher = " ".join(cypher.split())
+        for pattern, search in ((ATTRIBUTE_QUERY, self.match_attribute),
+                                (RELATION_QUERY, self.match_relation),
+                                (TAIL_QUERY, self.match_tail)):
+            match = pattern.match(cypher)
+            if match:
+                return QueryResult(search(*match.groups()))
+        raise ValueError("不支持的cypher查询：%s" % cypher)
+
+    # 与neo4j一致：实体存在但没有该属性时返回null
+    def match_attribute(self, entity, attribute, alias):
+        if entity not in self.attributes:
+            return []
+        return [{alias: self.attributes[entity].get(attribute)}]
+
+    # 无方向的关系匹配，两个方向的关系都返回
+    def match_relation(self, entity1, entity2, alias):
+        rows = [{alias: Relation(r)} for r, tail in self.out_edges.get(entity1, {}).items() if tail == entity2]
+        rows += [{alias: Relation(r)} for r, head in self.in_edges.get(entity1, []) if head == entity2]
+        return rows
+
+    def match_tail(self, entity, relation, alias):
+        tail = self.out_edges.get(entity, {}).get(relation)
+        return [] if tail is None else [{alias: tail}]
@@ -13,15 +13,167 @@
 
 import json
 import pandas as pd
+import numpy as np
 import re
 import os
+from collections import defaultdict
 
-class DialogueSystem:
+
+class IntentIndex:
+    '''
+    意图样例的倒排索引：加载场景时把每条intent样例的字集合和大小预先算好，
+    按节点分别建立 字 -> [样例下标]，每轮只查询可访问节点的倒排表，
+    只对和query有共同字的样例计算jaccard，耗时与候选节点的样例数有关，与整个知识库的大小无关
+    '''
+    def __init__(self):
+        self.node_index = {}       #节点 -> {字: [样例下标]}
+        self.sentence_sizes = {}   #节点 -> 每条样例的字集合大小
+
+    def add(self, node, sentences):
+        self.sentence_sizes[node] = [len(set(sentence)) for sentence in sentences]
+        char_index = defaultdict(list)
+        for i, sentence in enumerate(sentences):
+            for char in set(sentence):
+                char_index[char].append(i)
+        self.node_index[node] = dict(char_index)
+
+    def node_scores(self, query, nodes):
+        #返回每个节点的最高jaccard得分，没有共同字的样例得分为0，没有样例的节点为-1
+        query_chars = set(query)
+        return {node: self.node_score(query_chars, node) for node in nodes}
+
+    def node_score(self, query_chars, node):
+        sizes = self.sentence_sizes.get(node)
+        if not sizes:
+            return -1
+        char_index = self.node_index[node]
+        intersections = defaultdict(int)
+        for char in query_chars:
+            for i in char_index.get(char, []):
+                intersections[i] += 1
+        return max([intersection / (len(query_chars) + sizes[i] - intersection)
+                    for i, intersection in intersections.items()], default=0)
+
+
+class EmbeddingIntentScorer:
+    '''
+    基于向量的意图打分：encode把一组文本编码为(n, dim)的向量，
+    加载时所有intent样例编码一次并归一化，缓存为一个矩阵，每轮只需编码query并做一次矩阵乘法
+    '''
+    def __init__(self, encode):
+        self.encode = encode
+        self.nodes = []
+        self.sentences = []
+        self.matrix = None
+
+    def add(self, node, sentences):
+        self.nodes += [node] * len(sentences)
+        self.sentences += list(sentences)
+        self.matrix = None
+
+    def build(self):
+        vectors = np.asarray(self.encode(self.sentences), dtype=np.float32)
+        self.matrix = vectors / (np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-8)
+        self.node_rows = defaultdict(list)   #节点 -> 该节点的样例在矩阵中的行号
+        for row, node in enumerate(self.nodes):
+            self.node_rows[node].append(row)
+
+    def node_scores(self, query, nodes):
+        if self.matrix is None:
+            self.build()
+        vector = np.asarray(self.encode([query]), dtype=np.float32)[0]
+        similarity = self.matrix @ (vector / (np.linalg.norm(vector) + 1e-8))
+        return {node: float(similarity[self.node_rows[node]].max()) if self.node_rows.get(node) else -1
+                for node in nodes}
+
+
+class AhoCorasick:
+    '''
+    多模式串匹配自动机：一次扫描query即可找出所有出现的模式串
+    每个模式串带一个标记payload，匹配结果为(起始位置, payload)
+    '''
+    def __init__(self):
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]   #每个状态结束的模式串：(长度, payload)
+
+    def add(self, word, payload):
+        state = 0
+        for char in word:
+            if char not in self.goto[state]:
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append([])
+                self.goto[state][char] = len(self.goto) - 1
+            state = self.goto[state][char]
+        self.output[state].append((len(word), payload))
+
+    def build(self):
+        #按层次遍历计算失配指针，并把失配状态的输出合并进来
+        queue = list(self.goto[0].values())
+        for state in queue:
+            for char, next_state in self.goto[state].items():
+                fail = self.fail[state]
+                while fail and char not in self.goto[fail]:
+                    fail = self.fail[fail]
+                self.fail[next_state] = self.goto[fail].get(char, 0)
+                self.output[next_state] = self.output[next_state] + self.output[self.fail[next_state]]
+                queue.append(next_state)
+
+    def search(self, text):
+        state = 0
+        for end, char in enumerate(text):
+            while state and char not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(char, 0)
+            for length, payload in self.output[state]:
+                yield end - length + 1, payload
+
+
+class SlotMatcher:
+    '''
+    槽位值匹配：加载模板时编译一次
+    纯文本的可选值（如 长袖|短袖|半截袖）全部放进一个AC自动机，一次扫描query得到所有槽位的命中；
+    含正则语法的值（如 [0-9]{1,2}）预编译为正则
+    结果与逐个re.search一致：取最靠左的命中，同一位置取可选值中排在前面的
+    '''
     def __init__(self):
+        self.automaton = AhoCorasick()
+        self.patterns = {}
+
+    def add(self, slot, values):
+        alternatives = values.split('|')
+        if all(alternative and re.escape(alternative) == alternative for alternative in alternatives):
+            for order, alternative in enumerate(alternatives):
+                self.automaton.add(alternative, (slot, order, alternative))
+        else:
+            self.patterns[slot] = re.compile(values)
+
+    def build(self):
+        self.automaton.build()
+
+    def search(self, query):
+        best = {}
+        for start, (slot, order, value) in self.automaton.search(query):
+            if slot not in best or (start, order) < best[slot][:2]:
+                best[slot] = (start, order, value)
+        hits = {slot: value for slot, (_, _, value) in best.items()}
+        for slot, pattern in self.patterns.items():
+            match = pattern.search(query)
+            if match:
+                hits[slot] = match.group()
+        return hits
+
+
+class DialogueSystem:
+    def __init__(self, encode=None):
+        #encode为空时使用字的jaccard相似度打分，否则使用向量相似度打分
+        self.encode = encode
         self.load()
     
     def load(self):
         self.all_node_info = {}
+        self.intent_index = IntentIndex() if self.encode is None else EmbeddingIntentScorer(self.encode)
         self.load_scenario("scenario/scenario-买衣服.json")
         self.load_scenario("scenario/scenario-看电影.json")
         self.load_slot_templet("scenario/slot_fitting_templet.xlsx")
@@ -35,21 +187,23 @@ class DialogueSystem:
             self.all_node_info[scenario_name + "_" + node['id']] = node
             if "childnode" in node:
                 self.all_node_info[scenario_name + "_" + node['id']]['childnode'] = [scenario_name + "_" + x for x in node['childnode']]
+            self.intent_index.add(scenario_name + "_" + node['id'], node.get('intent', []))
             
 
     def load_slot_templet(self, file):
         self.slot_templet = pd.read_excel(file)
         #三列：slot, query, values
         self.slot_info = {}
-        #逐行读取，slot为key，query和values为value
-        for i in range(len(self.slot_templet)):
-            slot = self.slot_templet.iloc[i]['slot']
-            query = self.slot_templet.iloc[i]['query']
-            values = self.slot_templet.iloc[i]['values']
+        self.slot_matcher = SlotMatcher()
+        #逐行读取，slot为key，query和values为value，之后把values编译进slot_matcher
+        for slot, query, values in self.slot_templet[['slot', 'query', 'values']].itertuples(index=False):
             if slot not in self.slot_info:
                 self.slot_info[slot] = {}
             self.slot_info[slot]['query'] = query
             self.slot_info[slot]['values'] = values
+        for slot, info in self.slot_info.items():
+            self.slot_matcher.add(slot, str(info['values']))
+        self.slot_matcher.build()
       
     def nlu(self, memory):
         memory = self.intent_judge(memory)
@@ -61,8 +215,10 @@ class DialogueSystem:
         query = memory['query']
         max_score = -1
         hit_node = None
+        #只对和query有共同字的intent样例打分
+        scores = self.intent_index.node_scores(query, memory["available_nodes"])
         for node in memory["available_nodes"]:
-            score = self.calucate_node_score(query, node)
+            score = scores[node]
             if score > max_score:
                 max_score = score
                 hit_node = node
@@ -71,17 +227,6 @@ class DialogueSystem:
         return memory
 
 
-    def calucate_node_score(self, query, node):
-        #节点意图打分，算和intent相似度
-        node_info = self.all_node_info[node]
-        intent = node_info['intent']
-        max_score = -1
-        for sentence in intent:
-            score = self.calucate_sentence_score(query, sentence)
-            if score > max_score:
-                max_score = score
-        return max_score
-    
     def calucate_sentence_score(self, query, sentence):
         #两个字符串做文本相似度计算。jaccard距离计算相似度
         query_words = set(query)
@@ -95,12 +240,11 @@ class DialogueSystem:
         #槽位填充
         hit_node = memory["hit_node"]
         node_info = self.all_node_info[hit_node]
-        query = memory['query']
+        #一次扫描query得到所有槽位的命中
+        slot_hits = self.slot_matcher.search(memory['query'])
         for slot in node_info.get('slot', []):
-            if slot not in memory:
-                slot_values = self.slot_info[slot]["values"]
-                if re.search(slot_values, query):
-                    memory[slot] = re.search(slot_values, query).group()
+            if slot not in memory and slot in slot_hits:
+                memory[slot] = slot_hits[slot]
         return memory
 
     def dst(self, memory):
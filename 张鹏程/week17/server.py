@@ -0,0 +1,128 @@
+'''
+多会话对话服务
+1.所有会话共用一个加载好的DialogueSystem（场景节点、槽位模板只读）
+2.每个会话的memory保存在SessionStore中，超过容量淘汰最久未使用的会话，超过ttl未访问的会话过期
+3.基于asyncio的TCP服务，每行一个json请求：{"session_id": ..., "query": ...}，返回{"response": ...}，出错时返回{"error": ...}
+4.压测：模拟大量并发会话，统计每秒处理的轮数和延迟分位数
+'''
+
+import json
+import time
+import random
+import asyncio
+import numpy as np
+from collections import OrderedDict
+from dl import DialogueSystem
+
+START_NODES = ["scenario-买衣服_node1", "scenario-看电影_node1"]
+
+
+class SessionStore:
+    def __init__(self, max_sessions=10000, ttl=1800):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.sessions = OrderedDict()   #session_id -> (最后访问时间, memory)，按访问时间排序
+
+    def get(self, session_id):
+        now = time.monotonic()
+        self.evict_expired(now)
+        if session_id in self.sessions:
+            _, memory = self.sessions.pop(session_id)
+        else:
+            memory = {}
+        #新会话，或者上一段对话已经走到叶子节点（没有可用节点），从起始节点重新开始
+        if not memory.get("available_nodes"):
+            memory.clear()
+            memory["available_nodes"] = list(START_NODES)
+        self.sessions[session_id] = (now, memory)
+        while len(self.sessions) > self.max_sessions:
+            self.sessions.popitem(last=False)
+        return memory
+
+    def evict_expired(self, now):
+        #最久未访问的会话在最前面，遇到未过期的就停止
+        while self.sessions:
+            last_time, _ = next(iter(self.sessions.values()))
+            if now - last_time <= self.ttl:
+                break
+            self.sessions.popitem(last=False)
+
+    def __len__(self):
+        return len(self.sessions)
+
+
+class DialogueServer:
+    def __init__(self, dialogue_system, session_store):
+        self.ds = dialogue_system
+        self.store = session_store
+
+    def handle(self, session_id, query):
+        #run是纯cpu计算，不会让出事件循环，同一会话的轮次天然串行
+        memory = self.ds.run(query, self.store.get(session_id))
+        return memory["response"]
+
+    async def handle_connection(self, reader, writer):
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            #单个请求出错（json格式错误、缺少字段等）只返回错误信息，不断开连接
+            try:
+                request = json.loads(line)
+                reply = {"response": self.handle(request["session_id"], request["query"])}
+            except Exception as e:
+                reply = {"error": "%s: %s" % (type(e).__name__, e)}
+            writer.write((json.dumps(reply, ensure_ascii=False) + "\n").encode("utf-8"))
+            await writer.drain()
+        writer.close()
+
+    async def serve(self, host="127.0.0.1", port=8765):
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        async with server:
+            await server.serve_forever()
+
+
+async def client_session(host, port, session_id, queries, latencies):
+    reader, writer = await asyncio.open_connection(host, port)
+    for query in queries:
+        start = time.perf_counter()
+        request = {"session_id": session_id, "query": query}
+        writer.write((json.dumps(request, ensure_ascii=False) + "\n").encode("utf-8"))
+        await writer.drain()
+        await reader.readline()
+        latencies.append(time.perf_counter() - start)
+    writer.close()
+
+
+async def load_test(host, port, num_sessions=1000, turns=6, concurrency=200):
+    #每个会话随机选一段对话脚本，最多同时保持concurrency个连接
+    scripts = [["我要看电影", "流浪地球", "8点", "来个爆米花"],
+               ["我要买衣服", "长袖", "红色", "xl", "支付宝", "6期"]]
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one_session(i):
+        async with semaphore:
+            queries = random.choice(scripts)[:turns]
+            await client_session(host, port, "session_%d" % i, queries, latencies)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[one_session(i) for i in range(num_sessions)])
+    cost = time.perf_counter() - start
+    p50, p90, p99 = np.percentile(latencies, [50, 90, 99]) * 1000
+    print("会话数：%d，轮数：%d，耗时：%.2fs，每秒%.1f轮" % (num_sessions, len(latencies), cost, len(latencies) / cost))
+    print("延迟：p50=%.2fms，p90=%.2fms，p99=%.2fms" % (p50, p90, p99))
+
+
+async def main(host="127.0.0.1", port=8765):
+    server = DialogueServer(DialogueSystem(), SessionStore(max_sessions=10000, ttl=1800))
+    server_task = asyncio.create_task(server.serve(host, port))
+    await asyncio.sleep(0.1)
+    await load_test(host, port)
+    print("当前保存的会话数：%d" % len(server.store))
+    server_task.cancel()
+
+
+if __name__ == '__main__':
+    #只启动服务：asyncio.run(DialogueServer(DialogueSystem(), SessionStore()).serve())
+    asyncio.run(main())
@@ -50,6 +50,90 @@ def all_cut(sentence, Dict):
     return cut_result
 
 
+# 前缀树的词尾标记，放在节点字典中，不会和单个汉字冲突
+TRIE_END = ""
+
+
+# 将词典构建为前缀树，只需构建一次，查询代价只和词长有关，与词典大小无关
+def build_trie(Dict):
+    trie = {}
+    for word in Dict:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[TRIE_END] = True
+    return trie
+
+
+# 从start位置出发，沿前缀树匹配出所有在词典中的词，返回这些词的结束位置
+def trie_match(sentence, start, trie):
+    ends = []
+    node = trie
+    for i in range(start, len(sentence)):
+        node = node.get(sentence[i])
+        if node is None:
+            break
+        if TRIE_END in node:
+            ends.append(i + 1)
+    return ends
+
+
+# 预先计算每个位置能走到的下一个位置，并剔除无法走到句尾的分支，避免生成时反复试错
+def build_cut_graph(sentence, trie):
+    sent_len = len(sentence)
+    edges = [trie_match(sentence, i, trie) for i in range(sent_len)]
+    # reachable[i]表示从位置i出发能否切分到句尾
+    reachable = [False] * (sent_len + 1)
+    reachable[sent_len] = True
+    for i in range(sent_len - 1, -1, -1):
+        edges[i] = [end for end in edges[i] if reachable[end]]
+        reachable[i] = len(edges[i]) > 0
+    return edges, reachable[0]
+
+
+# 生成器模式：按深度优先逐个产出切分结果，内存只和句子长度有关
+def iter_all_cut(sentence, trie):
+    edges, ok = build_cut_graph(sentence, trie)
+    if not ok:
+        return
+    sent_len = len(sentence)
+    if sent_len == 0:
+        yield []
+        return
+    path = []
+    # 栈中保存(当前位置, 下一条待尝试的边的下标)
+    stack = [(0, 0)]
+    while stack:
+        pos, idx = stack.pop()
+        if idx >= len(edges[pos]):
+            # 该位置的分支已经全部尝试，回溯
+            if path:
+                path.pop()
+            continue
+        stack.append((pos, idx + 1))
+        end = edges[pos][idx]
+        path.append(sentence[pos:end])
+        if end == sent_len:
+            yield list(path)
+            path.pop()
+        else:
+            stack.append((end, 0))
+
+
+# 计数模式：只用动态规划统计切分方式的数量，不生成具体结果
+def count_all_cut(sentence, trie):
+    sent_len = len(sentence)
+    # count[i]表示前i个字的切分方式数量
+    count = [0] * (sent_len + 1)
+    count[0] = 1
+    for i in range(sent_len):
+        if count[i] == 0:
+            continue
+        for end in trie_match(sentence, i, trie):
+            count[end] += count[i]
+    return count[sent_len]
+
+
 def main():
     sentence = "经常有意见分歧"
     cut_result = all_cut(sentence, Dict)
@@ -58,6 +142,12 @@ def main():
     for i, v in enumerate(target):
         print(f"{i + 1}:{v}")
 
+    # 使用前缀树逐个生成切分结果，并用动态规划统计数量
+    trie = build_trie(Dict)
+    for i, v in enumerate(iter_all_cut(sentence, trie)):
+        print(f"{i + 1}:{v}")
+    print("切分方式数量：", count_all_cut(sentence, trie))
+
 
 if __name__ == "__main__":
     main()
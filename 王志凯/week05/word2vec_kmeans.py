@@ -4,7 +4,7 @@
 """
 
 from gensim.models import Word2Vec
-from sklearn.cluster import KMeans
+from sklearn.cluster import KMeans, MiniBatchKMeans
 from collections import defaultdict
 import numpy as np
 import re
@@ -59,51 +59,108 @@ class KMeansCluster():
         self.centers = kmeans.cluster_centers_
 
 
-# 将文本转化为向量
-def sentences_to_vectors(model, sentences_words):
-    sentences_vectors = defaultdict(list)
-    for sentence, words in sentences_words.items():
-        vectors = []
-        for word in words:
-            try:
-                vectors.append(model.wv[word])
-            except KeyError:
-                # 未出现的词用全0向量代替（不贡献文本向量）
-                vectors.append(np.zeros(model.vector_size))
-        # 文本中所有词向量加和求平均得到该文本向量
-        sentences_vectors[sentence] = list(np.array(vectors).mean(axis=0))
-    return sentences_vectors
+# 使用MiniBatchKMeans分批聚类，语料无法一次放入内存时可通过partial_fit流式训练
+class MiniBatchKMeansCluster():
+    def __init__(self, n_clusters, batch_size=4096):
+        self.n_clusters = n_clusters
+        self.kmeans = MiniBatchKMeans(n_clusters, batch_size=batch_size)
+
+    def partial_fit(self, vectors):
+        self.kmeans.partial_fit(vectors)
+
+    def predict(self, vectors):
+        return self.kmeans.predict(vectors)
+
+    @property
+    def centers(self):
+        return self.kmeans.cluster_centers_.astype(np.float32)
+
+
+# 将一批分好词的文本转化为连续的float32矩阵，每行是一个文本向量
+def words_to_matrix(model, words_list):
+    matrix = np.zeros((len(words_list), model.vector_size), dtype=np.float32)
+    for row, words in enumerate(words_list):
+        if not words:
+            continue
+        # 未出现的词用全0向量代替，只对词表内的词求和，再除以总词数
+        known = [word for word in words if word in model.wv.key_to_index]
+        if known:
+            matrix[row] = model.wv[known].sum(axis=0) / len(words)
+    return matrix
+
+
+# 将所有文本转化为一个float32矩阵，返回文本列表和对应的矩阵
+def sentences_to_matrix(model, sentences_words):
+    sentences = list(sentences_words.keys())
+    return sentences, words_to_matrix(model, list(sentences_words.values()))
+
 
+# 一次性计算所有样本到所属质心的欧式距离
+def distances_to_centers(matrix, labels, centers):
+    centers = np.asarray(centers, dtype=np.float32)
+    diff = matrix - centers[labels]
+    return np.sqrt(np.einsum("ij,ij->i", diff, diff))
 
-def samples_sort(sentences_vectors, labels, centers, sort_type=0):
+
+# 对聚类后的样本按簇排序，sentences与matrix的行一一对应
+def samples_sort_batched(sentences, matrix, labels, centers, sort_type=0):
+    labels = np.asarray(labels)
     labels_sentences = defaultdict(list)
-    labels_vectors = defaultdict(list)
-    for sent, vector, centroid_idx in zip(sentences_vectors.keys(), sentences_vectors.values(), labels):
+    for sent, centroid_idx in zip(sentences, labels.tolist()):
         labels_sentences[centroid_idx].append(sent)
-        labels_vectors[centroid_idx].append(vector)
 
     if sort_type == 0:
         # 按样本数降序排序
         return {k: v for k, v in sorted(labels_sentences.items(), key=lambda x: len(x[1]), reverse=True)}
     elif sort_type == 1:
         # 按样本到质心的平均距离升序排序
-        labels_mean_dis = defaultdict(float)
-        for i, centroid in enumerate(centers):
-            vectors = labels_vectors[i]
-            # 所有样本到质心的距离
-            distance = 0
-            for vector in vectors:
-                # 单个样本到质心的距离（欧式距离）
-                dis = 0
-                # 分别计算每一个维度的距离
-                for dim in range(len(vector)):
-                    dis += (vector[dim] - centroid[dim]) ** 2
-                distance += dis ** 0.5
-            labels_mean_dis[i] = distance / len(vectors)
-        # 根据labels_mean_dis中值的大小对labels_sentences进行排序
+        n_clusters = len(centers)
+        distance = np.bincount(labels, weights=distances_to_centers(matrix, labels, centers), minlength=n_clusters)
+        count = np.bincount(labels, minlength=n_clusters)
+        labels_mean_dis = distance / np.maximum(count, 1)
         return {k: labels_sentences[k] for k in sorted(labels_sentences, key=lambda x: labels_mean_dis[x])}
 
 
+# 分批读取语料并分词，每次产出一批(文本列表, 分词列表)
+def iter_corpus_batches(corpus_path, batch_size=10000):
+    sentences, words_list = [], []
+    with open(corpus_path, encoding="utf8") as f:
+        for line in f:
+            sentence = line.strip()
+            sentences.append(sentence)
+            words_list.append(jieba.lcut(sentence))
+            if len(sentences) == batch_size:
+                yield sentences, words_list
+                sentences, words_list = [], []
+    if sentences:
+        yield sentences, words_list
+
+
+# 流式聚类与排序：第一遍分批训练MiniBatchKMeans，第二遍分批预测并累加簇内距离，
+# 只保留文本本身，不保留文本向量
+def stream_cluster_sort(model, corpus_path, n_clusters, sort_type=0, batch_size=10000):
+    cluster = MiniBatchKMeansCluster(n_clusters, batch_size=batch_size)
+    for _, words_list in iter_corpus_batches(corpus_path, batch_size):
+        cluster.partial_fit(words_to_matrix(model, words_list))
+    centers = cluster.centers
+
+    labels_sentences = defaultdict(list)
+    distance = np.zeros(n_clusters, dtype=np.float64)
+    count = np.zeros(n_clusters, dtype=np.int64)
+    for sentences, words_list in iter_corpus_batches(corpus_path, batch_size):
+        matrix = words_to_matrix(model, words_list)
+        labels = cluster.predict(matrix)
+        distance += np.bincount(labels, weights=distances_to_centers(matrix, labels, centers), minlength=n_clusters)
+        count += np.bincount(labels, minlength=n_clusters)
+        for sent, centroid_idx in zip(sentences, labels.tolist()):
+            labels_sentences[centroid_idx].append(sent)
+
+    if sort_type == 0:
+        return {k: v for k, v in sorted(labels_sentences.items(), key=lambda x: len(x[1]), reverse=True)}
+    labels_mean_dis = distance / np.maximum(count, 1)
+    return {k: labels_sentences[k] for k in sorted(labels_sentences, key=lambda x: labels_mean_dis[x])}
+
+
 if __name__ == "__main__":
     word2vec = Word2VecModel("titles.txt")
     # 如果已经训练过模型，则将train=False，只需要加载模型
@@ -111,18 +168,21 @@ if __name__ == "__main__":
     model = word2vec.model
     # 文本对应文本分词
     sentences_words = word2vec.sentences_words
-    # 文本对应文本向量
-    sentences_vectors = sentences_to_vectors(model, sentences_words)
+    # 文本列表及其对应的float32文本向量矩阵（每行一个文本）
+    sentences, matrix = sentences_to_matrix(model, sentences_words)
 
     # 分簇（簇类数量=样本数开方）
-    n_clusters = int(math.sqrt(len(sentences_vectors)))
-    kmeans = KMeansCluster(list(sentences_vectors.values()), n_clusters)
+    n_clusters = int(math.sqrt(len(sentences)))
+    kmeans = KMeansCluster(matrix, n_clusters)
     labels = kmeans.labels  # 所有样本标签（每个样本所属的质心索引）
     centers = kmeans.centers  # 所有质心的坐标（向量）
 
     # sort_type=0:按照簇内样本数降序排序
     # sort_type=1:按照簇内所有样本到质心的平均距离升序排序
-    label_sentences = samples_sort(sentences_vectors, labels, centers, sort_type=1)
+    label_sentences = samples_sort_batched(sentences, matrix, labels, centers, sort_type=1)
+
+    # 语料无法一次放入内存时，使用MiniBatchKMeans分批聚类并排序
+    # label_sentences = stream_cluster_sort(model, "titles.txt", n_clusters, sort_type=1)
     for label, sentences in label_sentences.items():
         print(f"簇编号：{label}")
         count = 10 if len(sentences) > 10 else len(sentences)
@@ -6,7 +6,10 @@ Config = {
     "train_data_path": "./data/train_data.csv",
     "model_path": "./model",
     "log_path": "./logs",
+    "cache_path": "./data/cache",
+    "use_cache": True,
     "save_model": True,
+    "quantize_model_name": "bert_1",   # quantize.py要量化的模型（model_path下的模型名称）
     "model_type": "bert",
     "num_layers": 1,
     "bidirectional": False,
@@ -18,5 +21,10 @@ Config = {
     "learning_rate": 1e-3,
     "max_length": 30,
     "class_num": 2,
-    "pooling_type": "avg"
+    "pooling_type": "avg",
+    "sweep_path": "./model/sweep",
+    "sweep_workers": 0,
+    "sweep_threads_per_worker": 2,
+    "sweep_eta": 2,
+    "sweep_min_epoch": 1
 }
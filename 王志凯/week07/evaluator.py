@@ -17,6 +17,7 @@ class Evaluator:
         self.model = model
         self.efficiency = 0
         self.correct_percent = 0
+        self.accuracy = 0
 
     def predict(self):
         print(f"===使用模型{self.config["model_name"]}开始预测===")
@@ -42,9 +43,10 @@ class Evaluator:
         self.efficiency = f"{np.mean(execution_time_avg[:-1]):.6f}"
         print(f"每百条预测耗时：{self.efficiency}")
         # 计算正确率
-        self.correct_percent = f"{correct / (correct + wrong):.4%}"
+        self.accuracy = correct / (correct + wrong)
+        self.correct_percent = f"{self.accuracy:.4%}"
         print(f"预测准确率：{self.correct_percent}")
-        self.model_config()
+        return self.model_config()
 
     # 整理出模型参数和训练结果
     def model_config(self):
@@ -60,6 +62,7 @@ class Evaluator:
         model_test_info["efficiency"] = self.efficiency
         model_test_info["correct_percent"] = self.correct_percent
         logger.info(model_test_info)
+        return model_test_info
 
 
 
@@ -4,15 +4,23 @@
 loader主要任务：加载数据、处理数据、数据封装
 """
 
+import os
+import shutil
+import tempfile
+import hashlib
+import json
 import torch
+import numpy as np
 import pandas as pd
 from torch.utils.data import Dataset, DataLoader
-from transformers import BertTokenizer
+from transformers import BertTokenizer, BertTokenizerFast
 from config import Config
 from logHandler import logger
 
 logger = logger()
 tokenizer = BertTokenizer.from_pretrained(Config["pretrain_model_path"])
+# 构建缓存时使用fast tokenizer批量编码，首次用到时再加载
+fast_tokenizer = None
 
 
 class DataGenerator(Dataset):
@@ -23,7 +31,25 @@ class DataGenerator(Dataset):
         self.max_length = config["max_length"]
         self.total_rows = 0
         self.data = []
-        self.load(data_type)
+        # 使用缓存时，数据以内存映射的numpy数组保存，按行下标取出
+        self.cache = None
+        self.start = 0
+        self.end = 0
+        if config.get("use_cache", False):
+            self.load_from_cache(data_type)
+        else:
+            self.load(data_type)
+
+    def load_from_cache(self, data_type):
+        logger.info("开始从缓存加载数据")
+        self.cache = load_token_cache(self.config)
+        self.total_rows = len(self.cache["labels"])
+        # 与load保持相同的划分方式：训练数据取前80%，测试数据取后20%
+        if data_type == "train":
+            self.start, self.end = 0, int(self.total_rows * 0.8)
+        else:
+            self.start, self.end = self.total_rows - int(self.total_rows * 0.2), self.total_rows
+        logger.info(f"缓存数据加载完成，总行数：{self.total_rows}")
 
     def load(self, data_type):
         logger.info("开始加载数据")
@@ -46,11 +72,28 @@ class DataGenerator(Dataset):
         logger.info(f"数据加载完成，总行数：{self.total_rows}")
 
     def __len__(self):
+        if self.cache is not None:
+            return self.end - self.start
         return len(self.data)
 
     def __getitem__(self, index):
+        if self.cache is not None:
+            return self.cached_item(self.start + index)
         return self.data[index]
 
+    # 从内存映射数组中取出一行，还原成与padding()相同的形状
+    def cached_item(self, row):
+        input_ids = torch.from_numpy(self.cache["input_ids"][row].astype(np.int64)).unsqueeze(0)
+        label = torch.LongTensor([int(self.cache["labels"][row])])
+        if self.config["model_type"] == "bert":
+            attention_mask = torch.from_numpy(self.cache["attention_mask"][row].astype(np.int64)).unsqueeze(0)
+            sequence = {"input_ids": input_ids,
+                        "token_type_ids": torch.zeros_like(input_ids),
+                        "attention_mask": attention_mask}
+        else:
+            sequence = input_ids
+        return [sequence, label]
+
 
 # 将文本转化为序列
 def padding(model_type, max_len, data):
@@ -74,6 +117,87 @@ def padding(model_type, max_len, data):
     return sequence
 
 
+# 计算数据文件的内容哈希，文件内容变化后缓存自动失效
+def file_hash(path, block_size=1 << 20):
+    md5 = hashlib.md5()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            md5.update(block)
+    return md5.hexdigest()
+
+
+# 缓存键：(数据文件哈希, tokenizer, max_length, model_type)
+def token_cache_key(config):
+    key = {
+        "data_hash": file_hash(config["train_data_path"]),
+        "tokenizer": os.path.abspath(config["pretrain_model_path"]),
+        "vocab_size": len(tokenizer),
+        "max_length": config["max_length"],
+        # 只有bert需要cls和sep，其余模型编码结果相同
+        "model_type": "bert" if config["model_type"] == "bert" else "plain",
+    }
+    return hashlib.md5(json.dumps(key, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+# 使用fast tokenizer一次编码整批文本，结果与padding()逐条编码一致
+def batch_encode(model_type, max_len, texts):
+    global fast_tokenizer
+    if fast_tokenizer is None:
+        fast_tokenizer = BertTokenizerFast.from_pretrained(Config["pretrain_model_path"])
+    texts = [str(text)[:max_len] for text in texts]
+    encoded = fast_tokenizer(texts,
+                             padding='max_length',
+                             truncation=True,
+                             max_length=max_len,
+                             add_special_tokens=(model_type == "bert"),
+                             return_attention_mask=True,
+                             return_token_type_ids=False,
+                             return_tensors="np")
+    return encoded["input_ids"].astype(np.int32), encoded["attention_mask"].astype(np.int32)
+
+
+# 编码整个数据文件并写入缓存目录，先写临时文件再重命名，避免中断后留下不完整的缓存
+def build_token_cache(config, cache_path, chunk_size=10000):
+    logger.info(f"开始构建tokenize缓存：{cache_path}")
+    # 每次构建使用独立的临时目录，多个进程同时构建同一份缓存时互不覆盖
+    tmp_path = tempfile.mkdtemp(prefix=os.path.basename(cache_path) + ".", dir=os.path.dirname(cache_path))
+    df = pd.read_csv(config["train_data_path"])
+    total_rows = df.shape[0]
+    max_len = config["max_length"]
+    input_ids = np.lib.format.open_memmap(os.path.join(tmp_path, "input_ids.npy"),
+                                          mode="w+", dtype=np.int32, shape=(total_rows, max_len))
+    attention_mask = np.lib.format.open_memmap(os.path.join(tmp_path, "attention_mask.npy"),
+                                               mode="w+", dtype=np.int32, shape=(total_rows, max_len))
+    for start in range(0, total_rows, chunk_size):
+        texts = df["review"].iloc[start:start + chunk_size].tolist()
+        ids, mask = batch_encode(config["model_type"], max_len, texts)
+        input_ids[start:start + len(texts)] = ids
+        attention_mask[start:start + len(texts)] = mask
+    input_ids.flush()
+    attention_mask.flush()
+    del input_ids, attention_mask
+    np.save(os.path.join(tmp_path, "labels.npy"), df["label"].to_numpy(dtype=np.int32))
+    try:
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        # 其他进程已经先构建完成，直接使用已有的缓存
+        if not os.path.exists(cache_path):
+            raise
+        shutil.rmtree(tmp_path)
+    logger.info(f"tokenize缓存构建完成，总行数：{total_rows}")
+
+
+# 加载tokenize缓存，不存在时先构建；数组以只读内存映射方式打开，多次运行之间共享
+def load_token_cache(config):
+    cache_dir = config.get("cache_path", "./data/cache")
+    cache_path = os.path.join(cache_dir, token_cache_key(config))
+    if not os.path.exists(cache_path):
+        os.makedirs(cache_dir, exist_ok=True)
+        build_token_cache(config, cache_path)
+    return {name: np.load(os.path.join(cache_path, name + ".npy"), mmap_mode="r")
+            for name in ["input_ids", "attention_mask", "labels"]}
+
+
 # 加载训练数据
 def load_train_data(config, shuffle=True):
     dg = DataGenerator(config)
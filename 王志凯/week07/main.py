@@ -30,21 +30,7 @@ def main(config):
     logger.info(f"====开始训练{config["model_name"]}模型====")
     print(f"====开始训练{config["model_name"]}模型====")
     start = time.time()
-    model.train()
-    for i in range(config["epoch"]):
-        watch_loss = []
-        for index, data in enumerate(batch_data):
-            if gpu_usable:
-                data = [d.cuda() for d in data]
-            batch_x, batch_y = data
-            loss = model(batch_x, batch_y)
-            loss.backward()
-            optim.step()
-            optim.zero_grad()
-            watch_loss.append(loss.item())
-        # 记录loss信息
-        logger.info(f"第{i+1}轮训练结束，该轮平均loss值为：{np.mean(watch_loss)}")
-        print(f"第{i+1}轮训练结束，该轮平均loss值为：{np.mean(watch_loss)}")
+    train_epochs(model, optim, batch_data, 0, config["epoch"])
     # 记录训练耗时
     execution_time = time.time() - start
     config["execution_time"] = execution_time
@@ -61,66 +47,94 @@ def main(config):
     # print(f"模型参数：{config}")
 
 
-if __name__ == "__main__":
-    vocab_size = load_vocab(Config["vocab_path"])
-    Config["vocab_size"] = vocab_size
-    # 使用不同的模型和超参数来训练，对比结果
-    model_type_list = ["bert"]
-    # model_type_list = ["LSTM", "RNN", "CNN", "bert"]
-    # model_type_list = ["fastText", "RNN", "CNN", "TextCNN", "RCNN", "LSTM", "bert", "bertRNN"]
-    num_layers_list = [1, 3]
-    bidirectional_list = [True, False]
-    lr_list = [1e-3, 1e-4]
-    batch_size_list = [20, 40]
-    hidden_size_list = [256, 512]
-    out_channels_list = [64, 128]
-    pooling_type_list = ["max", "avg"]
-    for model in model_type_list:
+# 训练第start_epoch到end_epoch轮（不含end_epoch），超参数搜索时可分多次接着训练
+def train_epochs(model, optim, batch_data, start_epoch, end_epoch):
+    model.train()
+    for i in range(start_epoch, end_epoch):
+        watch_loss = []
+        for index, data in enumerate(batch_data):
+            if gpu_usable:
+                data = [d.cuda() for d in data]
+            batch_x, batch_y = data
+            loss = model(batch_x, batch_y)
+            loss.backward()
+            optim.step()
+            optim.zero_grad()
+            watch_loss.append(loss.item())
+        # 记录loss信息
+        logger.info(f"第{i+1}轮训练结束，该轮平均loss值为：{np.mean(watch_loss)}")
+        print(f"第{i+1}轮训练结束，该轮平均loss值为：{np.mean(watch_loss)}")
+
+
+# 使用不同的模型和超参数来训练，对比结果
+model_type_list = ["bert"]
+# model_type_list = ["LSTM", "RNN", "CNN", "bert"]
+# model_type_list = ["fastText", "RNN", "CNN", "TextCNN", "RCNN", "LSTM", "bert", "bertRNN"]
+num_layers_list = [1, 3]
+bidirectional_list = [True, False]
+lr_list = [1e-3, 1e-4]
+batch_size_list = [20, 40]
+hidden_size_list = [256, 512]
+out_channels_list = [64, 128]
+pooling_type_list = ["max", "avg"]
+
+
+# 依次生成每组待对比的模型参数，每组都是一份独立的config
+def sweep_configs(base_config, model_types):
+    for model in model_types:
         count = 0
-        Config["model_type"] = model
+        config = dict(base_config)
+        config["model_type"] = model
         # 如果是普通的fastText模型，则只比较不同学习率和batch_size下的模型
         if model == "fastText":
             for lr in lr_list:
-                Config["learning_rate"] = lr
+                config["learning_rate"] = lr
                 for batch_size in batch_size_list:
                     count += 1
-                    Config["model_name"] = model + "_" + str(count)
-                    Config["batch_size"] = batch_size
-                    main(Config)
+                    config["model_name"] = model + "_" + str(count)
+                    config["batch_size"] = batch_size
+                    yield dict(config)
         # CNN，只比较feature_dim、hidden_size、out_channels
         elif model == "CNN":
             for hidden_size in hidden_size_list:
-                Config["hidden_size"] = hidden_size
+                config["hidden_size"] = hidden_size
                 for out_channels in out_channels_list:
-                    Config["out_channels"] = out_channels
+                    config["out_channels"] = out_channels
                     for pooling_type in pooling_type_list:
                         count += 1
-                        Config["model_name"] = model + "_" + str(count)
-                        Config["pooling_type"] = pooling_type
-                        main(Config)
+                        config["model_name"] = model + "_" + str(count)
+                        config["pooling_type"] = pooling_type
+                        yield dict(config)
         # TextCNN，只比较堆叠层数和out_channels
         elif model == "TextCNN":
             for num_layers in num_layers_list:
-                Config["num_layers"] = num_layers
+                config["num_layers"] = num_layers
                 for out_channels in out_channels_list:
                     count += 1
-                    Config["model_name"] = model + "_" + str(count)
-                    Config["out_channels"] = out_channels
-                    main(Config)
+                    config["model_name"] = model + "_" + str(count)
+                    config["out_channels"] = out_channels
+                    yield dict(config)
         # bert，只比较num_layers
         elif model == "bert":
             for num_layers in num_layers_list:
                 count += 1
-                Config["model_name"] = model + "_" + str(count)
-                Config["num_layers"] = num_layers
-                main(Config)
+                config["model_name"] = model + "_" + str(count)
+                config["num_layers"] = num_layers
+                yield dict(config)
         # 比较不同feature_dim、hidden_size和bidirectional下的模型
         elif model in ["RNN", "RCNN", "LSTM", "bertRNN"]:
             for hidden_size in hidden_size_list:
-                Config["hidden_size"] = hidden_size
+                config["hidden_size"] = hidden_size
                 for bidirectional in bidirectional_list:
                     count += 1
-                    Config["model_name"] = model + "_" + str(count)
-                    Config["bidirectional"] = bidirectional
-                    main(Config)
+                    config["model_name"] = model + "_" + str(count)
+                    config["bidirectional"] = bidirectional
+                    yield dict(config)
 
+
+if __name__ == "__main__":
+    vocab_size = load_vocab(Config["vocab_path"])
+    Config["vocab_size"] = vocab_size
+    # 按顺序逐个训练；多核机器上可使用sweep.py并行搜索
+    for model_config in sweep_configs(Config, model_type_list):
+        main(model_config)
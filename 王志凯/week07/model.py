@@ -47,9 +47,8 @@ class TorchModel(nn.Module):
         if model_type == "bert":
             self.isBert = True
             self.encoder = Bert(config)
-            bert = BertModel.from_pretrained(config["pretrain_model_path"], return_dict=False)
             # 如果是bert，后续的hidden_size改为bert的768
-            hidden_size = bert.config.hidden_size
+            hidden_size = self.encoder.bert.config.hidden_size
         if model_type == "bertRNN":
             self.encoder = BertRNN(config)
             if bidirectional:
@@ -136,23 +135,20 @@ class Bert(nn.Module):
     def __init__(self, config):
         super(Bert, self).__init__()
         self.num_layers = config["num_layers"]
-        # 需要返回transformer不同层数的隐藏状态
-        # 如果return_dict为False，self.bert(x)将返回元组类型，就必须将self.bert(x).hidden_states改为self.bert(x)[2]
-        self.bert = BertModel.from_pretrained(config["pretrain_model_path"], output_hidden_states=True,
+        # 只构建前num_layers层transformer，from_pretrained只加载这些层的权重，后面的层既不加载也不计算
+        # 最后一层的输出即原来hidden_states[num_layers]，不再需要output_hidden_states保留每一层的隐藏状态
+        self.bert = BertModel.from_pretrained(config["pretrain_model_path"], num_hidden_layers=self.num_layers,
                                               return_dict=True)
 
     def forward(self, x):
         """
-        self.bert(x)返回三个主要数据，分别last_hidden_state、pooler_output、hidden_states
-        hidden_states是元组类型，包含1个嵌入层的输出和12个transformer层的隐藏状态
-        hidden_states形状为（13，batch_size, max_len, hidden_size）
+        self.bert(x)返回last_hidden_state、pooler_output等
+        last_hidden_state为第num_layers层transformer的输出，形状为（batch_size, max_len, hidden_size）
         """
         outputs = self.bert(input_ids=x['input_ids'].squeeze(1),
                             attention_mask=x['attention_mask'].squeeze(1),
                             token_type_ids=x['token_type_ids'].squeeze(1))
-        hidden_states = outputs.hidden_states
-        # 获取指定层数的隐藏状态，然后取出cls
-        batch_token = hidden_states[self.num_layers]
+        batch_token = outputs.last_hidden_state
         return batch_token
 
 
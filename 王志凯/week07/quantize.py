@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+
+"""
+quantize任务：对训练好的模型做训练后动态int8量化（线性层和lstm的权重量化为int8，激活值在推理时动态量化；
+动态量化不支持nn.RNN，RNN/bertRNN模型中的rnn层保持浮点），
+对比量化前后的准确率、每百条预测耗时和模型大小，并保存量化后的模型；量化后的模型只能在CPU上推理
+"""
+
+import os
+import torch
+import torch.nn as nn
+from config import Config
+from logHandler import logger
+from loader import load_vocab
+from model import TorchModel
+from evaluator import Evaluator
+from main import sweep_configs
+
+logger = logger()
+
+
+def quantize_model(model):
+    return torch.ao.quantization.quantize_dynamic(model.cpu().eval(), {nn.Linear, nn.LSTM}, dtype=torch.qint8)
+
+
+# 量化后的权重只能加载到同样结构的量化模型中：先创建模型并量化，再加载权重
+def load_quantized_model(config, quantized_model_path):
+    model = quantize_model(TorchModel(config))
+    # 量化lstm的权重以ScriptObject保存，需要weights_only=False（只加载自己导出的文件）
+    model.load_state_dict(torch.load(quantized_model_path, weights_only=False))
+    return model
+
+
+def main(config):
+    model_path = os.path.join(config["model_path"], config["model_name"] + ".pth")
+    quantized_model_path = os.path.join(config["model_path"], config["model_name"] + "_int8.pth")
+    model = TorchModel(config)
+    model.load_state_dict(torch.load(model_path, map_location="cpu"))
+    evaluator = Evaluator(config, model)
+    evaluator.predict()
+
+    quantized_model = quantize_model(model)
+    quantized_evaluator = Evaluator(config, quantized_model)
+    quantized_evaluator.predict()
+    torch.save(quantized_model.state_dict(), quantized_model_path)
+
+    size = os.path.getsize(model_path) / 1024 / 1024
+    quantized_size = os.path.getsize(quantized_model_path) / 1024 / 1024
+    result = (f"{config['model_name']}量化前：准确率{evaluator.correct_percent}，每百条预测耗时{evaluator.efficiency}，"
+              f"模型大小{size:.1f}MB；量化后：准确率{quantized_evaluator.correct_percent}"
+              f"（变化{quantized_evaluator.accuracy - evaluator.accuracy:+.4%}），"
+              f"每百条预测耗时{quantized_evaluator.efficiency}，模型大小{quantized_size:.1f}MB")
+    logger.info(result)
+    print(result)
+
+
+if __name__ == "__main__":
+    Config["vocab_size"] = load_vocab(Config["vocab_path"])
+    # 模型结构由训练时的超参数决定，按模型名称从main.py的参数组合中找回对应的config
+    model_type = Config["quantize_model_name"].rsplit("_", 1)[0]
+    main(next(config for config in sweep_configs(Config, [model_type])
+              if config["model_name"] == Config["quantize_model_name"]))
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+
+"""
+sweep任务：多进程并行搜索超参数，使用successive halving提前淘汰效果差的参数组合，最后汇总成一张结果表
+"""
+
+import os
+import json
+import math
+import time
+import hashlib
+import torch
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from config import Config
+from logHandler import logger
+from loader import load_train_data, load_vocab, load_token_cache
+from model import TorchModel
+from evaluator import Evaluator
+from main import train_epochs, sweep_configs, model_type_list, gpu_usable
+
+logger = logger()
+
+
+# 每个工作进程启动时限制torch线程数，避免多个进程抢占同一批CPU核
+def init_worker(num_threads):
+    torch.set_num_threads(num_threads)
+    torch.set_num_interop_threads(1)
+
+
+# 决定模型结构和训练过程的超参数，checkpoint按这些参数的哈希命名，参数变化后不会误加载其他参数的权重
+HYPER_PARAMETERS = ["model_type", "num_layers", "bidirectional", "batch_size", "hidden_size", "out_channels",
+                    "kernel_size", "learning_rate", "max_length", "class_num", "pooling_type",
+                    "pretrain_model_path", "vocab_size"]
+
+
+def config_hash(config):
+    key = {name: config.get(name) for name in HYPER_PARAMETERS}
+    return hashlib.md5(json.dumps(key, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+# 训练一组参数到指定轮数并评估；本次搜索中已有checkpoint时从上一次的轮数接着训练
+def run_config(config, target_epoch):
+    checkpoint_path = os.path.join(config["sweep_run_path"], config_hash(config) + ".pth")
+    batch_data = load_train_data(config)
+    model = TorchModel(config)
+    optim = torch.optim.Adam(model.parameters(), lr=config["learning_rate"])
+    if gpu_usable:
+        model = model.cuda()
+    trained_epoch = 0
+    execution_time = 0
+    if os.path.exists(checkpoint_path):
+        checkpoint = torch.load(checkpoint_path, map_location="cpu")
+        # checkpoint已经训练超过目标轮数时不能当作target_epoch轮的结果，重新训练
+        if checkpoint["epoch"] > target_epoch:
+            logger.warning(f"{config['model_name']}的checkpoint已训练{checkpoint['epoch']}轮，"
+                           f"超过目标轮数{target_epoch}，不再恢复，重新训练")
+        else:
+            model.load_state_dict(checkpoint["model"])
+            optim.load_state_dict(checkpoint["optim"])
+            trained_epoch = checkpoint["epoch"]
+            execution_time = checkpoint["execution_time"]
+    start = time.time()
+    train_epochs(model, optim, batch_data, trained_epoch, target_epoch)
+    config["execution_time"] = execution_time + time.time() - start
+    torch.save({"model": model.state_dict(),
+                "optim": optim.state_dict(),
+                "epoch": target_epoch,
+                "execution_time": config["execution_time"]}, checkpoint_path)
+    evaluator = Evaluator(config, model)
+    result = evaluator.predict()
+    result["epoch"] = target_epoch
+    result["accuracy"] = evaluator.accuracy
+    result["execution_time"] = round(config["execution_time"], 2)
+    return result
+
+
+# 每一轮淘汰时的训练轮数：min_epoch, min_epoch*eta, ...，最后一轮为config["epoch"]
+def halving_budgets(min_epoch, eta, max_epoch):
+    budgets = []
+    budget = min_epoch
+    while budget < max_epoch:
+        budgets.append(budget)
+        budget *= eta
+    budgets.append(max_epoch)
+    return budgets
+
+
+def sweep(base_config, model_types):
+    # 每次搜索使用单独的目录保存checkpoint，不会恢复之前搜索留下的模型
+    run_path = os.path.join(base_config["sweep_path"], time.strftime("%Y%m%d_%H%M%S") + f"_{os.getpid()}")
+    os.makedirs(run_path, exist_ok=True)
+    configs = list(sweep_configs(base_config, model_types))
+    for config in configs:
+        config["sweep_run_path"] = run_path
+    # 在主进程中先构建好tokenize缓存，工作进程只需内存映射读取
+    if base_config.get("use_cache", False):
+        load_token_cache(base_config)
+    threads = base_config["sweep_threads_per_worker"]
+    workers = base_config["sweep_workers"] or max(1, (os.cpu_count() or 1) // threads)
+    eta = base_config["sweep_eta"]
+    budgets = halving_budgets(base_config["sweep_min_epoch"], eta, base_config["epoch"])
+    logger.info(f"checkpoint保存目录：{run_path}")
+    logger.info(f"共{len(configs)}组参数，{workers}个进程，每进程{threads}个线程，淘汰轮次：{budgets}")
+
+    results = {}
+    survivors = configs
+    with ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn"),
+                             initializer=init_worker, initargs=(threads,)) as executor:
+        for rung, budget in enumerate(budgets):
+            futures = [executor.submit(run_config, config, budget) for config in survivors]
+            rung_results = []
+            for config, future in zip(survivors, futures):
+                result = future.result()
+                result["rung"] = rung
+                results[config["model_name"]] = result
+                rung_results.append((result["accuracy"], config))
+                logger.info(f"第{rung + 1}轮：{result}")
+            if rung == len(budgets) - 1:
+                break
+            # 只保留准确率最高的1/eta组参数进入下一轮
+            rung_results.sort(key=lambda x: x[0], reverse=True)
+            keep = max(1, math.ceil(len(rung_results) / eta))
+            survivors = [config for _, config in rung_results[:keep]]
+
+    table = pd.DataFrame(list(results.values())).sort_values(["rung", "accuracy"], ascending=False)
+    table_path = os.path.join(base_config["log_path"], "sweep_results.csv")
+    table.to_csv(table_path, index=False)
+    logger.info(f"超参数搜索完成，结果保存至：{table_path}")
+    return table
+
+
+if __name__ == "__main__":
+    Config["vocab_size"] = load_vocab(Config["vocab_path"])
+    print(sweep(Config, model_type_list))
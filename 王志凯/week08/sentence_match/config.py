@@ -13,6 +13,7 @@ Config = {
     "matching_type": "cosine",    # 从encoder层输出之后的matching layer。"concat"：拼接， "cosine"：直接计算余弦距离
     "concat_type": 0,             # matching_type为"concat"时生效，0:(u,v)   1:(u,v,|u-v|)   2:(u,v,u*v)
     "margin": 0.1,                # 正负样本阈值系数（建议0.1 - 0.5）,train_type="Triply"时生效
+    "negative_mining": "random",  # 负样本选择方式，train_type="Triply"时生效。"random"：随机，"hard"：batch内最难，"semi-hard"：batch内半难
     "num_epochs": 10,
     "hidden_size": 256,
     "out_channels": 128,
@@ -20,5 +21,6 @@ Config = {
     "learning_rate": 1e-3,
     "batch_size": 20,
     "max_length": 30,
-    "kernel_size": 3
+    "kernel_size": 3,
+    "faq_index_dtype": "float32"  # 知识库索引存储精度："float32"、"float16"、"int8"
 }
\ No newline at end of file
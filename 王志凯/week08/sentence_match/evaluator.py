@@ -2,8 +2,8 @@
 
 import torch
 import os
-import torch.nn as nn
 from loader import load_data
+from faqIndex import FAQIndex
 from logHandler import logger
 from collections import defaultdict
 from transformers import BertTokenizer
@@ -36,12 +36,15 @@ class Evaluator:
             # list(q_vec_dict.values())是tensor列表，使用torch.stack可以将其堆叠成一个tensor
             q_vecs = torch.stack(list(q_vec_dict.values()))
             q_labels = q_vec_dict.keys()
-        # 将所有问题向量化
-        self.faq_vecs = self.model(q_vecs)
-        for index, (vec, label) in enumerate(zip(self.faq_vecs, q_labels)):
+        # 将所有问题向量化，并构建归一化后的知识库索引
+        self.model.eval()
+        with torch.no_grad():
+            self.faq_vecs = self.model(q_vecs)
+        labels = [int(label.split("_")[0]) for label in q_labels]
+        for index, (vec, label) in enumerate(zip(self.faq_vecs, labels)):
             # 用索引对应问题和标准问label{0：[seq, label], 1: [seq, label]...}
-            label = int(label.split("_")[0])
             self.index_question_label[index] = [vec, label]
+        self.faq_index = FAQIndex(self.faq_vecs, labels, dtype=self.config.get("faq_index_dtype", "float32"))
 
     def predict(self):
         logger.info(f"开始对模型进行预测")
@@ -52,18 +55,10 @@ class Evaluator:
         with torch.no_grad():
             for batch_x, labels in self.valid_data:
                 input_vecs = self.model(batch_x)
-                for input_vec, label in zip(input_vecs, labels):
-                    input_norm = nn.functional.normalize(input_vec, dim=-1).unsqueeze(0)
-                    faq_vecs_norm = nn.functional.normalize(self.faq_vecs, dim=-1)
-                    # 输入文本与知识库中所有问题的相似度 res.shape = (1, n)
-                    res = input_norm @ faq_vecs_norm.T
-                    # 取出最大值的索引即为相似度最高的问题向量在self.faq_vecs中的位置
-                    hit_idx = torch.argmax(res.squeeze())
-                    hit_label = self.index_question_label[int(hit_idx)][1]
-                    print(hit_label)
-                    if int(label) == int(hit_label):
-                        correct += 1
-                    else:
-                        wrong += 1
+                # 整个batch一次查询知识库，取出相似度最高的问题对应的标准问
+                _, hit_labels = self.faq_index.search_labels(input_vecs, top_k=1)
+                hits = int((hit_labels[:, 0] == labels.view(-1).cpu()).sum())
+                correct += hits
+                wrong += len(hit_labels) - hits
         logger.info(f"预测总数：{correct + wrong}， 准确率为：{correct / (correct + wrong):.4%}")
         print(f"预测总数：{correct + wrong}， 准确率为：{correct / (correct + wrong):.4%}")
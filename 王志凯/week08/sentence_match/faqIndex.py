@@ -0,0 +1,80 @@
+# -*- coding:utf-8 -*-
+
+"""
+知识库索引：问题向量只归一化一次并按指定精度存储，批量查询时一次矩阵乘法加topk得到最相似的问题
+"""
+
+import torch
+import torch.nn as nn
+
+
+class FAQIndex:
+    # dtype可选"float32"、"float16"、"int8"（int8按行对称量化，每行额外保存一个缩放系数）
+    def __init__(self, vectors=None, labels=None, dtype="float32", block_size=65536):
+        self.dtype = dtype
+        self.block_size = block_size
+        self.vectors = None
+        self.scales = None
+        self.labels = None
+        if vectors is not None:
+            self.build(vectors, labels)
+
+    def build(self, vectors, labels):
+        vectors = nn.functional.normalize(vectors.detach().float().cpu(), dim=-1)
+        self.labels = torch.as_tensor(labels, dtype=torch.long)
+        if self.dtype == "int8":
+            # 每行按最大绝对值缩放到[-127, 127]
+            self.scales = vectors.abs().amax(dim=-1).clamp(min=1e-12) / 127
+            self.vectors = torch.round(vectors / self.scales.unsqueeze(1)).to(torch.int8)
+        elif self.dtype == "float16":
+            self.vectors = vectors.half()
+        else:
+            self.vectors = vectors.contiguous()
+
+    def __len__(self):
+        return 0 if self.vectors is None else self.vectors.shape[0]
+
+    # 取出一段索引向量并还原为float32参与计算
+    def block(self, start, end):
+        block = self.vectors[start:end].float()
+        if self.scales is not None:
+            block = block * self.scales[start:end].unsqueeze(1)
+        return block
+
+    # 批量查询，返回(batch, top_k)的相似度和索引位置；知识库按块计算，块间合并topk，避免生成过大的相似度矩阵
+    def search(self, query_vecs, top_k=1):
+        query = nn.functional.normalize(query_vecs.detach().float().cpu(), dim=-1)
+        top_k = min(top_k, len(self))
+        best_scores, best_ids = None, None
+        for start in range(0, len(self), self.block_size):
+            end = min(start + self.block_size, len(self))
+            scores = query @ self.block(start, end).T
+            scores, ids = torch.topk(scores, min(top_k, end - start), dim=-1)
+            ids = ids + start
+            if best_scores is not None:
+                scores = torch.cat([best_scores, scores], dim=-1)
+                ids = torch.cat([best_ids, ids], dim=-1)
+                scores, order = torch.topk(scores, top_k, dim=-1)
+                ids = torch.gather(ids, -1, order)
+            best_scores, best_ids = scores, ids
+        return best_scores, best_ids
+
+    # 批量查询，直接返回最相似问题对应的标准问label
+    def search_labels(self, query_vecs, top_k=1):
+        scores, ids = self.search(query_vecs, top_k)
+        return scores, self.labels[ids]
+
+    def save(self, path):
+        torch.save({"dtype": self.dtype,
+                    "vectors": self.vectors,
+                    "scales": self.scales,
+                    "labels": self.labels}, path)
+
+    @classmethod
+    def load(cls, path):
+        state = torch.load(path, map_location="cpu")
+        index = cls(dtype=state["dtype"])
+        index.vectors = state["vectors"]
+        index.scales = state["scales"]
+        index.labels = state["labels"]
+        return index
@@ -39,7 +39,10 @@ class SentenceMatchLoader(Dataset):
                     label = f"{self.schema[target]}_{i}"
                     self.q_vec_dict[label] = seq
                     self.q_sent_dict[label] = question
-        if self.isTrain:
+        if self.is_mining():
+            # 难负样本挖掘：不预先生成三元组，在__getitem__中实时生成(锚点, 正样本)，负样本在batch内挖掘
+            self.data_list = data_list
+        elif self.isTrain:
             for _ in range(self.epoch_size):
                 # 双塔模型
                 if self.config["train_type"] == "Siam":
@@ -78,11 +81,23 @@ class SentenceMatchLoader(Dataset):
 
 
     def __len__(self):
+        if self.is_mining():
+            return self.epoch_size
         return len(self.data)
 
     def __getitem__(self, idx):
+        if self.is_mining():
+            a, p, target = pick_ap_sample(self.data_list)
+            a, p = padding(a, self.config), padding(p, self.config)
+            if self.config["model_type"] != "bert":
+                a, p = torch.LongTensor(a), torch.LongTensor(p)
+            return [a, p, torch.LongTensor([self.schema[target]])]
         return self.data[idx]
 
+    # 训练三元组模型且开启了难负样本挖掘
+    def is_mining(self):
+        return self.isTrain and self.config["train_type"] != "Siam" and self.config["negative_mining"] != "random"
+
 
 def padding(sent, config):
     max_len = config["max_length"]
@@ -119,6 +134,11 @@ def pick_apn_sample(data_list):
     n = n_questions[n_idx]
     return a, p, n
 
+# 将target作为锚点，随机取该行的一个question作为正样本，同时返回target用于区分batch内的负样本
+def pick_ap_sample(data_list):
+    row = random.choice(data_list)
+    return row["target"], random.choice(row["questions"]), row["target"]
+
 def pick_pos_sample(data_list):
     random_idx = random.choice(range(len(data_list)))
     questions = data_list[random_idx]["questions"]
@@ -34,6 +34,10 @@ def main(config):
             if config["train_type"] == "Siam":
                 batch_sent1, batch_sent2, target = batch_data
                 loss = model(batch_sent1, batch_sent2, target)
+            elif config["negative_mining"] != "random":
+                # 负样本在batch内实时挖掘
+                a, p, labels = batch_data
+                loss = model.mined_triplet_loss(a, p, labels)
             else:
                 a, p, n = batch_data
                 loss = model(a, p, n)
@@ -50,6 +54,9 @@ def main(config):
     model_name = config["model_name"] + ".pth"
     model_path = os.path.join(config["model_base_path"], model_name)
     torch.save(model.state_dict(), model_path)
+    # 知识库索引与模型一起保存，预测时可直接加载，无需重新向量化
+    index_path = os.path.join(config["model_base_path"], config["model_name"] + "_faq_index.pth")
+    evaluator.faq_index.save(index_path)
 
 
 
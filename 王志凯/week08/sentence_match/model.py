@@ -76,6 +76,20 @@ def cosine_distance(x, y):
     return 1 - cosine
 
 
+# 在batch内为每个锚点挖掘负样本，返回每个锚点到所选负样本的cosine距离
+# mode="hard"：选距离最近的负样本；mode="semi-hard"：选比正样本远的负样本中最近的一个，没有时退回最难负样本
+def mine_negative_distance(a, d_ap, candidates, labels, candidate_labels, mode):
+    d_an = 1 - nn.functional.normalize(a, dim=-1) @ nn.functional.normalize(candidates, dim=-1).T
+    # 与锚点同一标准问的样本不能作为负样本
+    invalid = labels.unsqueeze(1) == candidate_labels.unsqueeze(0)
+    d_an = d_an.masked_fill(invalid, float("inf"))
+    hardest = d_an.min(dim=1).values
+    if mode == "hard":
+        return hardest
+    semi_hard = d_an.masked_fill(d_an <= d_ap.unsqueeze(1), float("inf")).min(dim=1).values
+    return torch.where(torch.isinf(semi_hard), hardest, semi_hard)
+
+
 class MatchModel(nn.Module):
     def __init__(self, config):
         super(MatchModel, self).__init__()
@@ -128,6 +142,22 @@ class MatchModel(nn.Module):
             loss = diff.mean()
             return loss
 
+    # 难负样本挖掘的三元组loss：x为锚点，y为正样本，labels为标准问编号，负样本从当前batch的其他样本中挖掘
+    def mined_triplet_loss(self, x, y, labels):
+        a, p = self.encoder(x), self.encoder(y)
+        labels = labels.view(-1)
+        d_ap = 1 - torch.sum(nn.functional.normalize(a, dim=-1) * nn.functional.normalize(p, dim=-1), dim=-1)
+        # 锚点和正样本都可以作为其他锚点的负样本
+        candidates = torch.cat([a, p], dim=0)
+        candidate_labels = torch.cat([labels, labels], dim=0)
+        d_an = mine_negative_distance(a, d_ap, candidates, labels, candidate_labels, self.config["negative_mining"])
+        # batch内没有其他标准问的锚点不参与计算
+        valid = ~torch.isinf(d_an)
+        if not valid.any():
+            return (d_ap * 0).sum()
+        diff = torch.relu(d_ap[valid] - d_an[valid] + self.config["margin"])
+        return diff.mean()
+
 
 if __name__ == "__main__":
     from config import Config
@@ -6,6 +6,8 @@ Config = {
     "pretrain_model_path": "./data/bert-base-chinese",
     "log_base_path": "./log",
     "model_base_path": "./model",
+    "quantized_model_path": "./model/quantized.pth",   # quantize.py保存的动态int8量化模型
+    "use_quantized": False,   # predict.py是否加载量化模型（只能在CPU上推理）
     "train_data_path": "./data/train.txt",
     "test_data_path": "./data/test.txt",
     "vocab_path": "./data/bert-base-chinese/vocab.txt",
@@ -0,0 +1,106 @@
+# -*- coding:utf-8 -*-
+
+"""
+批量解码工具：
+1.viterbi_decode：整个batch一起做维特比解码，使用mask处理不同长度的句子
+2.extract_spans：从整个batch的BIO标签中一次性抽取实体，返回（样本下标, 起始位置, 结束位置, 实体类型）
+"""
+
+import torch
+from config import Labels
+
+# 根据Labels生成实体类型列表，如["PERSON", "LOCATION", "ORGANIZATION", "TIME"]
+ENTITY_TYPES = [label[2:] for label in Labels if label.startswith("B-")]
+
+
+def viterbi_decode(emissions, transitions, start_transitions, end_transitions, mask):
+    """
+    emissions: (batch_size, seq_len, label_num)
+    transitions: (label_num, label_num)，transitions[i][j]表示从标签i转移到标签j的分数
+    mask: (batch_size, seq_len)，有效位置为True，要求有效位置都在句子前部
+    返回 (batch_size, seq_len) 的标签序列，无效位置为-1
+    """
+    batch_size, seq_len, _ = emissions.shape
+    mask = mask.bool()
+    score = start_transitions + emissions[:, 0]
+    history = []
+    for t in range(1, seq_len):
+        # (batch_size, label_num, 1) + (label_num, label_num) + (batch_size, 1, label_num)
+        next_score = score.unsqueeze(2) + transitions + emissions[:, t].unsqueeze(1)
+        next_score, indices = next_score.max(dim=1)
+        # 超出句子长度的位置保持原来的分数
+        score = torch.where(mask[:, t].unsqueeze(1), next_score, score)
+        history.append(indices)
+    score = score + end_transitions
+
+    lengths = mask.sum(dim=1)
+    best_tags = torch.full((batch_size, seq_len), -1, dtype=torch.long, device=emissions.device)
+    current = score.argmax(dim=-1)
+    # 从后往前回溯，每个样本从自己的最后一个有效位置开始回溯
+    for t in range(seq_len - 1, -1, -1):
+        active = t < lengths
+        best_tags[:, t] = torch.where(active, current, best_tags[:, t])
+        if t > 0:
+            previous = history[t - 1].gather(1, current.unsqueeze(1)).squeeze(1)
+            current = torch.where(active, previous, current)
+    return best_tags
+
+
+# 使用torchcrf.CRF中训练好的转移矩阵进行批量解码
+def crf_decode(crf, emissions, mask):
+    return viterbi_decode(emissions, crf.transitions, crf.start_transitions, crf.end_transitions, mask)
+
+
+# 标签id -> 实体类型下标，以及该标签是否为B、是否为I，非实体标签（O、padding的-1）类型为-1
+def build_label_tables(device=None):
+    label_num = max(Labels.values()) + 1
+    # 多留一位给-1，-1会索引到最后一位
+    entity_type = torch.full((label_num + 1,), -1, dtype=torch.long)
+    is_begin = torch.zeros(label_num + 1, dtype=torch.bool)
+    for label, index in Labels.items():
+        if label[:2] in ("B-", "I-"):
+            entity_type[index] = ENTITY_TYPES.index(label[2:])
+            is_begin[index] = label.startswith("B-")
+    return entity_type.to(device), is_begin.to(device)
+
+
+def extract_spans(tags):
+    """
+    tags: (batch_size, seq_len) 的BIO标签，padding位置为-1
+    实体以B开头，后面连续的同类型I都属于该实体
+    返回 (n, 4) 的张量，每行为 [样本下标, 起始位置, 结束位置(不含), 实体类型下标]
+    """
+    tags = tags.long()
+    entity_type, is_begin = build_label_tables(tags.device)
+    types = entity_type[tags]
+    begins = is_begin[tags]
+    inside = (types >= 0) & ~begins
+    # 当前位置是I且与前一个位置类型相同，说明是前一个实体的延续
+    continued = torch.zeros_like(begins)
+    continued[:, 1:] = inside[:, 1:] & (types[:, 1:] == types[:, :-1])
+    # 下一个位置不是延续，当前位置就是一段的结尾
+    is_last = torch.ones_like(begins)
+    is_last[:, :-1] = ~continued[:, 1:]
+    # 对每个位置求它之后（含自身）第一个结尾的位置，即所在实体的结束位置
+    seq_len = tags.shape[1]
+    positions = torch.arange(seq_len, device=tags.device).expand_as(tags)
+    last_positions = torch.where(is_last, positions, torch.full_like(positions, seq_len))
+    end_positions = torch.flip(torch.cummin(torch.flip(last_positions, [1]), dim=1).values, [1])
+    batch_index, start = begins.nonzero(as_tuple=True)
+    end = end_positions[batch_index, start] + 1
+    return torch.stack([batch_index, start, end, types[batch_index, start]], dim=1)
+
+
+# 统计真实实体与预测实体：返回每个类型的(实体总数, 预测实体数, 预测正确数)
+def count_spans(true_spans, pred_spans, seq_len):
+    type_num = len(ENTITY_TYPES)
+
+    # 将(样本下标, 起始, 结束, 类型)编码成一个整数，方便求交集
+    def encode(spans):
+        return ((spans[:, 0] * (seq_len + 1) + spans[:, 1]) * (seq_len + 1) + spans[:, 2]) * type_num + spans[:, 3]
+
+    correct = torch.isin(encode(pred_spans), encode(true_spans))
+    total_count = torch.bincount(true_spans[:, 3], minlength=type_num)
+    predict_count = torch.bincount(pred_spans[:, 3], minlength=type_num)
+    correct_count = torch.bincount(pred_spans[:, 3][correct], minlength=type_num)
+    return total_count, predict_count, correct_count
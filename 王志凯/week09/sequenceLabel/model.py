@@ -7,6 +7,7 @@ import torch.nn as nn
 from transformers import BertModel
 from torchcrf import CRF
 from logHandler import logger
+from decoder import crf_decode
 log = logger(os.path.basename(__file__))
 
 class SequenceLabelModel(nn.Module):
@@ -33,6 +34,8 @@ class SequenceLabelModel(nn.Module):
         self.crf = CRF(self.label_num, batch_first=True)
 
     def forward(self, x, tags=None):
+        # padding位置（[PAD]的id为0）不参与解码
+        mask = x != 0
         if self.model_type == "lstm":
             x = self.embedding(x)
             x, _ = self.encoder(x)
@@ -45,8 +48,8 @@ class SequenceLabelModel(nn.Module):
         # tags为空，进行预测
         if tags is None:
             if self.use_crf:
-                # 使用crf.decode解码，返回batch中每个样本的最优的标签序列列表（batch_size, seq_len）
-                return self.crf.decode(emissions)
+                # 整个batch一起做维特比解码，返回最优的标签序列（batch_size, seq_len），padding位置为-1
+                return crf_decode(self.crf, emissions, mask)
             return torch.softmax(emissions, dim=-1)
         # 传入tags，计算loss
         else:
@@ -5,12 +5,16 @@ import torch
 from config import Config, Labels
 from model import SequenceLabelModel
 from loader import sentence2sequence, load_vocab
+from decoder import extract_spans, ENTITY_TYPES
+from quantize import load_quantized_model
 from transformers import BertConfig
 
 
 def load_model(model_base_path):
     bertConfig = BertConfig.from_pretrained(Config["pretrain_model_path"])
     Config["vocab_size"] = bertConfig.vocab_size
+    if Config["use_quantized"]:
+        return load_quantized_model(Config, Config["quantized_model_path"])
     # 1.创建模型
     model = SequenceLabelModel(Config)
     # 2.加载权重
@@ -32,16 +36,28 @@ def match_entity(sentences, pred_labels):
     return new_sentences
 
 
+# 从整个batch的预测标签中一次抽取实体，返回每个句子的[(实体, 实体类型), ...]
+def extract_entities(sentences, pred_labels):
+    entities = [[] for _ in sentences]
+    for index, start, end, entity_type in extract_spans(pred_labels).tolist():
+        entities[index].append((sentences[index][start:end], ENTITY_TYPES[entity_type]))
+    return entities
+
+
 def predict(sentences):
     model = load_model(Config["model_base_path"])
+    model.eval()
     vocab_dict = load_vocab(Config["vocab_path"])
     sequences = []
     for text in sentences:
         seq = sentence2sequence(text, vocab_dict, Config["max_length"])
         sequences.append(seq)
     sequences = torch.LongTensor(sequences)
-    pred_labels = model(sequences)
-    return match_entity(sentences, pred_labels)
+    with torch.no_grad():
+        pred_labels = model(sequences)
+    if not Config["use_crf"]:
+        pred_labels = torch.argmax(pred_labels, dim=-1).masked_fill(sequences == 0, -1)
+    return match_entity(sentences, pred_labels), extract_entities(sentences, pred_labels)
 
 
 
@@ -50,6 +66,7 @@ if __name__ == "__main__":
              "2001年9月11日，美国金融大厦发生恐怖袭击",
              "2008年奥巴马称为美国历史上第一位非裔总统",
              "9月3日那天，习近平在北京天安门广场观看了盛大的阅兵仪式"]
-    new_text = predict(texts)
-    for s in new_text:
-        print(s)
\ No newline at end of file
+    new_text, entities = predict(texts)
+    for s, e in zip(new_text, entities):
+        print(s)
+        print(e)
\ No newline at end of file
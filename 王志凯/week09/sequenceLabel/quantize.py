@@ -0,0 +1,60 @@
+# -*- coding:utf-8 -*-
+
+
+"""
+训练后动态int8量化：线性层（和lstm）的权重量化为int8，激活值在推理时动态量化
+只能在CPU上推理，模型体积约为原来的1/4，推理速度约提升2~3倍
+用法：先运行main.py训练并保存模型，再运行本文件，对比量化前后的F1并保存量化后的模型
+"""
+import os
+import time
+import torch
+import torch.nn as nn
+from transformers import BertConfig
+from config import Config
+from model import SequenceLabelModel
+from evaluate import Evaluator
+from logHandler import logger
+log = logger(os.path.basename(__file__))
+
+
+def quantize_model(model):
+    return torch.ao.quantization.quantize_dynamic(model.cpu().eval(), {nn.Linear, nn.LSTM}, dtype=torch.qint8)
+
+
+# 量化后的权重只能加载到同样结构的量化模型中：先创建模型并量化，再加载权重
+def load_quantized_model(config, quantized_model_path):
+    model = quantize_model(SequenceLabelModel(config))
+    # 量化lstm的权重以ScriptObject保存，需要weights_only=False（只加载自己导出的文件）
+    model.load_state_dict(torch.load(quantized_model_path, weights_only=False))
+    return model
+
+
+def evaluate(config, model):
+    start = time.time()
+    f1 = Evaluator(config, model).predict()
+    return f1, time.time() - start
+
+
+def main(config):
+    model_path = os.path.join(config["model_base_path"], config["model_type"] + ".pth")
+    model = SequenceLabelModel(config)
+    model.load_state_dict(torch.load(model_path, map_location="cpu"))
+    f1, cost = evaluate(config, model.eval())
+
+    quantized_model = quantize_model(model)
+    quantized_f1, quantized_cost = evaluate(config, quantized_model)
+    torch.save(quantized_model.state_dict(), config["quantized_model_path"])
+
+    size = os.path.getsize(model_path) / 1024 / 1024
+    quantized_size = os.path.getsize(config["quantized_model_path"]) / 1024 / 1024
+    result = (f"量化前：F1={f1:.4f}，测试耗时{cost:.2f}s，模型大小{size:.1f}MB；"
+              f"量化后：F1={quantized_f1:.4f}（变化{quantized_f1 - f1:+.4f}），"
+              f"测试耗时{quantized_cost:.2f}s，模型大小{quantized_size:.1f}MB")
+    log.info(result)
+    print(result)
+
+
+if __name__ == "__main__":
+    Config["vocab_size"] = BertConfig.from_pretrained(Config["pretrain_model_path"]).vocab_size
+    main(Config)
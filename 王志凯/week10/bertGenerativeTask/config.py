@@ -13,5 +13,13 @@ Config = {
     "batch_size": 20,
     "sample_num": 50000,
     "learning_rate": 1e-4,
-    "max_length": 20
+    "max_length": 20,
+    "use_kv_cache": True,   # 生成时使用KV缓存增量解码
+    # 采样参数：greedy_ratio为每个样本使用贪婪采样的概率，其余按temperature、top_k、top_p随机采样
+    # top_k为0、top_p为1表示不过滤，repetition_penalty为1表示不惩罚重复
+    "greedy_ratio": 0.8,
+    "temperature": 1.0,
+    "top_k": 0,
+    "top_p": 1.0,
+    "repetition_penalty": 1.0
 }
@@ -1,10 +1,10 @@
 # -*- coding:utf-8 -*-
 
 import torch
-import random
 import math
-import numpy as np
 from loader import sentence2sequence, load_vocab
+from incrementalDecoder import IncrementalDecoder
+from sampler import sample
 from logHandler import logger
 log = logger(__file__)
 
@@ -17,6 +17,8 @@ class Evaluator:
 
 
     def eval(self):
+        if self.config.get("use_kv_cache", False):
+            return self.eval_with_cache()
         reverse_vocab = {v: k for k, v in self.vocab.items()}
         self.model.eval()
         with torch.no_grad():
@@ -34,7 +36,7 @@ class Evaluator:
                 prob = calc_ppl(sequence, y_pred)
                 probs += prob
                 # 根据不同的采样策略选择预测词
-                pred_id = sampling_strategy(y_pred)
+                pred_id = int(self.sample(torch.log(y_pred).unsqueeze(0), x)[0])
                 log.info(f"pred_id:{pred_id}")
                 pred_char = reverse_vocab[pred_id]
                 # 追加到原句子中继续生成
@@ -47,6 +49,70 @@ class Evaluator:
         log.info(f"生成的句子PPL值为：{ppl}")
         print(f"生成的句子PPL值为：{ppl}")
 
+    # 对(batch_size, vocab_size)的分数批量采样，每个样本按greedy_ratio独立决定贪婪采样还是随机采样
+    # prev_ids为已有的序列，用于重复惩罚
+    def sample(self, logits, prev_ids=None):
+        greedy = torch.rand(logits.shape[0], device=logits.device) < self.config.get("greedy_ratio", 0.8)
+        penalty = self.config.get("repetition_penalty", 1.0)
+        return sample(logits, greedy,
+                      temperature=self.config.get("temperature", 1.0),
+                      top_k=self.config.get("top_k", 0),
+                      top_p=self.config.get("top_p", 1.0),
+                      repetition_penalty=penalty,
+                      prev_ids=prev_ids if penalty != 1.0 else None,
+                      pad_id=0)
+
+    # 使用KV缓存增量生成，每生成一个字只计算新位置，结果与eval一致
+    def eval_with_cache(self):
+        reverse_vocab = {v: k for k, v in self.vocab.items()}
+        decoder = IncrementalDecoder(self.model)
+        self.model.eval()
+        with torch.no_grad():
+            pred_char = ""
+            probs = 0
+            count = 0
+            sequence = sentence2sequence(self.sentence, self.vocab, len(self.sentence))
+            logits, state = decoder.prefill([sequence])
+            while len(self.sentence) <= 40 and pred_char != "\n":
+                y_pred = torch.softmax(logits[0], dim=-1)
+                prob = calc_ppl(sequence, y_pred)
+                probs += prob
+                prev_ids = torch.LongTensor([sequence]).to(logits.device)
+                pred_id = int(self.sample(logits, prev_ids)[0])
+                log.info(f"pred_id:{pred_id}")
+                pred_char = reverse_vocab[pred_id]
+                self.sentence += pred_char
+                sequence.append(pred_id)
+                count += 1
+                # 只把新生成的字送入模型，历史位置的key/value从缓存中读取
+                logits = decoder.step(torch.LongTensor([pred_id]).to(logits.device), state)
+            log.info(f"最终生成的句子：{self.sentence}")
+            print(f"最终生成的句子：{self.sentence}")
+        ppl = 2 ** (-probs / count)
+        log.info(f"生成的句子PPL值为：{ppl}")
+        print(f"生成的句子PPL值为：{ppl}")
+
+    # 批量生成：一次为多个开头生成文本，每个句子独立结束
+    def generate_batch(self, sentences, max_length=40):
+        reverse_vocab = {v: k for k, v in self.vocab.items()}
+        decoder = IncrementalDecoder(self.model)
+        self.model.eval()
+        prompt_ids = [sentence2sequence(sentence, self.vocab, len(sentence)) for sentence in sentences]
+        max_new_tokens = max_length - min(len(sentence) for sentence in sentences) + 1
+        outputs = decoder.generate(prompt_ids, max_new_tokens, self.sample,
+                                   stop_id=self.vocab.get("\n"))
+        results = []
+        for sentence, ids in zip(sentences, outputs):
+            # 与eval一致，句子超过max_length后停止追加
+            generated = sentence
+            for pred_id in ids[len(sentence):]:
+                if len(generated) > max_length:
+                    break
+                generated += reverse_vocab[pred_id]
+            results.append(generated)
+        return results
+
+
 def calc_ppl(sequence, y_pred):
     target = sequence[-1]
     target_prob = y_pred[target]
@@ -54,13 +120,6 @@ def calc_ppl(sequence, y_pred):
     # return math.exp(target_prob)
 
 
+# 保留原来的调用方式：对单个概率分布采样，20%概率随机采样，80%为贪婪采样
 def sampling_strategy(y_pred):
-    margin = random.random()
-    # 20%概率为贪婪采样，80%为随机采样
-    if margin > 0.2:
-        return int(torch.argmax(y_pred, dim=-1))
-    else:
-        # 确保归一化（内部处理精度问题）
-        y_pred = y_pred.cpu().numpy()
-        # 按照y_pred中各元素的概率进行采样
-        return np.random.choice(list(range(len(y_pred))), p=y_pred)
\ No newline at end of file
+    return int(sample(torch.log(y_pred).unsqueeze(0), greedy=torch.rand(1) < 0.8)[0])
@@ -0,0 +1,125 @@
+# -*- coding:utf-8 -*-
+
+"""
+带KV缓存的增量解码：
+每一层的key/value在生成过程中缓存下来，每生成一个新字只需要计算这一个位置，
+不再把整句重新送入causalBert，生成的耗时由长度的平方降为线性
+"""
+
+import math
+import torch
+import torch.nn as nn
+from sampler import StopTracker
+
+
+class DecodeState:
+    def __init__(self, cache, key_mask, positions):
+        self.cache = cache            # 每层一个(key, value)，形状为(batch_size, head_num, 已生成长度, head_dim)
+        self.key_mask = key_mask      # (batch_size, 已生成长度)，padding位置为False
+        self.positions = positions    # (batch_size,)，每个样本下一个字的位置编号
+
+
+class IncrementalDecoder:
+    def __init__(self, model):
+        # model为BertGenerativeModel，直接复用其中bert各层的权重
+        self.model = model
+        self.bert = model.bert
+        self.head_num = self.bert.config.num_attention_heads
+        self.head_dim = self.bert.config.hidden_size // self.head_num
+
+    def embed(self, input_ids, position_ids):
+        embeddings = self.bert.embeddings
+        x = embeddings.word_embeddings(input_ids)
+        x = x + embeddings.position_embeddings(position_ids)
+        x = x + embeddings.token_type_embeddings(torch.zeros_like(input_ids))
+        return embeddings.LayerNorm(x)
+
+    # (batch_size, seq_len, hidden_size) -> (batch_size, head_num, seq_len, head_dim)
+    def split_heads(self, x):
+        batch_size, seq_len, _ = x.shape
+        return x.view(batch_size, seq_len, self.head_num, self.head_dim).transpose(1, 2)
+
+    def layer_forward(self, layer, x, past, attention_mask):
+        attention = layer.attention.self
+        q = self.split_heads(attention.query(x))
+        k = self.split_heads(attention.key(x))
+        v = self.split_heads(attention.value(x))
+        # 与之前缓存的key/value拼接，新位置可以看到所有历史位置
+        if past is not None:
+            k = torch.cat([past[0], k], dim=2)
+            v = torch.cat([past[1], v], dim=2)
+        scores = torch.matmul(q, k.transpose(-1, -2)) / math.sqrt(self.head_dim) + attention_mask
+        context = torch.matmul(torch.softmax(scores, dim=-1), v)
+        context = context.transpose(1, 2).reshape(x.shape[0], x.shape[1], -1)
+        # BertSelfOutput、BertIntermediate、BertOutput，与原始BertLayer的计算一致
+        attention_output = layer.attention.output.LayerNorm(layer.attention.output.dense(context) + x)
+        intermediate = layer.intermediate(attention_output)
+        output = layer.output.LayerNorm(layer.output.dense(intermediate) + attention_output)
+        return output, (k, v)
+
+    # 计算新输入的若干个位置，返回这些位置的词表分数，并更新缓存
+    # new_mask标记新输入中的padding（默认全部有效），position_ids默认接在每个样本已有长度之后
+    def forward(self, input_ids, state, new_mask=None, position_ids=None):
+        batch_size, seq_len = input_ids.shape
+        if new_mask is None:
+            new_mask = torch.ones((batch_size, seq_len), dtype=torch.bool, device=input_ids.device)
+        if position_ids is None:
+            position_ids = state.positions.unsqueeze(1) + torch.arange(seq_len, device=input_ids.device)
+        key_mask = new_mask if state.key_mask is None else torch.cat([state.key_mask, new_mask], dim=1)
+        past_len = key_mask.shape[1] - seq_len
+        # 新位置只能看到历史位置和自己之前的位置，padding的位置谁都看不到
+        causal = torch.ones((seq_len, key_mask.shape[1]), dtype=torch.bool, device=input_ids.device)
+        causal = torch.tril(causal, diagonal=past_len)
+        visible = causal.unsqueeze(0) & key_mask.unsqueeze(1)
+        attention_mask = ((~visible).float() * -1e9).unsqueeze(1)     # (batch_size, 1, seq_len, key_len)
+
+        x = self.embed(input_ids, position_ids)
+        cache = []
+        for i, layer in enumerate(self.bert.encoder.layer):
+            past = state.cache[i] if state.cache else None
+            x, kv = self.layer_forward(layer, x, past, attention_mask)
+            cache.append(kv)
+        state.cache = cache
+        state.key_mask = key_mask
+        state.positions = state.positions + new_mask.sum(dim=1)
+        return self.model.linear(x)
+
+    # 处理提示文本：不同长度的提示左侧补齐，每个样本的位置编号从自己的第一个字开始
+    # 返回每个样本最后一个位置的词表分数（用来预测下一个字）和解码状态
+    def prefill(self, prompt_ids, pad_id=0):
+        device = next(self.model.parameters()).device
+        max_len = max(len(ids) for ids in prompt_ids)
+        input_ids = torch.full((len(prompt_ids), max_len), pad_id, dtype=torch.long, device=device)
+        new_mask = torch.zeros((len(prompt_ids), max_len), dtype=torch.bool, device=device)
+        for row, ids in enumerate(prompt_ids):
+            input_ids[row, max_len - len(ids):] = torch.tensor(ids, dtype=torch.long, device=device)
+            new_mask[row, max_len - len(ids):] = True
+        position_ids = (torch.cumsum(new_mask.long(), dim=1) - 1).clamp(min=0)
+        state = DecodeState(None, None, torch.zeros(len(prompt_ids), dtype=torch.long, device=device))
+        logits = self.forward(input_ids, state, new_mask, position_ids)
+        return logits[:, -1], state
+
+    def step(self, next_ids, state):
+        return self.forward(next_ids.unsqueeze(1), state)[:, -1]
+
+    # 批量生成：每个样本独立判断是否结束，结束的样本不再追加新字
+    # sample_fn(logits, prev_ids)，prev_ids为每个样本已有的序列（左侧补pad_id），可用于重复惩罚
+    @torch.no_grad()
+    def generate(self, prompt_ids, max_new_tokens, sample_fn, stop_id=None, pad_id=0):
+        logits, state = self.prefill(prompt_ids, pad_id)
+        stop_ids = [] if stop_id is None else [stop_id]
+        tracker = StopTracker(len(prompt_ids), stop_ids, pad_id, logits.device)
+        max_len = max(len(ids) for ids in prompt_ids)
+        history = torch.tensor([[pad_id] * (max_len - len(ids)) + list(ids) for ids in prompt_ids],
+                               dtype=torch.long, device=logits.device)
+        outputs = [list(ids) for ids in prompt_ids]
+        for _ in range(max_new_tokens):
+            active = ~tracker.finished
+            next_ids = tracker.update(sample_fn(logits, history))
+            for row in active.nonzero(as_tuple=True)[0].tolist():
+                outputs[row].append(int(next_ids[row]))
+            if tracker.all_finished():
+                break
+            history = torch.cat([history, next_ids.unsqueeze(1)], dim=1)
+            logits = self.step(next_ids, state)
+        return outputs
@@ -0,0 +1,94 @@
+# -*- coding:utf-8 -*-
+
+"""
+批量采样：对(batch_size, vocab_size)的logits一次完成采样，全部使用torch运算
+支持贪婪、温度、top-k、top-p和重复惩罚，每个参数既可以是一个数，也可以是(batch_size,)的张量（每行单独设置）
+"""
+
+import torch
+
+
+# 将参数转为(batch_size,)的张量，方便每行使用不同的参数
+def per_row(value, batch_size, device, dtype=torch.float):
+    value = torch.as_tensor(value, device=device, dtype=dtype)
+    return value.expand(batch_size) if value.dim() == 0 else value
+
+
+# 重复惩罚：已出现过的字，分数为正时除以penalty，为负时乘以penalty
+# prev_ids为(batch_size, seq_len)的已生成序列，pad_id的位置不参与惩罚
+def apply_repetition_penalty(logits, prev_ids, penalty, pad_id=None):
+    penalty = per_row(penalty, logits.shape[0], logits.device).unsqueeze(1)
+    scores = logits.gather(1, prev_ids)
+    scores = torch.where(scores > 0, scores / penalty, scores * penalty)
+    if pad_id is not None:
+        scores = torch.where(prev_ids == pad_id, logits.gather(1, prev_ids), scores)
+    return logits.scatter(1, prev_ids, scores)
+
+
+def sample(logits, greedy=False, temperature=1.0, top_k=0, top_p=1.0,
+           repetition_penalty=1.0, prev_ids=None, pad_id=None):
+    """
+    logits: (batch_size, vocab_size)
+    greedy: 为True的行直接取最大值；temperature为0的行同样按贪婪处理
+    top_k: 为0的行不做top-k过滤；top_p: 为1的行不做top-p过滤
+    返回 (batch_size,) 的采样结果
+    """
+    logits = logits.float()
+    batch_size, vocab_size = logits.shape
+    device = logits.device
+    if prev_ids is not None:
+        logits = apply_repetition_penalty(logits, prev_ids, repetition_penalty, pad_id)
+    greedy = per_row(greedy, batch_size, device, torch.bool)
+    temperature = per_row(temperature, batch_size, device)
+    top_k = per_row(top_k, batch_size, device, torch.long)
+    top_p = per_row(top_p, batch_size, device)
+
+    greedy_ids = torch.argmax(logits, dim=-1)
+    greedy = greedy | (temperature <= 0)
+    logits = logits / temperature.clamp(min=1e-5).unsqueeze(1)
+
+    # 排序一次，top-k和top-p都在排好序的分数上过滤
+    sorted_logits, sorted_ids = torch.sort(logits, dim=-1, descending=True)
+    ranks = torch.arange(vocab_size, device=device).unsqueeze(0)
+    k = torch.where(top_k > 0, top_k.clamp(max=vocab_size), torch.full_like(top_k, vocab_size))
+    remove = ranks >= k.unsqueeze(1)
+    sorted_probs = torch.softmax(sorted_logits.masked_fill(remove, float("-inf")), dim=-1)
+    # 累积概率（不含自身）已超过top_p的字移除，概率最高的字始终保留
+    remove |= (torch.cumsum(sorted_probs, dim=-1) - sorted_probs) > top_p.unsqueeze(1)
+    sorted_logits = sorted_logits.masked_fill(remove, float("-inf"))
+
+    choice = torch.multinomial(torch.softmax(sorted_logits, dim=-1), 1)
+    sampled_ids = sorted_ids.gather(1, choice).squeeze(1)
+    return torch.where(greedy, greedy_ids, sampled_ids)
+
+
+class Sampler:
+    def __init__(self, greedy=False, temperature=1.0, top_k=0, top_p=1.0, repetition_penalty=1.0, pad_id=None):
+        self.greedy = greedy
+        self.temperature = temperature
+        self.top_k = top_k
+        self.top_p = top_p
+        self.repetition_penalty = repetition_penalty
+        self.pad_id = pad_id
+
+    def __call__(self, logits, prev_ids=None):
+        if self.repetition_penalty == 1.0:
+            prev_ids = None
+        return sample(logits, self.greedy, self.temperature, self.top_k, self.top_p,
+                      self.repetition_penalty, prev_ids, self.pad_id)
+
+
+# 记录每个样本是否已经结束，结束的样本之后的输出替换为pad_id
+class StopTracker:
+    def __init__(self, batch_size, stop_ids, pad_id=0, device=None):
+        self.finished = torch.zeros(batch_size, dtype=torch.bool, device=device)
+        self.stop_ids = torch.as_tensor(list(stop_ids), dtype=torch.long, device=device)
+        self.pad_id = pad_id
+
+    def update(self, next_ids):
+        next_ids = next_ids.masked_fill(self.finished, self.pad_id)
+        self.finished |= torch.isin(next_ids, self.stop_ids)
+        return next_ids
+
+    def all_finished(self):
+        return bool(self.finished.all())
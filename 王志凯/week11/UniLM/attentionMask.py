@@ -0,0 +1,28 @@
+# -*- coding:utf-8 -*-
+
+"""
+注意力掩码构造：全部使用张量运算，不再逐行/逐列循环填充
+mask[b, i, j] = 1 表示第i个位置可以看到第j个位置
+同一个batch中每个样本可以有不同的前缀（源序列/标题）长度
+"""
+
+import torch
+
+
+def segment_prefix_lm_mask(segment_ids, prefix_ends, dtype=torch.float):
+    """
+    一行中拼接了多个样本（packing）时的前缀语言模型掩码，整体为块对角：
+    - 只能看到同一个样本内的位置，每个样本内部为前缀语言模型掩码：
+      前缀内部互相可见，前缀之后的位置可以看到整个前缀，内部遵循因果关系
+    - padding位置对所有位置不可见，padding行只看自己，避免整行被mask
+    不拼接时每行只有一个样本，即为普通的前缀语言模型掩码
+    segment_ids: (batch_size, seq_len)，每个位置属于第几个样本（从1开始），padding为0
+    prefix_ends: (batch_size, seq_len)，每个位置所在样本的前缀结束位置（不含）
+    返回 (batch_size, seq_len, seq_len)
+    """
+    positions = torch.arange(segment_ids.shape[1], device=segment_ids.device)
+    same_segment = (segment_ids.unsqueeze(2) == segment_ids.unsqueeze(1)) & (segment_ids != 0).unsqueeze(1)
+    visible = (positions.view(1, 1, -1) < prefix_ends.unsqueeze(2)) | (positions.view(1, -1) <= positions.view(-1, 1))
+    visible = same_segment & visible
+    visible |= torch.eye(segment_ids.shape[1], dtype=torch.bool, device=segment_ids.device) & (segment_ids == 0).unsqueeze(2)
+    return visible.to(dtype)
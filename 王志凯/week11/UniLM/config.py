@@ -10,3 +10,7 @@ LEARNING_RATE = 5e-5
 INPUT_MAX_LENGTH = 256
 TARGET_MAX_LENGTH = 50
 
+# 按长度分桶：每次取BATCH_SIZE * BUCKET_MULTIPLIER个样本，桶内按长度排序后再切分batch
+BUCKET_MULTIPLIER = 50
+# 是否把多个短样本拼接到同一行（最长INPUT_MAX_LENGTH + TARGET_MAX_LENGTH - 1），样本之间的mask互相不可见
+PACKING = False
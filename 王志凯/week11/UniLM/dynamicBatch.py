@@ -0,0 +1,107 @@
+# -*- coding:utf-8 -*-
+
+"""
+动态padding：
+1.LengthBucketSampler：长度相近的样本分到同一个batch，减少padding
+2.UniLMCollator：每个batch只补齐到batch内最长的样本，并为每个样本生成各自的前缀语言模型mask；
+  packing=True时把多个短样本拼接到同一行，mask为块对角，不同样本之间互相不可见
+"""
+
+import random
+import torch
+from torch.utils.data import Sampler
+
+from attentionMask import segment_prefix_lm_mask
+
+# 不参与loss计算的位置，与nn.CrossEntropyLoss默认的ignore_index一致
+IGNORE_INDEX = -100
+
+
+class LengthBucketSampler(Sampler):
+    """
+    每次取batch_size * bucket_multiplier个样本组成一个桶，桶内按长度排序后切分成batch，
+    batch的顺序再打乱，兼顾随机性和batch内长度一致
+    """
+    def __init__(self, lengths, batch_size, bucket_multiplier=50, shuffle=True, drop_last=False):
+        self.lengths = lengths
+        self.batch_size = batch_size
+        self.bucket_size = batch_size * bucket_multiplier
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+
+    def __iter__(self):
+        indices = list(range(len(self.lengths)))
+        if self.shuffle:
+            random.shuffle(indices)
+        batches = []
+        for start in range(0, len(indices), self.bucket_size):
+            bucket = sorted(indices[start:start + self.bucket_size], key=lambda i: self.lengths[i])
+            for i in range(0, len(bucket), self.batch_size):
+                batch = bucket[i:i + self.batch_size]
+                if len(batch) == self.batch_size or not self.drop_last:
+                    batches.append(batch)
+        if self.shuffle:
+            random.shuffle(batches)
+        return iter(batches)
+
+    def __len__(self):
+        if self.drop_last:
+            return len(self.lengths) // self.batch_size
+        return (len(self.lengths) + self.batch_size - 1) // self.batch_size
+
+
+# 把样本按长度从长到短依次放入第一个放得下的行（first-fit），返回每行包含的样本
+def pack_samples(samples, max_length):
+    rows, row_lengths = [], []
+    for sample in sorted(samples, key=lambda s: len(s[0]) + len(s[1]), reverse=True):
+        length = len(sample[0]) + len(sample[1])
+        for row, row_length in enumerate(row_lengths):
+            if row_length + length <= max_length:
+                rows[row].append(sample)
+                row_lengths[row] += length
+                break
+        else:
+            rows.append([sample])
+            row_lengths.append(length)
+    return rows
+
+
+class UniLMCollator:
+    """
+    样本为(content_ids, target_ids)，content_ids为源序列（含cls和sep），target_ids为去掉cls的目标序列
+    返回：
+    input_ids: (rows, seq_len)，seq_len为batch内最长行的长度
+    labels: (rows, seq_len)，只有目标序列的位置有值，其余为IGNORE_INDEX
+    mask: (rows, seq_len, seq_len)，每个样本各自的前缀语言模型mask
+    position_ids: (rows, seq_len)，每个样本的位置编号从0开始
+    """
+    def __init__(self, pad_id=0, packing=False, max_length=None):
+        self.pad_id = pad_id
+        self.packing = packing
+        self.max_length = max_length
+
+    def __call__(self, samples):
+        if self.packing:
+            rows = pack_samples(samples, self.max_length)
+        else:
+            rows = [[sample] for sample in samples]
+        seq_len = max(sum(len(c) + len(t) for c, t in row) for row in rows)
+
+        input_ids = torch.full((len(rows), seq_len), self.pad_id, dtype=torch.long)
+        labels = torch.full((len(rows), seq_len), IGNORE_INDEX, dtype=torch.long)
+        position_ids = torch.zeros((len(rows), seq_len), dtype=torch.long)
+        # segment_ids：第几个样本（从1开始，padding为0）；prefix_ends：所在样本源序列结束的位置
+        segment_ids = torch.zeros((len(rows), seq_len), dtype=torch.long)
+        prefix_ends = torch.zeros((len(rows), seq_len), dtype=torch.long)
+        for r, row in enumerate(rows):
+            start = 0
+            for k, (content, target) in enumerate(row):
+                end = start + len(content) + len(target)
+                input_ids[r, start:end] = torch.LongTensor(list(content) + list(target))
+                labels[r, start + len(content):end] = torch.LongTensor(list(target))
+                position_ids[r, start:end] = torch.arange(end - start)
+                segment_ids[r, start:end] = k + 1
+                prefix_ends[r, start:end] = start + len(content)
+                start = end
+        mask = segment_prefix_lm_mask(segment_ids, prefix_ends)
+        return input_ids, labels, mask, position_ids
@@ -11,6 +11,7 @@ import torch.nn as nn
 from torch.utils.data import Dataset, DataLoader
 
 from config import *
+from dynamicBatch import LengthBucketSampler, UniLMCollator
 from transformers import BertModel, BertConfig, BertTokenizer
 
 bertConfig = BertConfig.from_pretrained(BERT_PATH)
@@ -25,14 +26,13 @@ class UniLMSeq2SeqModel(nn.Module):
         self.linear = nn.Linear(bertConfig.hidden_size, bertConfig.vocab_size)
         self.loss = nn.CrossEntropyLoss()
 
-    def forward(self, inputs, target=None, mask=None):
-        output = self.bert(inputs, attention_mask=mask).last_hidden_state
+    def forward(self, inputs, target=None, mask=None, position_ids=None):
+        output = self.bert(inputs, attention_mask=mask, position_ids=position_ids).last_hidden_state
         # [batch_size, seq_len, v_size]
         pred = self.linear(output)
         if target is not None:
-            # 由于输入序列是将源序列和目标序列拼接而成，所以pred和target不等长，源序列部分不需要计算loss，故将pred中的源序列部分截断
-            # 输入：[cls, 1, 2, 3, sep, 4, 5, sep] -> 截断：[4, 5, sep]
-            pred = pred[:, INPUT_MAX_LENGTH:, :]
+            # target与输入等长，源序列和padding的位置为IGNORE_INDEX，不计算loss
+            # 输入：[cls, 1, 2, 3, sep, 4, 5, sep, pad] -> target：[-100, -100, -100, -100, -100, 4, 5, sep, -100]
             # pred:[batch_size, seq_len, v_size] -> [batch_size × seq_len, v_size]
             # target:[batch_size, seq_len] -> [batch_size × seq_len]
             return self.loss(pred.contiguous().view(-1, pred.size(-1)), target.view(-1))
@@ -52,17 +52,17 @@ class UniLMDataset(Dataset):
                     data = json.loads(line)
                     title = data["title"]
                     content = data["content"]
-                    title_seq = tokenizer.encode(title, padding='max_length', truncation=True,
-                                                 max_length=TARGET_MAX_LENGTH)
-                    content_seq = tokenizer.encode(content, padding='max_length', truncation=True,
-                                                   max_length=INPUT_MAX_LENGTH)
-                    # 将前面的cls去掉作为目标序列，用于计算loss
-                    target = title_seq[1:]
-                    # 将content作为输入，title作为输出，进行拼接
-                    input_concat = torch.cat([torch.LongTensor(content_seq), torch.LongTensor(target)], dim=-1)
-                    self.data.append([input_concat, torch.LongTensor(target)])
+                    # 不再补齐到最大长度，padding在每个batch内由UniLMCollator完成
+                    title_seq = tokenizer.encode(title, truncation=True, max_length=TARGET_MAX_LENGTH)
+                    content_seq = tokenizer.encode(content, truncation=True, max_length=INPUT_MAX_LENGTH)
+                    # 将前面的cls去掉作为目标序列，content作为输入，拼接由UniLMCollator完成
+                    self.data.append([content_seq, title_seq[1:]])
             print(f"训练数据加载完成！")
 
+    # 每个样本拼接后的长度，用于按长度分桶
+    def lengths(self):
+        return [len(content) + len(target) for content, target in self.data]
+
 
     def __len__(self):
         return len(self.data)
@@ -71,59 +71,16 @@ class UniLMDataset(Dataset):
         return self.data[idx]
 
 
-def load_mask(s1_len, s2_len):
-    # 当对源序列和目标序列进行拼接时，去掉了中间的一个cls，所以mask的seq_len长度也要减一
-    seq_len = s1_len + s2_len - 1
-    """
-    第一步：先创建全零mask
-                    s2
-    s1 [0, 0, 0, 0, 0, 0, 0]
-       [0, 0, 0, 0, 0, 0, 0]
-       [0, 0, 0, 0, 0, 0, 0]
-       [0, 0, 0, 0, 0, 0, 0]
-    s2 [0, 0, 0, 0, 0, 0, 0]
-       [0, 0, 0, 0, 0, 0, 0]
-       [0, 0, 0, 0, 0, 0, 0]
-    """
-    mask = torch.zeros(seq_len, seq_len)
-    """
-    第二步：将左半区置为1
-                    s2
-    s1 [1, 1, 1, 1, 0, 0, 0]
-       [1, 1, 1, 1, 0, 0, 0]
-       [1, 1, 1, 1, 0, 0, 0]
-       [1, 1, 1, 1, 0, 0, 0]
-    s2 [1, 1, 1, 1, 0, 0, 0]
-       [1, 1, 1, 1, 0, 0, 0]
-       [1, 1, 1, 1, 0, 0, 0]
-    """
-    mask[:, :s1_len] = 1
-    """
-    第三步：将右下角置为下三角mask
-                    s2
-    s1 [1, 1, 1, 1, 0, 0, 0]
-       [1, 1, 1, 1, 0, 0, 0]
-       [1, 1, 1, 1, 0, 0, 0]
-       [1, 1, 1, 1, 0, 0, 0]
-    s2 [1, 1, 1, 1, 1, 0, 0]
-       [1, 1, 1, 1, 1, 1, 0]
-       [1, 1, 1, 1, 1, 1, 1]
-    """
-    for index, i in enumerate(range(s1_len, seq_len)):
-        # 将第i列的s1_len+index行置为1
-        mask[s1_len+index:, i] = 1
-    # 添加batch维度，和输入维度保持一致
-    return mask.contiguous().view(1, seq_len, seq_len)
-
-
 def main():
     model = UniLMSeq2SeqModel()
     if cuda:
         model = model.cuda()
-    train_data = DataLoader(UniLMDataset(CORPUS_PATH), batch_size=BATCH_SIZE, shuffle=True)
+    dataset = UniLMDataset(CORPUS_PATH)
+    # 长度相近的样本分到同一个batch，每个batch只补齐到batch内最长的样本，mask按样本各自的源序列长度生成
+    sampler = LengthBucketSampler(dataset.lengths(), BATCH_SIZE, BUCKET_MULTIPLIER)
+    collator = UniLMCollator(tokenizer.pad_token_id, PACKING, INPUT_MAX_LENGTH + TARGET_MAX_LENGTH - 1)
+    train_data = DataLoader(dataset, batch_sampler=sampler, collate_fn=collator)
     optim = torch.optim.Adam(model.parameters(), lr=LEARNING_RATE)
-    # 生成UniLM Seq-to-Seq mask
-    mask = load_mask(INPUT_MAX_LENGTH, TARGET_MAX_LENGTH)
 
     model.train()
     for epoch in range(EPOCHS):
@@ -133,8 +90,8 @@ def main():
         for i, batch_data in enumerate(train_data):
             if cuda:
                 batch_data = [b.cuda() for b in batch_data]
-            batch_x, batch_y = batch_data
-            loss = model(batch_x, batch_y, mask)
+            batch_x, batch_y, mask, position_ids = batch_data
+            loss = model(batch_x, batch_y, mask, position_ids)
             loss.backward()
             optim.step()
             optim.zero_grad()
@@ -152,5 +109,3 @@ def main():
 
 if __name__ == '__main__':
     main()
-    # mask = load_mask(4, 3)
-    # print(mask)
@@ -15,6 +15,13 @@ Config = {
     "use_crf": True,
     "dropout": 0.1,
     "tuning_type": "lora",  # "prompt" "prefix"
+    "lora_r": 8,
+    "lora_alpha": 16,
+    "lora_dropout": 0.1,
+    "lora_target_modules": ["query", "key", "value", "attention.output.dense"],
+    "merged_model_path": "./peft_model/lora_merged.pth",   # LoRA合并进bert后导出的完整权重，存在时预测直接使用
+    "quantized_model_path": "./peft_model/lora_merged_int8.pth",   # quantize.py保存的动态int8量化模型
+    "use_quantized": False,   # predict.py是否加载量化模型（只能在CPU上推理）
     "F1_type": 0     # 计算F1的方式：0为微观，1为宏观
 }
 
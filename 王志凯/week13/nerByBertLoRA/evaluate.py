@@ -32,8 +32,8 @@ class Evaluator:
                 batch_y_pred = self.model(batch_x)
                 # 统计各个实体
                 self.countEntity(batch_y, batch_y_pred)
-            # 计算准确率、召回率、F1
-            self.calculateEntity()
+            # 计算准确率、召回率、F1，返回F1
+            return self.calculateEntity()
 
     def countEntity(self, batch_true_labels, batch_pred_labels):
         assert len(batch_pred_labels) == len(batch_true_labels)
@@ -99,13 +99,13 @@ class Evaluator:
                 print(f"类别-{category} 预测结果：准确率P={p}，召回率R={r}，F1={f1}")
         if self.F1_type == 1:
             print(f"各个标签类别平均F1={np.mean(f1_all)}")
-            return
+            return np.mean(f1_all)
         # 微观F1：统计所有类别，一起计算P/R/F1
         p = correct_count / (predict_count + EPSON)
         r = correct_count / (total_count + EPSON)
         f1 = 2 * p * r / (p + r + EPSON)
         print(f"统计所有标签类别结果：准确率P={p}，召回率R={r}，F1={f1}")
-        return
+        return f1
 
 
 
@@ -0,0 +1,218 @@
+# -*- coding:utf-8 -*-
+
+"""
+LoRA权重的合并导出与多适配器切换，只依赖main.py保存的peft权重文件（不需要peft库）：
+1.merge_lora / export_merged_model：把 scaling * B @ A 加到bert对应的线性层权重上，
+  导出完整的NerClassificationModel权重，预测时不再经过peft和LoRA分支，没有额外开销
+2.AdapterRegistry：一个已加载的基础模型上注册多个任务（租户）的适配器，切换时只改写目标线性层、
+  分类层和crf的权重，不需要为每个适配器重新从磁盘加载一份bert
+3.MixedLoraModel：同一个batch中每行使用不同的适配器，一次前向完成，不需要按适配器分别组batch
+"""
+
+import torch
+import torch.nn as nn
+
+# get_peft_model包装后参数名的前缀
+PEFT_PREFIX = "base_model.model."
+
+
+class LoraAdapter:
+    def __init__(self, lora, head, scaling):
+        self.lora = lora          # 线性层名称 -> (A, B)，A为(r, in_features)，B为(out_features, r)
+        self.head = head          # 分类层、crf等随任务训练的参数，名称与NerClassificationModel一致
+        self.scaling = scaling    # lora_alpha / r
+
+    # 线性层权重的增量：scaling * B @ A，形状与nn.Linear.weight一致
+    def delta(self, name):
+        A, B = self.lora[name]
+        return (B @ A) * self.scaling
+
+
+def parse_peft_weight(peft_weight, lora_alpha):
+    """
+    解析main.py保存的peft权重（只包含requires_grad的参数）：
+    ...query.lora_A.default.weight -> lora[...query][0]
+    classifier.modules_to_save.default.weight -> head[classifier.weight]
+    classifier.original_module.* 为未训练的原始分类层，丢弃
+    """
+    lora, head = {}, {}
+    for key, value in peft_weight.items():
+        key = key[len(PEFT_PREFIX):] if key.startswith(PEFT_PREFIX) else key
+        if ".original_module." in key:
+            continue
+        for index, part in enumerate((".lora_A.default.weight", ".lora_B.default.weight")):
+            if key.endswith(part):
+                lora.setdefault(key[:-len(part)], [None, None])[index] = value.float()
+                break
+        else:
+            head[key.replace(".modules_to_save.default.", ".")] = value
+    r = next(iter(lora.values()))[0].shape[0]
+    return LoraAdapter({name: tuple(ab) for name, ab in lora.items()}, head, lora_alpha / r)
+
+
+def load_adapter(path, lora_alpha):
+    return parse_peft_weight(torch.load(path, map_location="cpu"), lora_alpha)
+
+
+# 将适配器直接合并进未经peft包装的NerClassificationModel（原地修改）
+@torch.no_grad()
+def merge_lora(model, adapter):
+    for name in adapter.lora:
+        weight = model.get_submodule(name).weight
+        weight += adapter.delta(name).to(weight.device, weight.dtype)
+    model.load_state_dict(adapter.head, strict=False)
+    return model
+
+
+def export_merged_model(config, adapter_path, output_path):
+    from model import NerClassificationModel
+    model = NerClassificationModel(config)
+    merge_lora(model, load_adapter(adapter_path, config["lora_alpha"]))
+    state_dict = {k: v.to("cpu") for k, v in model.state_dict().items()}
+    torch.save(state_dict, output_path)
+    return output_path
+
+
+class AdapterRegistry:
+    """
+    model为未经peft包装的NerClassificationModel，所有适配器共享其中的bert
+    注册时只保存LoRA矩阵和分类层/crf参数；第一次注册时备份被改写的线性层原始权重，切换时由原始权重重新计算，
+    不会因为反复加减增量而累积误差
+    """
+    def __init__(self, model, lora_alpha):
+        self.model = model
+        self.lora_alpha = lora_alpha
+        self.adapters = {}
+        self.base_weights = {}
+        self.base_head = None
+        self.active = None
+
+    def register(self, name, adapter):
+        if not isinstance(adapter, LoraAdapter):
+            adapter = load_adapter(adapter, self.lora_alpha)
+        for module_name in adapter.lora:
+            if module_name not in self.base_weights:
+                self.base_weights[module_name] = self.model.get_submodule(module_name).weight.detach().clone()
+        if self.base_head is None:
+            state_dict = self.model.state_dict()
+            self.base_head = {k: state_dict[k].clone() for k in adapter.head}
+        self.adapters[name] = adapter
+
+    def unregister(self, name):
+        if self.active == name:
+            self.deactivate()
+        del self.adapters[name]
+
+    @torch.no_grad()
+    def activate(self, name):
+        if name == self.active:
+            return self.model
+        adapter = self.adapters[name]
+        for module_name, base in self.base_weights.items():
+            weight = self.model.get_submodule(module_name).weight
+            if module_name in adapter.lora:
+                weight.copy_(base + adapter.delta(module_name).to(base.device, base.dtype))
+            else:
+                weight.copy_(base)
+        self.model.load_state_dict(adapter.head, strict=False)
+        self.active = name
+        return self.model
+
+    # 恢复为基础模型
+    @torch.no_grad()
+    def deactivate(self):
+        for module_name, base in self.base_weights.items():
+            self.model.get_submodule(module_name).weight.copy_(base)
+        if self.base_head is not None:
+            self.model.load_state_dict(self.base_head, strict=False)
+        self.active = None
+        return self.model
+
+    def __contains__(self, name):
+        return name in self.adapters
+
+
+class MultiLoraLinear(nn.Module):
+    """
+    替换bert中的目标线性层：同一个batch中每行可以使用不同的适配器
+    y = x W^T + b + (x A[i]^T) B[i]^T，i为该行的适配器下标，scaling已经乘进B中
+    下标0为空适配器（A、B全为0），即只使用基础模型；不同rank的适配器补0到相同的rank
+    """
+    def __init__(self, base, A, B):
+        super(MultiLoraLinear, self).__init__()
+        self.base = base
+        self.register_buffer("A", A)    # (adapter_num, r, in_features)
+        self.register_buffer("B", B)    # (adapter_num, out_features, r)
+        self.adapter_ids = None         # (batch_size,)，每次前向之前由MixedLoraModel设置
+
+    def forward(self, x):
+        output = self.base(x)
+        if self.adapter_ids is None:
+            return output
+        # 按行取出各自的A、B：(batch_size, r, in_features)、(batch_size, out_features, r)
+        hidden = torch.einsum("bsi,bri->bsr", x, self.A[self.adapter_ids])
+        return output + torch.einsum("bsr,bor->bso", hidden, self.B[self.adapter_ids])
+
+
+class MixedLoraModel(nn.Module):
+    """
+    一次前向处理来自不同适配器（租户）的请求，不再按适配器分别组batch：
+    - bert中的目标线性层替换为MultiLoraLinear，按行取各自的LoRA矩阵
+    - 分类层按行取各自的权重；crf按适配器分组解码（相对bert计算量很小）
+    model为未经peft包装、也没有合并过适配器的NerClassificationModel，adapters为{名称: LoraAdapter}
+    """
+    def __init__(self, model, adapters):
+        super(MixedLoraModel, self).__init__()
+        self.model = model
+        self.names = [None] + list(adapters)
+        self.index = {name: i for i, name in enumerate(self.names)}
+        adapters = list(adapters.values())
+        r = max(A.shape[0] for adapter in adapters for A, _ in adapter.lora.values())
+        self.lora_layers = []
+        for module_name in sorted({name for adapter in adapters for name in adapter.lora}):
+            base = model.get_submodule(module_name)
+            A = torch.zeros(len(self.names), r, base.in_features)
+            B = torch.zeros(len(self.names), base.out_features, r)
+            for i, adapter in enumerate(adapters, 1):
+                if module_name in adapter.lora:
+                    a, b = adapter.lora[module_name]
+                    A[i, :a.shape[0]] = a
+                    B[i, :, :b.shape[1]] = b * adapter.scaling
+            layer = MultiLoraLinear(base, A.to(base.weight.device), B.to(base.weight.device))
+            parent_name, _, child_name = module_name.rpartition(".")
+            setattr(model.get_submodule(parent_name), child_name, layer)
+            self.lora_layers.append(layer)
+        # 分类层和crf参数，没有提供的适配器使用基础模型的参数
+        # crf解码时会把参数写回self.model.crf，所以基础模型的参数需要复制一份
+        base_head = {k: v.detach().clone() for k, v in model.state_dict().items()
+                     if k.startswith(("classifier.", "crf."))}
+        heads = [base_head] + [{k: adapter.head.get(k, v) for k, v in base_head.items()} for adapter in adapters]
+        self.register_buffer("classifier_weight", torch.stack([h["classifier.weight"] for h in heads]))
+        self.register_buffer("classifier_bias", torch.stack([h["classifier.bias"] for h in heads]))
+        self.crf_heads = heads
+
+    @torch.no_grad()
+    def forward(self, input_ids, adapter_names):
+        adapter_ids = torch.tensor([self.index[name] for name in adapter_names],
+                                   dtype=torch.long, device=input_ids.device)
+        for layer in self.lora_layers:
+            layer.adapter_ids = adapter_ids
+        try:
+            x = self.model.encoder(input_ids).last_hidden_state
+        finally:
+            for layer in self.lora_layers:
+                layer.adapter_ids = None
+        emissions = torch.einsum("bsh,blh->bsl", x, self.classifier_weight[adapter_ids])
+        emissions = emissions + self.classifier_bias[adapter_ids].unsqueeze(1)
+        if not self.model.use_crf:
+            return torch.softmax(emissions, dim=-1)
+        # 同一个适配器的行一起用该适配器的转移矩阵解码，结果按原来的行顺序返回
+        results = [None] * len(adapter_names)
+        crf = self.model.crf
+        for adapter_id in adapter_ids.unique().tolist():
+            rows = (adapter_ids == adapter_id).nonzero(as_tuple=True)[0]
+            crf.load_state_dict({k[len("crf."):]: v for k, v in self.crf_heads[adapter_id].items()
+                                 if k.startswith("crf.")})
+            for row, labels in zip(rows.tolist(), crf.decode(emissions[rows])):
+                results[row] = labels
+        return results
@@ -7,11 +7,12 @@ from loader import load_data
 from config import Config
 from evaluate import Evaluator
 from model import NerClassificationModel
+from loraAdapter import export_merged_model
 from peft import get_peft_model, LoraConfig, PromptTuningConfig, PrefixTuningConfig
 cuda = torch.cuda.is_available()
 
 
-def load_peft_tuning(model, tuning_type):
+def load_peft_tuning(model, tuning_type, config=Config):
     """
     task_type参数说明：用于向PEFT库指明模型要执行的任务类型。它通常不改变底层的算法逻辑，但有时会影响PEFT模型初始化时的内部行为
     SEQ_CLS             序列分类（如情感分析）
@@ -23,10 +24,10 @@ def load_peft_tuning(model, tuning_type):
     """
     if tuning_type == "lora":
         peft_config = LoraConfig(
-            r=8,
-            lora_alpha=16,
-            lora_dropout=0.1,
-            target_modules=["query", "key", "value", "attention.output.dense"],
+            r=config["lora_r"],
+            lora_alpha=config["lora_alpha"],
+            lora_dropout=config["lora_dropout"],
+            target_modules=config["lora_target_modules"],
             task_type="TOKEN_CLS"
         )
     elif tuning_type == "prompt":
@@ -53,7 +54,7 @@ def load_peft_tuning(model, tuning_type):
 def main(config):
     model = NerClassificationModel(config)
     # 加载peft参数，并设置非冻结权重
-    model = load_peft_tuning(model, config["tuning_type"])
+    model = load_peft_tuning(model, config["tuning_type"], config)
     if cuda:
         print("将模型迁移至GPU")
         model = model.cuda()
@@ -93,6 +94,9 @@ def main(config):
     # 只保存peft权重
     saved_params = {k: v.to("cpu") for k, v in model.named_parameters() if v.requires_grad}
     torch.save(saved_params, model_path)
+    # LoRA权重合并进bert后导出完整模型，预测时不再需要peft和LoRA分支
+    if config["tuning_type"] == "lora":
+        export_merged_model(config, model_path, config["merged_model_path"])
 
 
 if __name__ == "__main__":
@@ -5,20 +5,33 @@ import torch
 from config import Config, Labels
 from loader import sentence2sequence, load_vocab
 from model import NerClassificationModel
+from loraAdapter import AdapterRegistry, MixedLoraModel, load_adapter
+from quantize import load_quantized_model
 from peft import get_peft_model, LoraConfig, PromptTuningConfig, PrefixTuningConfig
 cuda = torch.cuda.is_available()
 
 
+# 加载LoRA合并后导出的完整权重，推理与普通bert完全一致
+def load_merged_model(config, merged_model_path):
+    model = NerClassificationModel(config)
+    model.load_state_dict(torch.load(merged_model_path, map_location="cpu"))
+    return model
+
+
 def load_model(config):
+    tuning_type = config["tuning_type"]
+    if tuning_type == "lora" and config["use_quantized"]:
+        return load_quantized_model(config, config["quantized_model_path"])
+    if tuning_type == "lora" and os.path.exists(config["merged_model_path"]):
+        return load_merged_model(config, config["merged_model_path"])
     model = NerClassificationModel(config)
     model_dir = config["model_save_dir"]
-    tuning_type = config["tuning_type"]
     if tuning_type == "lora":
         peft_config = LoraConfig(
-            r=8,
-            lora_alpha=16,
-            lora_dropout=0.1,
-            target_modules=["query", "key", "value", "attention.output.dense"],
+            r=config["lora_r"],
+            lora_alpha=config["lora_alpha"],
+            lora_dropout=config["lora_dropout"],
+            target_modules=config["lora_target_modules"],
             task_type="TOKEN_CLS"
         )
         peft_model_path = os.path.join(model_dir, "lora.pth")
@@ -46,6 +59,28 @@ def load_model(config):
     model.load_state_dict(state_dict, strict=False)
     return model
 
+# 多个适配器共用一个基础模型：adapter_paths为{适配器名称: peft权重路径}，使用前调用registry.activate(名称)
+def load_adapter_registry(config, adapter_paths):
+    registry = AdapterRegistry(NerClassificationModel(config), config["lora_alpha"])
+    for name, path in adapter_paths.items():
+        registry.register(name, path)
+    return registry
+
+# 不同适配器的请求混在一个batch中预测：adapter_paths为{适配器名称: peft权重路径}
+def load_mixed_model(config, adapter_paths):
+    adapters = {name: load_adapter(path, config["lora_alpha"]) for name, path in adapter_paths.items()}
+    return MixedLoraModel(NerClassificationModel(config), adapters).eval()
+
+
+# adapter_names与sentences一一对应，为每句话使用的适配器名称（None表示基础模型）
+def predict_mixed(sentences, adapter_names, mixed_model):
+    vocab_dict = load_vocab(Config["vocab_path"])
+    sequences = torch.LongTensor([sentence2sequence(text, vocab_dict, Config["max_length"]) for text in sentences])
+    pred_labels = mixed_model(sequences, adapter_names)
+    if not Config["use_crf"]:
+        pred_labels = torch.argmax(pred_labels, dim=-1)
+    return match_entity(sentences, pred_labels)
+
 def match_entity(sentences, pred_labels):
     assert len(sentences) == len(pred_labels)
     new_sentences = []
@@ -0,0 +1,56 @@
+# -*- coding:utf-8 -*-
+
+"""
+训练后动态int8量化：先把LoRA合并进bert，再把线性层的权重量化为int8，激活值在推理时动态量化
+只能在CPU上推理，模型体积约为原来的1/4，推理速度约提升2~3倍
+用法：先运行main.py训练并导出合并后的模型，再运行本文件，对比量化前后的F1并保存量化后的模型
+"""
+
+import os
+import time
+import torch
+import torch.nn as nn
+from config import Config
+from evaluate import Evaluator
+from model import NerClassificationModel
+from loraAdapter import export_merged_model
+
+
+def quantize_model(model):
+    return torch.ao.quantization.quantize_dynamic(model.cpu().eval(), {nn.Linear}, dtype=torch.qint8)
+
+
+# 量化后的权重只能加载到同样结构的量化模型中：先创建模型并量化，再加载权重
+def load_quantized_model(config, quantized_model_path):
+    model = quantize_model(NerClassificationModel(config))
+    model.load_state_dict(torch.load(quantized_model_path, weights_only=False))
+    return model
+
+
+def evaluate(config, model):
+    start = time.time()
+    f1 = Evaluator(config, model).predict()
+    return f1, time.time() - start
+
+
+def main(config):
+    merged_model_path = config["merged_model_path"]
+    if not os.path.exists(merged_model_path):
+        export_merged_model(config, os.path.join(config["model_save_dir"], "lora.pth"), merged_model_path)
+    model = NerClassificationModel(config)
+    model.load_state_dict(torch.load(merged_model_path, map_location="cpu"))
+    f1, cost = evaluate(config, model.eval())
+
+    quantized_model = quantize_model(model)
+    quantized_f1, quantized_cost = evaluate(config, quantized_model)
+    torch.save(quantized_model.state_dict(), config["quantized_model_path"])
+
+    size = os.path.getsize(merged_model_path) / 1024 / 1024
+    quantized_size = os.path.getsize(config["quantized_model_path"]) / 1024 / 1024
+    print(f"量化前：F1={f1:.4f}，测试耗时{cost:.2f}s，模型大小{size:.1f}MB；"
+          f"量化后：F1={quantized_f1:.4f}（变化{quantized_f1 - f1:+.4f}），"
+          f"测试耗时{quantized_cost:.2f}s，模型大小{quantized_size:.1f}MB")
+
+
+if __name__ == "__main__":
+    main(Config)
@@ -2,48 +2,104 @@ import numpy as np
 import matplotlib.pyplot as plt
 import pandas as pd
 import re
-from collections import defaultdict, Counter
+import heapq
+from collections import defaultdict, Counter, OrderedDict
 import docx
 import unicodedata  # 处理Unicode字符的辅助库
+from concurrent.futures import ProcessPoolExecutor
+
+# 预切分规则：连续汉字、连续字母、连续数字各为一个片段，其余非空白字符单独成为一个片段
+# 训练时只统计去重后的片段频次，合并不跨越片段边界
+PRETOKENIZE_PATTERN = r'[\u4e00-\u9fff]+|[A-Za-z]+|[0-9]+|[^\s\u4e00-\u9fffA-Za-z0-9]'
 
 
 class UnicodeBPETokenizer:
-    def __init__(self, vocab_size=1000, end_token='<eos>'):
+    def __init__(self, vocab_size=1000, end_token='<eos>', cache_size=10000):
         """
         适配所有Unicode字符的BPE分词器
         :param vocab_size: 词汇表大小
         :param end_token: 序列结束标记（避免与普通字符冲突）
+        :param cache_size: 分词缓存的最大条目数（按片段缓存分词结果）
         """
         self.vocab_size = vocab_size
         self.end_token = end_token
         self.vocab = {}  # 最终词汇表 {token: idx}
         self.merges = {}  # 合并历史 {(char1, char2): new_token}
         self.reverse_vocab = {}  # 反向词汇表 {idx: token}
-
-    def _get_stats(self, char_sequences):
-        """统计Unicode字符对的频率（通用版）"""
+        self.merge_ranks = {}  # 合并顺序 {(char1, char2): rank}
+        self.cache_size = cache_size
+        self._cache = OrderedDict()  # 分词缓存 {(片段, 是否为最后一段): 子词列表}
+        self.pretokenize = PRETOKENIZE_PATTERN  # 预切分规则，为None时按整段文本训练/分词（兼容旧词表）
+
+    def _build_merge_ranks(self):
+        """根据合并历史的顺序生成rank，并清空分词缓存（训练或加载词表后调用）"""
+        self.merge_ranks = {pair: rank for rank, pair in enumerate(self.merges)}
+        self._cache.clear()
+
+    def _build_pair_index(self, tokens, nxt, weights):
+        """统计相邻字符对的频率（按所在片段的出现次数加权），并记录每个字符对出现的位置（左侧字符的下标）"""
         pairs = defaultdict(int)
-        for seq, freq in char_sequences.items():
-            chars = seq.split()
-            for i in range(len(chars) - 1):
-                # 统计所有相邻Unicode字符对
-                pair = (chars[i], chars[i + 1])
-                pairs[pair] += freq
-        return pairs
-
-    def _merge_pair(self, char_sequences, pair, new_token):
-        """合并指定的Unicode字符对"""
-        # 转义特殊字符（如标点、符号），避免正则匹配异常
-        pattern = re.escape(' '.join(pair))
-        merged_sequences = {}
-
-        for seq, freq in char_sequences.items():
-            merged_seq = re.sub(pattern, new_token, seq)
-            merged_sequences[merged_seq] = freq
-
-        return merged_sequences
-
-    def _normalize_unicode(self, text):
+        positions = defaultdict(list)
+        for i in range(len(tokens)):
+            if nxt[i] == -1:
+                continue
+            pair = (tokens[i], tokens[nxt[i]])
+            pairs[pair] += weights[i]
+            positions[pair].append(i)
+        return pairs, positions
+
+    def _merge_pair(self, tokens, prev, nxt, weights, pair, new_token, pairs, positions, heap):
+        """
+        在双向链表上合并指定的字符对，只更新被合并位置左右相邻的字符对计数
+        tokens中被合并掉的位置置为None，prev/nxt记录每个位置前后相邻的有效位置（-1表示没有，片段之间不相连）
+        """
+        changed = set()
+
+        def update(p, delta, pos=None):
+            pairs[p] += delta * weights[i]
+            changed.add(p)
+            if pos is not None:
+                positions[p].append(pos)
+
+        # 从左到右依次合并，重叠的字符对（如 a a a）只合并靠左的一个
+        for i in sorted(set(positions.pop(pair, []))):
+            j = nxt[i]
+            # 位置记录已失效（被合并掉或已经变成其他字符对）时跳过
+            if tokens[i] != pair[0] or j == -1 or tokens[j] != pair[1]:
+                continue
+            left, right = prev[i], nxt[j]
+            if left != -1:
+                update((tokens[left], tokens[i]), -1)
+                update((tokens[left], new_token), 1, left)
+            if right != -1:
+                update((tokens[j], tokens[right]), -1)
+                update((new_token, tokens[right]), 1, i)
+            tokens[i] = new_token
+            tokens[j] = None
+            nxt[i] = right
+            if right != -1:
+                prev[right] = i
+        pairs.pop(pair, None)
+        changed.discard(pair)
+
+        # 计数变化的字符对重新入堆，堆里计数过期的旧条目在弹出时丢弃
+        for p in changed:
+            if pairs.get(p, 0) > 0:
+                heapq.heappush(heap, (-pairs[p], p))
+            else:
+                pairs.pop(p, None)
+                positions.pop(p, None)
+
+    def _pop_best_pair(self, pairs, heap):
+        """取出当前频率最高的字符对（频率相同时取字典序最小的），没有可合并的字符对时返回None"""
+        while heap:
+            neg_count, pair = heapq.heappop(heap)
+            if pairs.get(pair, 0) == -neg_count:
+                return pair
+        return None
+
+    @staticmethod
+    def _normalize_unicode(text):
         """
         标准化Unicode字符（解决同字异形问题）
         - NFC归一化：合并组合字符（如 é = e + ´）
@@ -57,43 +113,52 @@ class UnicodeBPETokenizer:
         cleaned = re.sub(r'\s+', ' ', cleaned).strip()
         return cleaned
 
-    def train(self, text):
+    def train(self, text, num_workers=0):
         """
         训练通用BPE分词器（支持所有Unicode字符）
         :param text: 包含任意Unicode字符的文本
+        :param num_workers: 统计片段频次的进程数（0表示单进程）
         """
-        # 1. Unicode标准化和预处理
-        clean_text = self._normalize_unicode(text)
-        if not clean_text:
+        # 1. 预切分并统计片段频次（Unicode标准化在每个分段中完成，可多进程并行）
+        pattern = self.pretokenize or PRETOKENIZE_PATTERN
+        chunk_counts = count_chunks_parallel(text, num_workers, pattern)
+        if not chunk_counts:
             raise ValueError("训练文本为空或仅包含无效字符！")
-
-        # 2. 拆分所有Unicode字符（list()天然支持Unicode）
-        # 整段文本作为一个序列，按字符拆分并用空格分隔
-        char_seq = ' '.join(list(clean_text)) + f' {self.end_token}'
-        char_sequences = {char_seq: 1}  # 频率初始化为1
+        self.pretokenize = pattern
+
+        # 2. 去重后的片段依次拆成字符首尾相接，片段之间断开，每个位置记录所在片段的频次
+        tokens, weights, prev, nxt = [], [], [], []
+        for chunk, freq in chunk_counts.items():
+            start = len(tokens)
+            for k, char in enumerate(chunk):
+                tokens.append(char)
+                weights.append(freq)
+                prev.append(start + k - 1 if k > 0 else -1)
+                nxt.append(start + k + 1 if k < len(chunk) - 1 else -1)
 
         # 3. 构建初始词汇表（所有唯一Unicode字符 + 结束标记）
-        all_chars = set(char_seq.split())
+        all_chars = set(tokens) | {self.end_token}
         self.vocab = {char: idx for idx, char in enumerate(sorted(all_chars))}
         self.reverse_vocab = {idx: char for char, idx in self.vocab.items()}
         current_vocab_size = len(self.vocab)
 
         # 4. 迭代合并字符对（直到达到词汇表大小）
+        # 字符对频率只统计一次，之后每次合并只更新受影响的相邻位置，最高频字符对用堆选取
+        pairs, positions = self._build_pair_index(tokens, nxt, weights)
+        heap = [(-count, pair) for pair, count in pairs.items()]
+        heapq.heapify(heap)
         while current_vocab_size < self.vocab_size:
-            # 统计字符对频率
-            pairs = self._get_stats(char_sequences)
-            if not pairs:
-                break  # 无可用合并对
-
             # 选择频率最高的字符对
-            best_pair = max(pairs, key=pairs.get)
+            best_pair = self._pop_best_pair(pairs, heap)
+            if best_pair is None:
+                break  # 无可用合并对
             new_token = ''.join(best_pair)
 
             # 记录合并规则
             self.merges[best_pair] = new_token
 
             # 合并字符对
-            char_sequences = self._merge_pair(char_sequences, best_pair, new_token)
+            self._merge_pair(tokens, prev, nxt, weights, best_pair, new_token, pairs, positions, heap)
 
             # 更新词汇表
             if new_token not in self.vocab:
@@ -101,6 +166,8 @@ class UnicodeBPETokenizer:
                 self.reverse_vocab[current_vocab_size] = new_token
                 current_vocab_size += 1
 
+        self._build_merge_ranks()
+
     def tokenize(self, text):
         """
         对任意Unicode文本进行BPE分词
@@ -115,26 +182,70 @@ class UnicodeBPETokenizer:
         if not clean_text:
             return []
 
-        # 2. 拆分字符并添加结束标记
-        chars = list(clean_text) + [self.end_token]
-
-        # 3. 迭代合并（反向应用训练的合并规则）
-        while len(chars) > 1:
-            # 生成所有相邻字符对
-            pairs = [(chars[i], chars[i + 1]) for i in range(len(chars) - 1)]
-            # 筛选出在合并规则中的有效对
-            valid_pairs = [p for p in pairs if p in self.merges]
-
-            if not valid_pairs:
-                break
-
-            # 选择最早合并的字符对（保证合并顺序一致）
-            best_pair = min(valid_pairs, key=lambda p: list(self.merges.keys()).index(p))
-            # 执行合并
-            idx = pairs.index(best_pair)
-            chars = chars[:idx] + [self.merges[best_pair]] + chars[idx + 2:]
-
-        return chars
+        # 2. 按训练时的预切分规则切分片段，空格单独作为子词，末尾添加结束标记
+        # 每个片段的分词结果放入LRU缓存，重复出现的片段直接复用
+        if self.pretokenize is not None:
+            tokens = []
+            for chunk in re.findall(self.pretokenize + r'| ', clean_text):
+                tokens.extend(self._tokenize_chunk(chunk, False))
+            tokens.append(self.end_token)
+            return tokens
+
+        # 旧词表（整段文本训练）：按空格预先切分片段，训练时空格不参与合并，切分后结果不变
+        # 每个片段的分词结果放入LRU缓存，重复出现的片段直接复用
+        chunks = re.split(r'( )', clean_text)
+        tokens = []
+        for k, chunk in enumerate(chunks):
+            if chunk:
+                tokens.extend(self._tokenize_chunk(chunk, k == len(chunks) - 1))
+        return tokens
+
+    def _tokenize_chunk(self, chunk, is_last):
+        """对单个片段分词（最后一个片段末尾添加结束标记），结果写入有界LRU缓存"""
+        key = (chunk, is_last)
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+
+        chars = list(chunk) + ([self.end_token] if is_last else [])
+        tokens = self._apply_merges(chars)
+
+        self._cache[key] = tokens
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return tokens
+
+    def _apply_merges(self, chars):
+        """
+        按rank从小到大合并相邻字符对（与训练时的合并顺序一致）
+        字符用双向链表保存，候选字符对以(rank, 位置)放入堆中，整体为O(n log n)
+        """
+        ranks = self.merge_ranks
+        chars = list(chars)
+        prev = list(range(-1, len(chars) - 1))
+        nxt = list(range(1, len(chars))) + [-1]
+        heap = [(ranks[pair], i) for i, pair in enumerate(zip(chars, chars[1:])) if pair in ranks]
+        heapq.heapify(heap)
+
+        while heap:
+            rank, i = heapq.heappop(heap)
+            j = nxt[i]
+            # 该位置已被合并掉或字符对已变化，跳过过期条目
+            if chars[i] is None or j == -1 or ranks.get((chars[i], chars[j])) != rank:
+                continue
+            chars[i] = self.merges[(chars[i], chars[j])]
+            chars[j] = None
+            nxt[i] = nxt[j]
+            if nxt[i] != -1:
+                prev[nxt[i]] = i
+
+            # 新子词与左右相邻字符组成的字符对入堆
+            if prev[i] != -1 and (chars[prev[i]], chars[i]) in ranks:
+                heapq.heappush(heap, (ranks[(chars[prev[i]], chars[i])], prev[i]))
+            if nxt[i] != -1 and (chars[i], chars[nxt[i]]) in ranks:
+                heapq.heappush(heap, (ranks[(chars[i], chars[nxt[i]])], i))
+
+        return [char for char in chars if char is not None]
 
     def detokenize(self, tokens):
         """
@@ -156,7 +267,8 @@ class UnicodeBPETokenizer:
                 'vocab': self.vocab,
                 'merges': merges_serializable,
                 'end_token': self.end_token,
-                'vocab_size': self.vocab_size
+                'vocab_size': self.vocab_size,
+                'pretokenize': self.pretokenize
             }
             json.dump(data, f, ensure_ascii=False, indent=2)
 
@@ -169,7 +281,9 @@ class UnicodeBPETokenizer:
         self.merges = {tuple(k.split(',')): v for k, v in data['merges'].items()}
         self.end_token = data['end_token']
         self.vocab_size = data['vocab_size']
+        self.pretokenize = data.get('pretokenize')
         self.reverse_vocab = {idx: token for token, idx in self.vocab.items()}
+        self._build_merge_ranks()
 
     def encode(self, text):
         """核心用法1：文本 → 子词 → 数字ID（模型输入）"""
@@ -186,6 +300,26 @@ class UnicodeBPETokenizer:
         return text
 
 
+def count_chunks(text, pattern=PRETOKENIZE_PATTERN):
+    """Unicode标准化后按预切分规则统计片段频次"""
+    return Counter(re.findall(pattern, UnicodeBPETokenizer._normalize_unicode(text)))
+
+
+def count_chunks_parallel(text, num_workers=0, pattern=PRETOKENIZE_PATTERN, shard_lines=10000):
+    """
+    map-reduce统计片段频次：文本按行分成若干段，每段在进程池中单独统计，最后把各段的Counter相加
+    """
+    if num_workers <= 1:
+        return count_chunks(text, pattern)
+    lines = text.splitlines(keepends=True)
+    shards = [''.join(lines[i:i + shard_lines]) for i in range(0, len(lines), shard_lines)]
+    counter = Counter()
+    with ProcessPoolExecutor(num_workers) as pool:
+        for shard_counter in pool.map(count_chunks, shards, [pattern] * len(shards)):
+            counter.update(shard_counter)
+    return counter
+
+
 def read_word_document(file_path):
     """
     读取Word文档（.docx）的所有Unicode字符
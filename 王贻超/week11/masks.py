@@ -0,0 +1,44 @@
+#coding:utf8
+
+"""
+注意力掩码构造：全部使用张量运算，不再逐行/逐列循环填充
+mask[b, i, j] = 1 表示第i个位置可以看到第j个位置
+同一个batch中每个样本可以有不同的前缀（源序列/标题）长度
+"""
+
+from functools import lru_cache
+
+import torch
+
+
+def prefix_lm_mask(prefix_lens, seq_len, device=None, dtype=torch.float):
+    """
+    前缀语言模型掩码（UniLM seq2seq / SFT）：
+    - 前缀内部互相可见，前缀看不到后面的位置
+    - 前缀之后的位置可以看到整个前缀，内部遵循因果关系
+    即：位置i能看到位置j，当且仅当 j < prefix_len 或 j <= i
+    prefix_lens: 每个样本的前缀长度，形状为(batch_size,)
+    返回 (batch_size, seq_len, seq_len)
+    """
+    prefix_lens = torch.as_tensor(prefix_lens, device=device).view(-1, 1, 1)
+    positions = torch.arange(seq_len, device=prefix_lens.device)
+    visible = (positions.view(1, 1, -1) < prefix_lens) | (positions.view(1, -1) <= positions.view(-1, 1)).unsqueeze(0)
+    return visible.to(dtype)
+
+
+# padding位置（key_valid为False）对所有位置不可见，key_valid形状为(batch_size, seq_len)
+def apply_padding_mask(mask, key_valid):
+    return mask * key_valid.unsqueeze(1).to(mask.dtype)
+
+
+@lru_cache(maxsize=64)
+def _cached_prefix_lm_mask(src_len, tgt_len, device, dtype):
+    return prefix_lm_mask([src_len], src_len + tgt_len, device, dtype)
+
+
+def cached_prefix_lm_mask(src_len, tgt_len, device=None, dtype=torch.float):
+    """
+    固定长度的前缀掩码按(src_len, tgt_len, device, dtype)缓存，返回(1, seq_len, seq_len)
+    返回的张量为多处共享，使用时不要原地修改，需要batch维度时用expand
+    """
+    return _cached_prefix_lm_mask(src_len, tgt_len, torch.device(device or "cpu"), dtype)
@@ -8,6 +8,8 @@ import random
 import os
 import json
 from transformers import BertModel, BertTokenizer
+from sampler import sample
+from masks import prefix_lm_mask, apply_padding_mask, cached_prefix_lm_mask
 
 """
 基于BERT的SFT语言模型
@@ -126,32 +128,30 @@ def build_sample(vocab, max_length, corpus):
     # 构建SFT mask: 标题部分和分隔符为0，内容部分为1
     sft_mask = [0] * len(title_tokens) + [0] * len(sep_token) + [1] * len(content_tokens)
     
-    # 如果长度不足max_length，用pad填充
-    while len(x) < max_length:
-        x.append(vocab["<pad>"])
-        y.append(vocab["<pad>"])
-        sft_mask.append(0)  # pad部分不参与loss计算
-    
+    # 不在这里补齐到max_length，由pad_batch补齐到batch内最长的样本
     return x, y, sft_mask
 
-# 建立数据集
-def build_dataset(sample_length, vocab, max_length, corpus):
-    dataset_x = []
-    dataset_y = []
-    dataset_sft_mask = []
-    
-    for i in range(sample_length):
-        x, y, sft_mask = build_sample(vocab, max_length, corpus)
-        dataset_x.append(x)
-        dataset_y.append(y)
-        dataset_sft_mask.append(sft_mask)
-    
+# 把一组样本补齐到其中最长样本的长度（动态padding），pad部分不参与loss计算
+def pad_batch(samples, pad_id):
+    batch_len = max(len(x) for x, _, _ in samples)
+    dataset_x = [x + [pad_id] * (batch_len - len(x)) for x, _, _ in samples]
+    dataset_y = [y + [pad_id] * (batch_len - len(y)) for _, y, _ in samples]
+    dataset_sft_mask = [m + [0] * (batch_len - len(m)) for _, _, m in samples]
     return (
         torch.LongTensor(dataset_x), 
         torch.LongTensor(dataset_y), 
         torch.LongTensor(dataset_sft_mask)
     )
 
+# 按长度分桶：每bucket_size个样本按长度排序后切分成batch，再打乱batch顺序，减少batch内的padding
+def bucket_batches(samples, batch_size, bucket_size=100):
+    batches = []
+    for start in range(0, len(samples), bucket_size):
+        bucket = sorted(samples[start:start + bucket_size], key=lambda sample: len(sample[0]))
+        batches.extend(bucket[i:i + batch_size] for i in range(0, len(bucket), batch_size))
+    random.shuffle(batches)
+    return batches
+
 # 建立模型
 def build_model(vocab, bert_model_path="E:\\BaiduNetdiskDownload\\第六周 语言模型\\bert-base-chinese"):
     model = LanguageModel(len(vocab), bert_model_path)
@@ -165,128 +165,76 @@ def create_sft_causal_mask(batch_size, seq_len, title_len, device):
     - s1 x s2: 全为0（标题对内容不可见）
     - s2 x s1: 全为1（内容对标题可见）
     - s2 x s2: 因果掩码（下三角矩阵，内容内部遵循因果关系）
+    这等价于以标题为前缀的前缀语言模型掩码：位置i能看到位置j当且仅当 j < title_len 或 j <= i
+    掩码按(title_len, seq_len, device)缓存，batch维度用expand，不再每次重新构造
     """
-    mask = torch.zeros((seq_len, seq_len), device=device)
-    
     # 确保title_len不超过seq_len
     title_len = min(title_len, seq_len)
-    
-    # s1部分索引: [0, title_len)
-    # [SEP]标记: [title_len, title_len+1) - 如果存在
-    # s2部分索引: [title_len+1, seq_len) - 如果存在
-    
-    if title_len > 0:
-        # s1 x s1: 全为1 (标题内部互相可见)
-        mask[:title_len, :title_len] = 1
-    
-    # s1 x s2: 全为0 (标题对内容不可见)
-    # 已经初始化为0，无需操作
-    
-    # [SEP] x all: 全为1 ([SEP]可以看到标题和自己) - 如果[SEP]存在且在范围内
-    if title_len < seq_len:
-        mask[title_len, :title_len+1] = 1  # [SEP]可以看到自己和标题
-    
-    # s2 x s1: 全为1 (内容对标题可见) - 如果内容部分存在
-    if title_len + 1 < seq_len:
-        mask[title_len+1:, :title_len+1] = 1  # 内容可以看到标题和[SEP]
-    
-    # s2 x s2: 因果掩码（下三角矩阵）- 如果内容部分存在
-    s2_start = title_len + 1  # 从标题后一位开始（跳过[SEP]）
-    s2_end = seq_len
-    s2_len = s2_end - s2_start
-    
-    if s2_len > 0:
-        s2_causal_mask = torch.tril(torch.ones((s2_len, s2_len), device=device))
-        mask[s2_start:s2_end, s2_start:s2_end] = s2_causal_mask
-    
-    # 扩展到batch维度
-    mask = mask.unsqueeze(0).expand(batch_size, -1, -1)
-    mask = mask.float()
-    return mask
+    mask = cached_prefix_lm_mask(title_len, seq_len - title_len, device)
+    return mask.expand(batch_size, -1, -1)
 
 # 文本生成测试代码
 def generate_sentence(openings, model, vocab, max_length=128):
+    return generate_batch([openings], model, vocab, max_length)[0]
+
+# 批量生成：多个标题左侧补齐后一起送入模型，每步对整个batch采样一次，每个样本独立判断是否结束
+def generate_batch(openings_list, model, vocab, max_length=128,
+                   temperature=1.2, top_p=0.85, top_k=50, repetition_penalty=1.0):
     reverse_vocab = dict((y, x) for x, y in vocab.items())
+    pad_id = vocab["<pad>"]
+    device = next(model.parameters()).device
+    newline_ids = torch.LongTensor([vocab[char] for char in ["\n"] if char in vocab]).to(device)
+    punctuation_ids = torch.LongTensor([vocab[char] for char in ["。", "！", "?"] if char in vocab]).to(device)
     model.eval()
     with torch.no_grad():
-        generated = openings
-        pred_char = ""
-        # 生成文本直到达到最大长度或生成换行符
-        while len(generated) < max_length:
-            # 取输入
-            input_text = generated[-max_length:]  # 限制输入长度
-            x = [vocab.get(char, vocab["<unk>"]) for char in input_text]
-            
-            # 确保输入长度为实际长度，不填充到max_length
-            actual_len = len(x)
-            x_tensor = torch.LongTensor([x])
-            if torch.cuda.is_available():
-                x_tensor = x_tensor.cuda()
-            
-            # 创建SFT因果掩码 - 使用实际序列长度和标题长度
-            title_len = len(openings)  # 假设开头部分为标题
-            # 确保title_len不超过actual_len
-            title_len = min(title_len, actual_len)
-            causal_mask = create_sft_causal_mask(1, actual_len, title_len, x_tensor.device)
-            
-            # 获取模型输出
-            outputs = model.bert(x_tensor, attention_mask=causal_mask)
+        generated = list(openings_list)
+        sequences = [[vocab.get(char, vocab["<unk>"]) for char in text] for text in generated]
+        finished = torch.BoolTensor([len(text) >= max_length for text in generated]).to(device)
+        while not finished.all():
+            x, attention_mask, position_ids = pad_generation_batch(sequences, [len(text) for text in openings_list],
+                                                                   pad_id, device)
+            outputs = model.bert(x, attention_mask=attention_mask, position_ids=position_ids)
             if isinstance(outputs, tuple):
                 sequence_output = outputs[0]
             else:
                 sequence_output = outputs.last_hidden_state
-            y_pred = model.classify(sequence_output)
-            
-            # 取最后一个位置的预测结果
-            y = y_pred[0][-1]
-            # 应用softmax确保概率分布非负
-            y = torch.softmax(y, dim=-1)
-            
-            # 更激进的采样策略，增加随机性
-            index = sampling_strategy(y, temperature=1.2, top_p=0.85, top_k=50)
-            pred_char = reverse_vocab[index]
-            
-            # 如果生成了换行符或特殊结束符，停止生成
-            if pred_char == "\n" or pred_char in ["。", "！", "?"] and len(generated) > len(openings) + 20:
-                break  # 生成标点符号且长度足够时停止
-                
-            generated += pred_char
-    
+            # 左侧补齐后，每个样本的最后一个位置都是最后一个字
+            logits = model.classify(sequence_output[:, -1])
+            next_ids = sample(logits, temperature=temperature, top_k=top_k, top_p=top_p,
+                              repetition_penalty=repetition_penalty,
+                              prev_ids=x if repetition_penalty != 1.0 else None, pad_id=pad_id)
+
+            # 生成换行符，或生成标点符号且长度足够时停止，停止符不加入结果
+            lengths = torch.LongTensor([len(text) for text in generated]).to(device)
+            opening_lengths = torch.LongTensor([len(text) for text in openings_list]).to(device)
+            stop = torch.isin(next_ids, newline_ids)
+            stop |= torch.isin(next_ids, punctuation_ids) & (lengths > opening_lengths + 20)
+            for row in (~finished & ~stop).nonzero(as_tuple=True)[0].tolist():
+                index = int(next_ids[row])
+                generated[row] += reverse_vocab[index]
+                sequences[row].append(index)
+            finished |= stop | (lengths + 1 >= max_length)
+
     return generated
 
+# 左侧补齐一个batch的序列，返回输入、每个样本各自的SFT掩码以及位置编号（从每个样本的第一个字开始）
+def pad_generation_batch(sequences, title_lens, pad_id, device):
+    seq_len = max(len(sequence) for sequence in sequences)
+    x = torch.full((len(sequences), seq_len), pad_id, dtype=torch.long, device=device)
+    pad_lens = torch.LongTensor([seq_len - len(sequence) for sequence in sequences]).to(device)
+    title_lens = torch.LongTensor([min(title_len, len(sequence)) for sequence, title_len in zip(sequences, title_lens)]).to(device)
+    for row, sequence in enumerate(sequences):
+        x[row, seq_len - len(sequence):] = torch.LongTensor(sequence).to(device)
+    # 左侧补齐后，前缀范围为[pad_len, pad_len + title_len)，padding位置对所有位置不可见
+    key_valid = torch.arange(seq_len, device=device).unsqueeze(0) >= pad_lens.unsqueeze(1)
+    attention_mask = apply_padding_mask(prefix_lm_mask(pad_lens + title_lens, seq_len, device), key_valid)
+    position_ids = (torch.cumsum(key_valid.long(), dim=1) - 1).clamp(min=0)
+    return x, attention_mask, position_ids
+
+# 对单个概率分布采样，保留原来的调用方式
 def sampling_strategy(prob_distribution, temperature=1.0, top_p=0.9, top_k=0):
-    # 应用温度调整
-    prob_distribution = torch.pow(prob_distribution, 1.0 / temperature)
-    
-    # 确保概率分布中的值非负
-    prob_distribution = torch.clamp(prob_distribution, min=0.0)
-    # 确保概率和为1
-    prob_distribution = prob_distribution / prob_distribution.sum()
-    
-    # Top-k 采样
-    if top_k > 0:
-        top_k = min(top_k, prob_distribution.size(-1))
-        indices_to_remove = prob_distribution < torch.topk(prob_distribution, top_k)[0][..., -1, None]
-        prob_distribution[indices_to_remove] = 0
-        prob_distribution = prob_distribution / prob_distribution.sum()
-    
-    # Top-p (nucleus) 采样
-    if top_p < 1.0:
-        sorted_probs, sorted_indices = torch.sort(prob_distribution, descending=True)
-        cumulative_probs = torch.cumsum(sorted_probs, dim=-1)
-        
-        # 只保留累积概率小于top_p的token
-        sorted_indices_to_remove = cumulative_probs > top_p
-        sorted_indices_to_remove[1:] = sorted_indices_to_remove[:-1].clone()
-        sorted_indices_to_remove[0] = False
-        
-        indices_to_remove = sorted_indices[sorted_indices_to_remove]
-        prob_distribution[indices_to_remove] = 0
-        prob_distribution = prob_distribution / prob_distribution.sum()
-    
-    # 随机采样
-    prob_distribution = prob_distribution.cpu().numpy()
-    return np.random.choice(list(range(len(prob_distribution))), p=prob_distribution)
+    logits = torch.log(prob_distribution).unsqueeze(0)
+    return int(sample(logits, temperature=temperature, top_k=top_k, top_p=top_p)[0])
 
 # 计算文本ppl
 def calc_perplexity(sentence, model, vocab, max_length=128):
@@ -351,29 +299,21 @@ def train(corpus_path, save_weight=True):
     for epoch in range(epoch_num):
         model.train()
         watch_loss = []
-        for batch in range(int(train_sample / batch_size)):
-            x, y, sft_mask = build_dataset(batch_size, vocab, max_length, corpus)  # 构建一组训练样本
+        # 每轮先采样全部训练样本，按长度分桶后组成batch
+        samples = [build_sample(vocab, max_length, corpus) for i in range(train_sample)]
+        for batch_samples in bucket_batches(samples, batch_size):
+            x, y, sft_mask = pad_batch(batch_samples, vocab["<pad>"])  # 构建一组训练样本
             if torch.cuda.is_available():
                 x, y, sft_mask = x.cuda(), y.cuda(), sft_mask.cuda()
             
-            # 创建SFT因果掩码 - 需要动态确定标题长度
-            batch_masks = []
-            for i in range(batch_size):
-                # 找到[SEP]标记的位置，如果没有，则使用标题的固定长度
-                sep_token_id = vocab.get("[SEP]", -1)
-                if sep_token_id != -1:
-                    sep_pos = (x[i] == sep_token_id).nonzero(as_tuple=True)[0]
-                    if len(sep_pos) > 0:
-                        title_len = sep_pos[0].item()
-                    else:
-                        title_len = min(10, x.size(1)//3)  # 假设标题长度不超过总长度的1/3
-                else:
-                    title_len = min(10, x.size(1)//3)  # 默认标题长度
-                    
-                mask = create_sft_causal_mask(1, x.size(1), title_len, x.device)[0]  # 取单个mask
-                batch_masks.append(mask)
-            
-            causal_mask = torch.stack(batch_masks, dim=0)
+            # 创建SFT因果掩码 - 每个样本的标题长度为第一个[SEP]的位置，整个batch一次构造
+            # 没有[SEP]时使用标题的固定长度（假设标题长度不超过总长度的1/3）
+            title_lens = torch.full((x.size(0),), min(10, x.size(1)//3), dtype=torch.long, device=x.device)
+            sep_token_id = vocab.get("[SEP]", -1)
+            if sep_token_id != -1:
+                is_sep = x == sep_token_id
+                title_lens = torch.where(is_sep.any(dim=1), is_sep.int().argmax(dim=1), title_lens)
+            causal_mask = prefix_lm_mask(title_lens, x.size(1), x.device)
             
             optim.zero_grad()  # 梯度归零
             loss = model(x, y, attention_mask=causal_mask, sft_mask=sft_mask)  # 计算loss，使用SFT mask
@@ -397,8 +337,7 @@ def train(corpus_path, save_weight=True):
                 "国际通用航空大会沈阳飞行家表演队一飞机发生坠机，伤亡不明",
                 "6月1日起北京实施“史上最严控烟期”"
             ]
-            for title in test_titles:
-                generated = generate_sentence(title, model, vocab, max_length)
+            for title, generated in zip(test_titles, generate_batch(test_titles, model, vocab, max_length)):
                 print(f"输入标题: {title}")
                 print(f"生成内容: {generated[len(title):]}")
                 print("-" * 50)
@@ -1,5 +1,9 @@
 # encoding: utf-8
 import os
+import heapq
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 
 
 # ==================== BPE核心函数 ====================
@@ -25,6 +29,71 @@ def merge(ids, pair, idx):
     return newids
 
 
+def build_pair_index(ids):
+    """统计字节对频率，同时记录每个字节对出现的位置（左边字节的下标）"""
+    counts = {}
+    positions = {}
+    for i, pair in enumerate(zip(ids, ids[1:])):
+        counts[pair] = counts.get(pair, 0) + 1
+        positions.setdefault(pair, []).append(i)
+    return counts, positions
+
+
+def merge_incremental(ids, prev, nxt, pair, idx, counts, positions, heap):
+    """
+    在双向链表上合并字节对，只更新被合并位置左右相邻的字节对计数
+    ids中被合并掉的位置置为None，prev/nxt为每个位置前后相邻的有效位置（-1表示没有）
+    """
+    changed = set()
+    merged = 0
+
+    def update(p, delta, pos=None):
+        counts[p] = counts.get(p, 0) + delta
+        changed.add(p)
+        if pos is not None:
+            positions.setdefault(p, []).append(pos)
+
+    # 按位置从左到右合并，与merge的结果一致（如(a, a)在aaa中只合并前两个）
+    for i in sorted(set(positions.pop(pair, []))):
+        j = nxt[i]
+        # 位置记录可能已经失效（该位置已被合并或已变成别的字节对），跳过
+        if ids[i] != pair[0] or j == -1 or ids[j] != pair[1]:
+            continue
+        left, right = prev[i], nxt[j]
+        if left != -1:
+            update((ids[left], ids[i]), -1)
+            update((ids[left], idx), 1, left)
+        if right != -1:
+            update((ids[j], ids[right]), -1)
+            update((idx, ids[right]), 1, i)
+        ids[i] = idx
+        ids[j] = None
+        nxt[i] = right
+        if right != -1:
+            prev[right] = i
+        merged += 1
+    counts.pop(pair, None)
+    changed.discard(pair)
+
+    # 计数变化的字节对重新入堆，堆中的旧条目在弹出时按计数不一致丢弃
+    for p in changed:
+        if counts.get(p, 0) > 0:
+            heapq.heappush(heap, (-counts[p], p))
+        else:
+            counts.pop(p, None)
+            positions.pop(p, None)
+    return merged
+
+
+def pop_best_pair(counts, heap):
+    """从堆中取出当前频率最高的字节对，频率相同时取编号最小的字节对"""
+    while heap:
+        neg_count, pair = heapq.heappop(heap)
+        if counts.get(pair, 0) == -neg_count:
+            return pair
+    return None
+
+
 # ==================== 编码函数 ====================
 def encode_text(text, vocab_size=276, verbose=True):
     """
@@ -44,15 +113,21 @@ def encode_text(text, vocab_size=276, verbose=True):
     print(f"计划合并次数: {num_merges}")
     print("-" * 60)
 
+    # 字节对计数和出现位置只统计一次，之后每次合并只更新受影响的相邻位置
+    counts, positions = build_pair_index(ids)
+    heap = [(-count, pair) for pair, count in counts.items()]
+    heapq.heapify(heap)
+    prev = list(range(-1, len(ids) - 1))
+    nxt = list(range(1, len(ids))) + [-1]
+    seq_len = len(ids)
+
     for i in range(num_merges):
-        stats = get_stats(ids)
-        if not stats:  # 如果没有更多可合并的字节对
+        pair = pop_best_pair(counts, heap)
+        if pair is None:  # 如果没有更多可合并的字节对
             if verbose:
                 print(f"\n提前停止：没有更多可合并的字节对（已完成 {i} 次合并）")
             break
 
-        # 找出最高频的字节对
-        pair = max(stats, key=stats.get)
         idx = 256 + i
 
         # 显示合并信息
@@ -67,17 +142,19 @@ def encode_text(text, vocab_size=276, verbose=True):
                     return f"\\x{b:02x}"
 
             pair_str = f"({pair[0]}, {pair[1]})"
-            freq = stats[pair]
+            freq = counts[pair]
 
             print(f"merging {pair_str} into a new token {idx} 出现次数: {freq}")
 
         # 执行合并
-        ids = merge(ids, pair, idx)
+        seq_len -= merge_incremental(ids, prev, nxt, pair, idx, counts, positions, heap)
         merges[pair] = idx
 
         # 每10次合并显示一次进度
         if verbose and (i + 1) % 10 == 0:
-            print(f"  [进度: {i + 1}/{num_merges}] 当前序列长度: {len(ids)}")
+            print(f"  [进度: {i + 1}/{num_merges}] 当前序列长度: {seq_len}")
+
+    ids = [t for t in ids if t is not None]
 
     if verbose:
         print("-" * 60)
@@ -130,11 +207,119 @@ def decode_ids(ids, vocab):
     return text
 
 
+# ==================== 批量/文件编码函数 ====================
+def apply_merges(ids, merges):
+    """
+    用训练好的合并规则编码字节序列：每次合并编号最小（最早学到）的相邻字节对
+    双向链表 + 堆，复杂度O(n log n)，结果与按顺序逐条merge一致
+    """
+    ids = list(ids)
+    prev = list(range(-1, len(ids) - 1))
+    nxt = list(range(1, len(ids))) + [-1]
+    heap = [(merges[pair], i) for i, pair in enumerate(zip(ids, ids[1:])) if pair in merges]
+    heapq.heapify(heap)
+    while heap:
+        idx, i = heapq.heappop(heap)
+        j = nxt[i]
+        # 过期条目（位置已被合并或字节对已变化）直接跳过
+        if ids[i] is None or j == -1 or merges.get((ids[i], ids[j])) != idx:
+            continue
+        ids[i] = idx
+        ids[j] = None
+        nxt[i] = nxt[j]
+        if nxt[i] != -1:
+            prev[nxt[i]] = i
+        if prev[i] != -1 and (ids[prev[i]], idx) in merges:
+            heapq.heappush(heap, (merges[(ids[prev[i]], idx)], prev[i]))
+        if nxt[i] != -1 and (idx, ids[nxt[i]]) in merges:
+            heapq.heappush(heap, (merges[(idx, ids[nxt[i]])], i))
+    return [t for t in ids if t is not None]
+
+
+# 每个工作进程只在启动时接收一次合并规则
+_worker_merges = None
+
+
+def _init_worker(merges):
+    global _worker_merges
+    _worker_merges = merges
+
+
+def _encode_worker(data, typecode):
+    return array(typecode, apply_merges(data, _worker_merges))
+
+
+def id_typecode(merges):
+    """词汇表不超过65536时用uint16保存ID，否则用uint32"""
+    return "H" if 256 + len(merges) <= 1 << 16 else "I"
+
+
+def encode_batch(texts, merges, num_workers=0):
+    """批量编码多段文本，num_workers > 1 时使用进程池，返回顺序与输入一致"""
+    data = [text.encode("utf-8") for text in texts]
+    if num_workers <= 1:
+        return [apply_merges(d, merges) for d in data]
+    typecode = id_typecode(merges)
+    with ProcessPoolExecutor(num_workers, initializer=_init_worker, initargs=(merges,)) as pool:
+        return [ids.tolist() for ids in pool.map(_encode_worker, data, [typecode] * len(data), chunksize=16)]
+
+
+def iter_byte_blocks(input_file, block_size=1 << 20):
+    """按块流式读取文件字节，每块在换行处截断，剩余部分并入下一块"""
+    rest = b""
+    with open(input_file, "rb") as f:
+        while True:
+            data = f.read(block_size)
+            if not data:
+                break
+            data = rest + data
+            cut = data.rfind(b"\n") + 1
+            if cut == 0:
+                rest = data
+                continue
+            yield data[:cut]
+            rest = data[cut:]
+    if rest:
+        yield rest
+
+
+def encode_file(input_file, output_file, merges, num_workers=0, block_size=1 << 20):
+    """
+    流式编码大文件：按块读取（块边界在换行处），交给进程池编码，ID按顺序直接写入二进制文件
+    文件为uint16/uint32的连续数组，可用numpy.memmap读取；返回写入的ID数量
+    注意：合并不会跨越块边界，块边界处的结果可能与整体编码略有不同
+    """
+    typecode = id_typecode(merges)
+    total = 0
+    with open(output_file, "wb") as out:
+        if num_workers <= 1:
+            for block in iter_byte_blocks(input_file, block_size):
+                ids = array(typecode, apply_merges(block, merges))
+                ids.tofile(out)
+                total += len(ids)
+            return total
+        with ProcessPoolExecutor(num_workers, initializer=_init_worker, initargs=(merges,)) as pool:
+            pending = deque()
+            for block in iter_byte_blocks(input_file, block_size):
+                pending.append(pool.submit(_encode_worker, block, typecode))
+                # 限制在途的块数，按提交顺序写出
+                while len(pending) >= 2 * num_workers:
+                    ids = pending.popleft().result()
+                    ids.tofile(out)
+                    total += len(ids)
+            while pending:
+                ids = pending.popleft().result()
+                ids.tofile(out)
+                total += len(ids)
+    return total
+
+
 # ==================== 独立入口函数 - 编码（含BPE训练） ====================
-def encode_main(input_file="corpus.txt", vocab_size=276):
+def encode_main(input_file="corpus.txt", vocab_size=276, num_workers=0):
     """
     【编码专用入口】处理文件：训练BPE、编码文本、保存编码结果和词汇表
-    生成文件：corpus_encoded.txt / bpe_vocabulary.txt
+    生成文件：corpus_encoded.txt / corpus_encoded.bin / bpe_vocabulary.txt
+    num_workers: 生成二进制编码文件时使用的进程数（0表示单进程）
     """
     # 检查文件是否存在
     if not os.path.exists(input_file):
@@ -177,6 +362,11 @@ def encode_main(input_file="corpus.txt", vocab_size=276):
 
     print(f"\n编码结果已保存到: {encoded_file}")
 
+    # 4.1 流式编码整个文件，保存为二进制ID文件（uint16/uint32，可直接memmap用于训练）
+    binary_file = "corpus_encoded.bin"
+    total = encode_file(input_file, binary_file, merges, num_workers)
+    print(f"二进制编码结果已保存到: {binary_file} (共 {total} 个ID, 类型: {'uint16' if id_typecode(merges) == 'H' else 'uint32'})")
+
     # 5. 创建词汇表
     vocab = create_vocab(merges, verbose=True)
 